@@ -2,8 +2,9 @@ from fastapi import FastAPI, HTTPException, UploadFile, File, Form, BackgroundTa
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Literal
 from orchestrator import HybridOrchestrator
+from errors import ProviderUnavailableError, DeadlineExceededError
 import uuid
 import json
 import os
@@ -13,9 +14,40 @@ import io
 from datasets import load_dataset
 import asyncio
 import base64
-
-
-app = FastAPI(title="LLM-SLM Router API", version="1.0.0")
+from contextlib import asynccontextmanager
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup = orchestrator.config.get('warmup', {}) or {}
+    keep_warm_task = None
+    config_watch_task = None
+    knn_maintenance_task = asyncio.create_task(orchestrator.amaintain_knn())
+    semantic_maintenance_task = None
+    if orchestrator.semantic_cache is not None:
+        semantic_maintenance_task = asyncio.create_task(orchestrator.amaintain_semantic_cache())
+    config_reload = orchestrator.config.get('config_reload', {}) or {}
+    if config_reload.get('enabled', True):
+        config_watch_task = asyncio.create_task(orchestrator.config_service.awatch(config_reload.get('poll_interval', 2.0)))
+    if warmup.get('enabled', True):
+        for model_type, replicas in (await orchestrator.awarmup()).items():
+            for endpoint, status in replicas.items():
+                print(f"Warm-up {model_type} {endpoint}: {status}")
+        interval = warmup.get('keep_alive_interval', 0)
+        if interval:
+            keep_warm_task = asyncio.create_task(orchestrator.akeep_warm(interval))
+    yield
+    if keep_warm_task:
+        keep_warm_task.cancel()
+    if config_watch_task:
+        config_watch_task.cancel()
+    knn_maintenance_task.cancel()
+    if semantic_maintenance_task:
+        semantic_maintenance_task.cancel()
+    await orchestrator.aclose()
+
+
+app = FastAPI(title="LLM-SLM Router API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -35,6 +67,8 @@ class QueryRequest(BaseModel):
     prompt: str
     priority: Optional[str] = "balanced"
     use_llm_fallback: Optional[bool] = True
+    timeout: Optional[float] = None
+    cache: Optional[Literal["read_write", "read", "write", "bypass"]] = "read_write"
 
 
 class QueryResponse(BaseModel):
@@ -43,6 +77,22 @@ class QueryResponse(BaseModel):
     decision: dict
     fallback_used: bool
     fallback_reason: Optional[str] = None
+    cache_hit: bool = False
+    cache_age: Optional[float] = None
+    cache_similarity: Optional[float] = None
+    cache_matched_prompt: Optional[str] = None
+    coalesced: bool = False
+
+
+class BanditRequest(BaseModel):
+    enabled: Optional[bool] = None
+    reset: Optional[List[str]] = None
+
+
+class RouteRequest(BaseModel):
+    prompts: List[str]
+    priority: str = "balanced"
+    priorities: Optional[List[str]] = None
 
 
 class DistillRequest(BaseModel):
@@ -58,30 +108,49 @@ class DistillResponse(BaseModel):
     distillation_error: Optional[str] = None
 
 
+def decision_to_dict(decision) -> dict:
+    return {
+        "model_type": decision.model_type,
+        "confidence": decision.confidence,
+        "reason": decision.reason,
+        "estimated_cost": decision.estimated_cost,
+        "estimated_latency": decision.estimated_latency,
+        "config_version": decision.config_version
+    }
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @app.post("/query", response_model=QueryResponse)
 async def query(request: QueryRequest):
     try:
-        result = orchestrator.process(
+        result = await orchestrator.aprocess(
             request.prompt,
             priority=request.priority,
-            use_llm_fallback=request.use_llm_fallback
+            use_llm_fallback=request.use_llm_fallback,
+            timeout=request.timeout,
+            cache=request.cache
         )
         
-        decision_dict = {
-            "model_type": result["decision"].model_type,
-            "confidence": result["decision"].confidence,
-            "reason": result["decision"].reason,
-            "estimated_cost": result["decision"].estimated_cost,
-            "estimated_latency": result["decision"].estimated_latency
-        }
-        
         return QueryResponse(
             response=result["response"],
             model_used=result["model_used"],
-            decision=decision_dict,
+            decision=decision_to_dict(result["decision"]),
             fallback_used=result["fallback_used"],
-            fallback_reason=result.get("fallback_reason")
+            fallback_reason=result.get("fallback_reason"),
+            cache_hit=result.get("cache_hit", False),
+            cache_age=result.get("cache_age"),
+            cache_similarity=result.get("cache_similarity"),
+            cache_matched_prompt=result.get("cache_matched_prompt"),
+            coalesced=result.get("coalesced", False)
         )
+    except ProviderUnavailableError as e:
+        # Queue full (ProviderOverloadedError) or circuit open with nothing to fall back to.
+        raise HTTPException(status_code=503, detail=str(e))
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         import traceback
         error_detail = str(e)
@@ -91,15 +160,67 @@ async def query(request: QueryRequest):
         raise HTTPException(status_code=500, detail=error_detail)
 
 
+@app.post("/query/stream")
+async def query_stream(request: QueryRequest):
+    async def event_stream():
+        try:
+            async for event in orchestrator.astream_process(
+                request.prompt,
+                priority=request.priority,
+                use_llm_fallback=request.use_llm_fallback,
+                timeout=request.timeout,
+                cache=request.cache
+            ):
+                event_type = event.pop("type")
+                if event_type == "decision":
+                    event = {"decision": decision_to_dict(event["decision"])}
+                yield sse_event(event_type, event)
+        except Exception as e:
+            print(f"Error streaming query: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/health")
 async def health():
     return {"status": "healthy"}
 
 
+# A plain def: FastAPI runs it in its threadpool, so a large CPU-bound batch does not stall the event loop.
+@app.post("/route")
+def route(request: RouteRequest):
+    if request.priorities is not None and len(request.priorities) != len(request.prompts):
+        raise HTTPException(status_code=422, detail="priorities must have one entry per prompt")
+    decisions = orchestrator.router.route_many(request.prompts, request.priorities or request.priority)
+    return {"decisions": [decision_to_dict(decision) for decision in decisions]}
+
+
+@app.post("/routing/bandit")
+async def routing_bandit(request: BanditRequest):
+    bandit = orchestrator.router.bandit
+    if bandit is None:
+        raise HTTPException(status_code=404, detail="Bandit routing is not configured (routing.bandit)")
+    if request.enabled is not None:
+        bandit.enabled = request.enabled
+    if request.reset is not None:
+        bandit.reset(request.reset)
+    return bandit.stats()
+
+
+@app.get("/health/providers")
+async def provider_health():
+    return orchestrator.health()
+
+
 @app.post("/distill", response_model=DistillResponse)
 async def distill(request: DistillRequest):
     try:
-        result = orchestrator.distill_and_process(request.prompt)
+        result = await orchestrator.adistill_and_process(request.prompt)
         return DistillResponse(
             response=result["response"],
             model_used=result["model_used"],
@@ -108,6 +229,10 @@ async def distill(request: DistillRequest):
             distillation_used=result["distillation_used"],
             distillation_error=result.get("distillation_error")
         )
+    except ProviderUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         import traceback
         error_detail = str(e)
@@ -123,6 +248,9 @@ async def root():
         "message": "LLM-SLM Router API",
         "endpoints": {
             "/query": "POST - Process a query with intelligent routing",
+            "/query/stream": "POST - Stream routing decision and tokens as Server-Sent Events",
+            "/route": "POST - Routing decisions for a batch of prompts, without calling any model",
+            "/routing/bandit": "POST - Turn bandit routing on or off, or reset what it has learned",
             "/distill": "POST - Distill prompt with SLM then process with LLM",
             "/train": "POST - Start LoRA training job with Google Colab",
             "/train/status/{job_id}": "GET - Get training job status",
@@ -131,7 +259,8 @@ async def root():
             "/train/starcoder/languages": "GET - Get available StarCoder dataset languages",
             "/train/starcoder/download": "POST - Download and convert StarCoder dataset to CSV",
             "/train/starcoder/create": "POST - Create training job directly from StarCoder dataset",
-            "/health": "GET - Health check"
+            "/health": "GET - Health check",
+            "/health/providers": "GET - Circuit breaker, replica and hedging state per provider"
         }
     }
 
@@ -0,0 +1,166 @@
+import bisect
+import hashlib
+import math
+import random
+import threading
+import time
+from collections.abc import Mapping
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+
+class Replica:
+    def __init__(self, url: str, weight: float = 1.0):
+        self.url = url
+        self.weight = max(float(weight), 0.001)
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.total_requests = 0
+        self.total_failures = 0
+
+    def is_available(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+    def load(self) -> float:
+        return (self.outstanding + 1) / self.weight
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "consecutive_failures": self.consecutive_failures,
+            "ejected": self.ejected_until > time.monotonic(),
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures
+        }
+
+
+class ReplicaPool:
+    """Picks one of several endpoints per request and tracks their in-flight load and health."""
+
+    STRATEGIES = ('least_outstanding', 'p2c', 'prefix_affinity')
+
+    def __init__(self, replicas: List[Replica], strategy: str = 'least_outstanding',
+                 eject_after: int = 3, eject_seconds: float = 30.0,
+                 prefix_chars: int = 128, load_factor: float = 1.25, virtual_nodes: int = 100):
+        if not replicas:
+            raise Exception("At least one endpoint must be configured")
+        if strategy not in self.STRATEGIES:
+            raise Exception(f"Unsupported load balancing strategy: {strategy}")
+        self.replicas = replicas
+        self.strategy = strategy
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.prefix_chars = prefix_chars
+        self.load_factor = load_factor
+        self.lock = threading.Lock()
+        self.ring = sorted(
+            (self._hash(f"{replica.url}#{i}"), index)
+            for index, replica in enumerate(replicas)
+            for i in range(max(1, round(virtual_nodes * replica.weight)))
+        )
+        self.ring_hashes = [h for h, _ in self.ring]
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'ReplicaPool':
+        entries = config.get('endpoints') or [config.get('endpoint')]
+        replicas = []
+        for entry in entries:
+            if isinstance(entry, Mapping):
+                replicas.append(Replica(entry['url'], entry.get('weight', 1.0)))
+            elif entry:
+                replicas.append(Replica(entry))
+        balancing = config.get('load_balancing', {}) or {}
+        return cls(
+            replicas,
+            strategy=balancing.get('strategy', 'least_outstanding'),
+            eject_after=balancing.get('eject_after', 3),
+            eject_seconds=balancing.get('eject_seconds', 30.0),
+            prefix_chars=balancing.get('prefix_chars', 128),
+            load_factor=balancing.get('load_factor', 1.25),
+            virtual_nodes=balancing.get('virtual_nodes', 100)
+        )
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def fingerprint(self, prompt: str) -> int:
+        return self._hash(prompt[:self.prefix_chars])
+
+    def _select_affinity(self, candidates: List[Replica], key: str) -> Replica:
+        # Bounded-load consistent hashing: walk the ring from the prefix's
+        # position and take the first replica still under its share of
+        # load_factor * (in-flight + 1).
+        total_outstanding = sum(r.outstanding for r in self.replicas) + 1
+        total_weight = sum(r.weight for r in candidates)
+        start = bisect.bisect(self.ring_hashes, self.fingerprint(key))
+        seen = set()
+        for offset in range(len(self.ring)):
+            index = self.ring[(start + offset) % len(self.ring)][1]
+            if index in seen:
+                continue
+            seen.add(index)
+            replica = self.replicas[index]
+            if replica not in candidates:
+                continue
+            capacity = math.ceil(self.load_factor * total_outstanding * replica.weight / total_weight)
+            if replica.outstanding < capacity:
+                return replica
+            if len(seen) == len(self.replicas):
+                break
+        return min(candidates, key=lambda r: r.load())
+
+    def _candidates(self, exclude: Optional[List[Replica]] = None) -> List[Replica]:
+        now = time.monotonic()
+        pool = [r for r in self.replicas if not exclude or r not in exclude] or self.replicas
+        available = [r for r in pool if r.is_available(now)]
+        if available:
+            return available
+        # Every replica is ejected: probe the one that has been out the longest.
+        return [min(pool, key=lambda r: r.ejected_until)]
+
+    def select(self, exclude: Optional[List[Replica]] = None, key: Optional[str] = None) -> Replica:
+        with self.lock:
+            candidates = self._candidates(exclude)
+            if len(candidates) == 1:
+                return candidates[0]
+            if self.strategy == 'prefix_affinity' and key is not None:
+                return self._select_affinity(candidates, key)
+            if self.strategy == 'p2c':
+                # Two distinct replicas, each drawn in proportion to its weight.
+                first = random.choices(candidates, weights=[r.weight for r in candidates])[0]
+                rest = [r for r in candidates if r is not first]
+                second = random.choices(rest, weights=[r.weight for r in rest])[0]
+                return first if first.load() <= second.load() else second
+            lowest = min(r.load() for r in candidates)
+            return random.choice([r for r in candidates if r.load() == lowest])
+
+    @contextmanager
+    def track(self, replica: Replica):
+        with self.lock:
+            replica.outstanding += 1
+            replica.total_requests += 1
+        try:
+            yield replica
+        finally:
+            with self.lock:
+                replica.outstanding -= 1
+
+    def record_success(self, replica: Replica):
+        with self.lock:
+            replica.consecutive_failures = 0
+            replica.ejected_until = 0.0
+
+    def record_failure(self, replica: Replica):
+        with self.lock:
+            replica.consecutive_failures += 1
+            replica.total_failures += 1
+            if replica.consecutive_failures >= self.eject_after:
+                replica.ejected_until = time.monotonic() + self.eject_seconds
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [r.stats() for r in self.replicas]
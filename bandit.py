@@ -0,0 +1,124 @@
+import math
+import random
+import threading
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+ALGORITHMS = ("thompson", "linucb")
+
+
+class ArmModel:
+    """Ridge regression of reward on context for one arm, with exponential forgetting."""
+
+    def __init__(self, dimensions: int, prior: float):
+        self.prior = prior
+        self.A = np.eye(dimensions) * prior
+        self.b = np.zeros(dimensions)
+        self.pulls = 0
+        self.reward_sum = 0.0
+        self._refresh()
+
+    def _refresh(self):
+        self.A_inv = np.linalg.inv(self.A)
+        self.theta = self.A_inv @ self.b
+
+    def update(self, context: np.ndarray, reward: float, decay: float):
+        # Discounting toward the prior lets an arm's estimate move again after the model behind it changes.
+        self.A = decay * self.A + np.outer(context, context) + (1 - decay) * self.prior * np.eye(len(context))
+        self.b = decay * self.b + reward * context
+        self.pulls += 1
+        self.reward_sum += reward
+        self._refresh()
+
+
+class ContextualBandit:
+    """Chooses among model tiers with linear Thompson sampling or LinUCB.
+
+    Each arm keeps a ridge regression of reward on the request's context
+    vector. Thompson sampling draws weights from the arm's posterior and picks
+    the best draw; LinUCB picks the best upper confidence bound. `exploration`
+    scales the posterior spread (Thompson) or the bound width (LinUCB). On top
+    of that, `explore_rate` of decisions pick a uniformly random arm. With
+    `enabled` false the router ignores the bandit, but it keeps learning from
+    the decisions the rules make.
+    """
+
+    def __init__(self, config: Dict[str, Any], arms: Sequence[str], dimensions: int):
+        self.enabled = config.get('enabled', False)
+        self.algorithm = config.get('algorithm', 'thompson')
+        if self.algorithm not in ALGORITHMS:
+            raise Exception(f"Unsupported bandit algorithm: {self.algorithm}")
+        self.exploration = config.get('exploration', 0.1)
+        self.explore_rate = config.get('explore_rate', 0.05)
+        self.decay = config.get('decay', 0.999)
+        self.prior = config.get('prior', 1.0)
+        reward = config.get('reward', {}) or {}
+        self.quality_weight = reward.get('quality', 1.0)
+        self.latency_weight = reward.get('latency_per_second', 0.05)
+        self.cost_weight = reward.get('cost_per_dollar', 100.0)
+        self.dimensions = dimensions
+        self.arms = {arm: ArmModel(dimensions, self.prior) for arm in arms}
+        self.explored = 0
+        self.rng = random.Random(config.get('seed'))
+        self.np_rng = np.random.default_rng(config.get('seed'))
+        self.lock = threading.Lock()
+
+    def reward(self, quality_ok: bool, latency: float, cost: float) -> float:
+        return self.quality_weight * float(quality_ok) - self.latency_weight * latency - self.cost_weight * cost
+
+    def choose(self, context: np.ndarray, arms: Sequence[str]) -> Tuple[str, float, bool]:
+        """Returns (arm, its score, whether the pick was a random exploration)."""
+        with self.lock:
+            if self.rng.random() < self.explore_rate:
+                self.explored += 1
+                arm = self.rng.choice(list(arms))
+                return arm, float(self.arms[arm].theta @ context), True
+            best_arm, best_score = None, -math.inf
+            for arm in arms:
+                model = self.arms[arm]
+                if self.algorithm == 'thompson':
+                    theta = self.np_rng.multivariate_normal(model.theta, self.exploration ** 2 * model.A_inv, method='cholesky')
+                    score = float(theta @ context)
+                else:
+                    score = float(model.theta @ context) + self.exploration * math.sqrt(float(context @ model.A_inv @ context))
+                if score > best_score:
+                    best_arm, best_score = arm, score
+            return best_arm, best_score, False
+
+    def update(self, arm: str, context: np.ndarray, reward: float):
+        if arm not in self.arms:
+            return
+        with self.lock:
+            self.arms[arm].update(context, reward, self.decay)
+
+    def adopt(self, previous: 'ContextualBandit'):
+        """Carries over what `previous` learned, for arms both bandits have, when the config changes."""
+        with previous.lock:
+            for arm in self.arms:
+                if arm in previous.arms:
+                    self.arms[arm] = previous.arms[arm]
+            self.explored = previous.explored
+
+    def reset(self, arms: Optional[List[str]] = None):
+        """Forgets what was learned about `arms` (all by default), e.g. after a fine-tuned SLM is deployed."""
+        with self.lock:
+            for arm in arms or list(self.arms):
+                if arm in self.arms:
+                    self.arms[arm] = ArmModel(self.dimensions, self.prior)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "algorithm": self.algorithm,
+                "explore_rate": self.explore_rate,
+                "explored": self.explored,
+                "arms": {
+                    arm: {
+                        "pulls": model.pulls,
+                        "mean_reward": round(model.reward_sum / model.pulls, 4) if model.pulls else None
+                    }
+                    for arm, model in self.arms.items()
+                }
+            }
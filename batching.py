@@ -0,0 +1,80 @@
+import asyncio
+from collections import Counter
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Union
+
+from scheduler import PRIORITY_LANES
+
+BatchDispatch = Callable[[List[str], int, str, Optional[float]], Awaitable[List[Union[str, Exception]]]]
+
+
+class MicroBatcher:
+    """Collects concurrent generate calls for a few milliseconds and sends them as one batch.
+
+    A batch is flushed when it reaches `max_batch_size` or `max_wait_ms` after
+    its first request, whichever comes first. Requests with different
+    max_tokens are batched separately. Results, or per-item errors, are handed
+    back to each waiting caller.
+    """
+
+    def __init__(self, config: Dict[str, Any], dispatch: BatchDispatch):
+        self.max_batch_size = config.get('max_batch_size', 8)
+        self.max_wait = config.get('max_wait_ms', 5) / 1000
+        self.dispatch = dispatch
+        self.pending: Dict[int, list] = {}
+        self.timers: Dict[int, asyncio.TimerHandle] = {}
+        self.running = set()
+        self.batch_sizes = Counter()
+
+    async def submit(self, prompt: str, max_tokens: int, priority: str = "balanced",
+                     deadline: Optional[float] = None) -> str:
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        batch = self.pending.setdefault(max_tokens, [])
+        batch.append((prompt, priority, deadline, waiter))
+        if len(batch) >= self.max_batch_size:
+            self._flush(max_tokens)
+        elif len(batch) == 1:
+            self.timers[max_tokens] = loop.call_later(self.max_wait, self._flush, max_tokens)
+        return await waiter
+
+    def _flush(self, max_tokens: int):
+        timer = self.timers.pop(max_tokens, None)
+        if timer is not None:
+            timer.cancel()
+        batch = [item for item in self.pending.pop(max_tokens, []) if not item[3].done()]
+        if not batch:
+            return
+        self.batch_sizes[len(batch)] += 1
+        task = asyncio.ensure_future(self._run(max_tokens, batch))
+        self.running.add(task)
+        task.add_done_callback(self.running.discard)
+
+    async def _run(self, max_tokens: int, batch: list):
+        prompts = [prompt for prompt, _, _, _ in batch]
+        priority = min((p for _, p, _, _ in batch), key=lambda p: PRIORITY_LANES.index(p) if p in PRIORITY_LANES else 1)
+        deadlines = [d for _, _, d, _ in batch]
+        deadline = None if None in deadlines else max(deadlines)
+        try:
+            results = await self.dispatch(prompts, max_tokens, priority, deadline)
+        except Exception as e:
+            for _, _, _, waiter in batch:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        for (_, _, _, waiter), result in zip(batch, results):
+            if waiter.done():
+                continue
+            if isinstance(result, Exception):
+                waiter.set_exception(result)
+            else:
+                waiter.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        batches = sum(self.batch_sizes.values())
+        requests = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "batches": batches,
+            "requests": requests,
+            "mean_batch_size": round(requests / batches, 2) if batches else 0.0,
+            "batch_size_histogram": {str(size): self.batch_sizes[size] for size in sorted(self.batch_sizes)}
+        }
@@ -0,0 +1,50 @@
+import random
+import sys
+import time
+from dataclasses import astuple
+
+from router import ModelRouter
+
+WORDS = (
+    "what is the capital of France how do I explain compare design analyze an algorithm "
+    "architecture for a distributed framework protocol optimization implementation hello "
+    "thanks please write summarize this code data model user request ? ?"
+).split()
+LENGTHS = (3, 8, 20, 60, 150, 400, 900, 1600, 2500)
+PRIORITIES = ("balanced", "speed", "cost")
+
+
+def make_prompts(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    prompts = [" ".join(rng.choice(WORDS) for _ in range(rng.choice(LENGTHS))) for _ in range(n)]
+    priorities = [rng.choice(PRIORITIES) for _ in range(n)]
+    return prompts, priorities
+
+
+def main():
+    config_path = sys.argv[1] if len(sys.argv) > 1 else "config.yaml"
+    router = ModelRouter(config_path)
+    pool, pool_priorities = make_prompts(2000)
+    # Features are the same Python work in both paths, so time them separately.
+    pool = [router.features(prompt) for prompt in pool]
+
+    print(f"{'prompts':>8} {'route (s)':>10} {'route_many (s)':>15} {'speedup':>8}")
+    for n in (1_000, 10_000, 100_000):
+        prompts = [pool[i % len(pool)] for i in range(n)]
+        priorities = [pool_priorities[i % len(pool)] for i in range(n)]
+
+        started = time.perf_counter()
+        expected = [router.route(prompt, priority) for prompt, priority in zip(prompts, priorities)]
+        loop_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        decisions = router.route_many(prompts, priorities)
+        batch_seconds = time.perf_counter() - started
+
+        if any(astuple(a) != astuple(b) for a, b in zip(expected, decisions)):
+            raise SystemExit(f"route_many disagrees with route at {n} prompts")
+        print(f"{n:>8} {loop_seconds:>10.3f} {batch_seconds:>15.3f} {loop_seconds / batch_seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import json
+import sys
+
+import yaml
+
+from knn_router import KnnRouter, cheapest_acceptable
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the kNN routing index from a routing outcome log")
+    parser.add_argument("log", nargs="?", default="routing_outcomes.jsonl")
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    try:
+        with open(args.config, 'r') as f:
+            knn_config = yaml.safe_load(f)['routing'].get('knn') or {}
+        knn = KnnRouter(knn_config)
+        inserted = 0
+        batch_embeddings, batch_labels = [], []
+        with open(args.log, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                label = cheapest_acceptable(record.get('slm_ok'), record.get('model_used'))
+                if label is None or not record.get('prompt'):
+                    continue
+                embedding = knn.embed(record['prompt'])
+                if embedding is None:
+                    raise Exception("The configured embedder failed; check routing.knn.embedder")
+                batch_embeddings.append(embedding)
+                batch_labels.append(label)
+                if len(batch_labels) >= args.batch_size:
+                    knn.insert_many(batch_embeddings, batch_labels)
+                    inserted += len(batch_labels)
+                    batch_embeddings, batch_labels = [], []
+        if batch_labels:
+            knn.insert_many(batch_embeddings, batch_labels)
+            inserted += len(batch_labels)
+        if knn.index is None:
+            raise Exception("No labelled records: the log has no requests that the SLM answered")
+        # Inserts never train the clusters; do it once everything is in.
+        if knn.index.size > knn.index.approximate_above:
+            knn.index.retrain()
+        knn.index.save(knn.path)
+    except Exception as e:
+        print(f"Error building kNN index: {str(e)}")
+        sys.exit(1)
+
+    print(f"Inserted {inserted} prompts; {knn.path} now holds {knn.index.size} in {knn.index.clusters} clusters")
+
+
+if __name__ == "__main__":
+    main()
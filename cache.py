@@ -0,0 +1,365 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple, List
+
+CACHE_MODES = ("read_write", "read", "write", "bypass")
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", prompt).split())
+
+
+def cache_key(prompt: str, model_type: str, model_name: str, params: Dict[str, Any]) -> str:
+    """SHA-256 of the normalized prompt, routed tier, model name and generation parameters, as sorted JSON."""
+    payload = json.dumps(
+        [normalize_prompt(prompt), model_type, model_name, params],
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def can_read(mode: Optional[str]) -> bool:
+    return (mode or "read_write") in ("read_write", "read")
+
+
+def can_write(mode: Optional[str]) -> bool:
+    return (mode or "read_write") in ("read_write", "write")
+
+
+class ResponseCache:
+    """Interface consulted by HybridOrchestrator: get returns (value, age in seconds) or None.
+
+    The async paths call `aget`/`aset`; caches that do blocking I/O override
+    them to keep it off the event loop.
+    """
+
+    def get(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Dict[str, Any]):
+        raise NotImplementedError
+
+    async def aget(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        return self.get(key)
+
+    async def aset(self, key: str, value: Dict[str, Any]):
+        self.set(key, value)
+
+    def clear(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoryCache(ResponseCache):
+    """In-process LRU with TTL expiry and caps on entry count and total bytes."""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.ttl = config.get('ttl_seconds', 3600)
+        self.max_entries = config.get('max_entries', 10000)
+        self.max_bytes = config.get('max_bytes', 64 * 1024 * 1024)
+        self.entries: 'OrderedDict[str, Tuple[Dict[str, Any], float, int]]' = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, created_at, size = entry
+            age = time.time() - created_at
+            if self.ttl and age > self.ttl:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value, age
+
+    def set(self, key: str, value: Dict[str, Any], created_at: Optional[float] = None):
+        size = len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, created_at or time.time(), size)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        _, _, size = self.entries.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+class DiskCache(ResponseCache):
+    """SQLite-backed cache in WAL mode, shared by every worker process on the host.
+
+    Entries larger than `compress_min_bytes` are stored zlib-compressed. Entry
+    count and stored bytes are kept in a one-row `meta` table by triggers, so
+    every worker sees the same totals without scanning. Every `evict_every`
+    writes, expired entries are deleted and, when the file holds more than
+    `max_entries` entries or `max_bytes` of stored data, the least recently
+    read entries too. `aget`/`aset` run the SQLite calls in the default executor.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.path = config.get('path', 'response_cache.db')
+        self.ttl = config.get('ttl_seconds', 3600)
+        self.max_entries = config.get('max_entries', 100000)
+        self.max_bytes = config.get('max_bytes', 512 * 1024 * 1024)
+        self.compress_min_bytes = config.get('compress_min_bytes', 1024)
+        self.compress_level = config.get('compress_level', 6)
+        self.evict_every = config.get('evict_every', 100)
+        self.writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, timeout=config.get('busy_timeout', 5.0),
+                                    check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, compressed INTEGER NOT NULL, "
+            "size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_created_at ON entries (created_at)")
+        # INSERT OR REPLACE fires the delete trigger for the replaced row only with recursive triggers on.
+        self.conn.execute("PRAGMA recursive_triggers=ON")
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta ("
+                "id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER NOT NULL, bytes INTEGER NOT NULL)"
+            )
+            # Files written before the meta table existed are counted once here.
+            self.conn.execute(
+                "INSERT OR IGNORE INTO meta (id, entries, bytes) "
+                "SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            )
+            self.conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN "
+                "UPDATE meta SET entries = entries + 1, bytes = bytes + NEW.size WHERE id = 0; END"
+            )
+            self.conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN "
+                "UPDATE meta SET entries = entries - 1, bytes = bytes - OLD.size WHERE id = 0; END"
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _encode(self, value: Dict[str, Any]) -> Tuple[bytes, int]:
+        data = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        if len(data) >= self.compress_min_bytes:
+            return zlib.compress(data, self.compress_level), 1
+        return data, 0
+
+    def _decode(self, data: bytes, compressed: int) -> Dict[str, Any]:
+        if compressed:
+            data = zlib.decompress(data)
+        return json.loads(data.decode('utf-8'))
+
+    def get(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, compressed, created_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            data, compressed, created_at = row
+            age = now - created_at
+            if self.ttl and age > self.ttl:
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return self._decode(data, compressed), age
+
+    def set(self, key: str, value: Dict[str, Any], created_at: Optional[float] = None):
+        data, compressed = self._encode(value)
+        if len(data) > self.max_bytes:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, compressed, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(data), compressed, len(data), created_at or now, now)
+            )
+            self.writes += 1
+            if self.writes % self.evict_every == 0:
+                self._evict(now)
+
+    async def aget(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, key)
+
+    async def aset(self, key: str, value: Dict[str, Any], created_at: Optional[float] = None):
+        await asyncio.get_running_loop().run_in_executor(None, self.set, key, value, created_at)
+
+    def _totals(self) -> Tuple[int, int]:
+        return self.conn.execute("SELECT entries, bytes FROM meta WHERE id = 0").fetchone()
+
+    def _evict(self, now: float):
+        if self.ttl:
+            self.evictions += self.conn.execute(
+                "DELETE FROM entries WHERE created_at < ?", (now - self.ttl,)
+            ).rowcount
+        count, total = self._totals()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # Trim a little below the limits so eviction does not run on every write.
+        target_count = int(self.max_entries * 0.9)
+        target_bytes = int(self.max_bytes * 0.9)
+        removed = []
+        for key, size in self.conn.execute("SELECT key, size FROM entries ORDER BY accessed_at"):
+            if count <= target_count and total <= target_bytes:
+                break
+            removed.append((key,))
+            count -= 1
+            total -= size
+        self.conn.executemany("DELETE FROM entries WHERE key = ?", removed)
+        self.evictions += len(removed)
+
+    def recent(self, limit: int) -> List[Tuple[str, Dict[str, Any], float]]:
+        """Most recently read unexpired entries as (key, value, created_at), newest first."""
+        oldest = time.time() - self.ttl if self.ttl else 0.0
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT key, value, compressed, created_at FROM entries WHERE created_at >= ? "
+                "ORDER BY accessed_at DESC LIMIT ?", (oldest, limit)
+            ).fetchall()
+        return [(key, self._decode(data, compressed), created_at) for key, data, compressed, created_at in rows]
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM entries")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            count, total = self._totals()
+        return {
+            "path": self.path,
+            "entries": count,
+            "bytes": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+class TieredCache(ResponseCache):
+    """Memory tier in front of a disk tier.
+
+    Reads try memory first and promote disk hits into memory; writes go to
+    both. With `warm_entries` set, the memory tier is filled from the most
+    recently read disk entries on startup.
+    """
+
+    def __init__(self, memory: MemoryCache, disk: DiskCache, warm_entries: int = 0):
+        self.memory = memory
+        self.disk = disk
+        self.warmed = 0
+        if warm_entries:
+            for key, value, created_at in reversed(disk.recent(warm_entries)):
+                memory.set(key, value, created_at)
+                self.warmed += 1
+
+    def get(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        cached = self.memory.get(key)
+        if cached is not None:
+            return cached
+        cached = self.disk.get(key)
+        if cached is not None:
+            value, age = cached
+            self.memory.set(key, value, time.time() - age)
+        return cached
+
+    def set(self, key: str, value: Dict[str, Any], created_at: Optional[float] = None):
+        self.memory.set(key, value, created_at)
+        self.disk.set(key, value, created_at)
+
+    async def aget(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        cached = self.memory.get(key)
+        if cached is not None:
+            return cached
+        cached = await self.disk.aget(key)
+        if cached is not None:
+            value, age = cached
+            self.memory.set(key, value, time.time() - age)
+        return cached
+
+    async def aset(self, key: str, value: Dict[str, Any], created_at: Optional[float] = None):
+        self.memory.set(key, value, created_at)
+        await self.disk.aset(key, value, created_at)
+
+    def clear(self):
+        self.memory.clear()
+        self.disk.clear()
+
+    def close(self):
+        self.disk.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"memory": self.memory.stats(), "disk": self.disk.stats(), "warmed": self.warmed}
+
+
+def build_cache(config: Dict[str, Any]) -> Optional[ResponseCache]:
+    """Builds the cache named by `backend` ("memory", "disk" or "tiered") from the `cache` config block."""
+    if not config.get('enabled'):
+        return None
+    backend = config.get('backend', 'memory')
+    if backend == 'memory':
+        return MemoryCache(config)
+    disk = DiskCache({**config, **(config.get('disk') or {})})
+    if backend == 'disk':
+        return disk
+    if backend == 'tiered':
+        return TieredCache(MemoryCache(config), disk, config.get('warm_entries', 0))
+    raise Exception(f"Unsupported cache backend: {backend}")
@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker fed by call outcomes and latencies.
+
+    The breaker opens when, over the last `window` calls (and at least
+    `min_requests`), the failure rate reaches `failure_rate` or the share of
+    calls slower than `slow_call_seconds` reaches `slow_call_rate`. While open,
+    calls are rejected without touching the backend. After `open_seconds` it
+    lets `half_open_max_calls` probes through; a successful probe closes it and
+    a failed one opens it again.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.enabled = config.get('enabled', True)
+        self.window = config.get('window', 20)
+        self.min_requests = config.get('min_requests', 3)
+        self.failure_rate = config.get('failure_rate', 0.5)
+        self.slow_call_seconds = config.get('slow_call_seconds')
+        self.slow_call_rate = config.get('slow_call_rate', 0.8)
+        self.open_seconds = config.get('open_seconds', 30.0)
+        self.half_open_max_calls = config.get('half_open_max_calls', 1)
+        self.outcomes = deque(maxlen=self.window)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.times_opened = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if not self.enabled:
+            return True
+        with self.lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self.half_open_calls = 0
+            if self.state == HALF_OPEN:
+                if self.half_open_calls >= self.half_open_max_calls:
+                    self.rejected += 1
+                    return False
+                self.half_open_calls += 1
+            return True
+
+    def rejects(self) -> bool:
+        """True, and counted as a rejection, while open. Unlike `allow` it never takes a half-open probe slot."""
+        if not self.enabled:
+            return False
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at < self.open_seconds:
+                self.rejected += 1
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        with self.lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+
+    def record_success(self, latency: float):
+        if not self.enabled:
+            return
+        with self.lock:
+            slow = self.slow_call_seconds is not None and latency >= self.slow_call_seconds
+            if self.state == HALF_OPEN:
+                if slow:
+                    self._open()
+                else:
+                    self._close()
+                return
+            self.outcomes.append((False, slow))
+            self._evaluate()
+
+    def record_failure(self):
+        if not self.enabled:
+            return
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self._open()
+                return
+            self.outcomes.append((True, False))
+            self._evaluate()
+
+    def release(self):
+        # A half-open probe that ended without an outcome (e.g. cancelled by a
+        # hedge) gives its slot back.
+        with self.lock:
+            if self.state == HALF_OPEN and self.half_open_calls > 0:
+                self.half_open_calls -= 1
+
+    def _evaluate(self):
+        if self.state != CLOSED or len(self.outcomes) < self.min_requests:
+            return
+        failures = sum(1 for failed, _ in self.outcomes if failed)
+        slow_calls = sum(1 for _, slow in self.outcomes if slow)
+        if failures / len(self.outcomes) >= self.failure_rate:
+            self._open()
+        elif self.slow_call_seconds is not None and slow_calls / len(self.outcomes) >= self.slow_call_rate:
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self.outcomes.clear()
+
+    def _close(self):
+        self.state = CLOSED
+        self.half_open_calls = 0
+        self.outcomes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            failures = sum(1 for failed, _ in self.outcomes if failed)
+            return {
+                "state": self.state,
+                "window_calls": len(self.outcomes),
+                "window_failures": failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected
+            }
@@ -0,0 +1,145 @@
+import asyncio
+from typing import Dict, Any, Callable, Awaitable, AsyncIterator, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _Broadcast:
+    """Buffers the events of one upstream stream so every subscriber sees all of them in order."""
+
+    def __init__(self):
+        self.events = []
+        self.error: Optional[BaseException] = None
+        self.finished = False
+        self.changed = asyncio.Event()
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def publish(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class StreamFlight:
+    """One subscriber's view of a coalesced stream. `shared` is True when it joined another caller's flight."""
+
+    def __init__(self, owner: 'SingleFlight', key: str, broadcast: _Broadcast, shared: bool):
+        self.owner = owner
+        self.key = key
+        self.broadcast = broadcast
+        self.shared = shared
+
+    def __aiter__(self):
+        return self._events()
+
+    async def _events(self):
+        broadcast = self.broadcast
+        position = 0
+        try:
+            while True:
+                while position < len(broadcast.events):
+                    yield broadcast.events[position]
+                    position += 1
+                if broadcast.finished:
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+                await broadcast.changed.wait()
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.finished:
+                broadcast.task.cancel()
+                self.owner._forget_stream(self.key, broadcast)
+
+
+class SingleFlight:
+    """Coalesces identical concurrent calls onto one upstream call.
+
+    The first caller for a key starts the work; callers arriving with the same
+    key while it runs wait for the same result (or, for streams, replay the
+    events produced so far and then follow along). The work is cancelled only
+    once every waiter has gone away. Nothing is kept after the call finishes.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.enabled = config.get('enabled', True)
+        self.calls: Dict[str, _Call] = {}
+        self.streams: Dict[str, _Broadcast] = {}
+        self.flights = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, call: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Returns (result, shared); shared is True when the result came from another caller's flight."""
+        if not self.enabled:
+            return await call(), False
+        entry = self.calls.get(key)
+        shared = entry is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            self.flights += 1
+            entry = _Call(asyncio.ensure_future(call()))
+            self.calls[key] = entry
+            entry.task.add_done_callback(lambda _: self._forget_call(key, entry))
+        entry.waiters += 1
+        try:
+            return await asyncio.shield(entry.task), shared
+        except asyncio.CancelledError:
+            if not entry.task.done() and entry.waiters == 1:
+                entry.task.cancel()
+            raise
+        finally:
+            entry.waiters -= 1
+
+    def _forget_call(self, key: str, entry: _Call):
+        if self.calls.get(key) is entry:
+            del self.calls[key]
+
+    def stream(self, key: str, factory: Callable[[], AsyncIterator[T]]) -> StreamFlight:
+        broadcast = self.streams.get(key) if self.enabled else None
+        shared = broadcast is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            self.flights += 1
+            broadcast = _Broadcast()
+            broadcast.task = asyncio.ensure_future(self._pump(key, broadcast, factory))
+            if self.enabled:
+                self.streams[key] = broadcast
+        broadcast.subscribers += 1
+        return StreamFlight(self, key, broadcast, shared)
+
+    async def _pump(self, key: str, broadcast: _Broadcast, factory: Callable[[], AsyncIterator[T]]):
+        iterator = factory()
+        try:
+            async for event in iterator:
+                broadcast.events.append(event)
+                broadcast.publish()
+        except asyncio.CancelledError:
+            broadcast.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            await iterator.aclose()
+            broadcast.finished = True
+            self._forget_stream(key, broadcast)
+            broadcast.publish()
+
+    def _forget_stream(self, key: str, broadcast: _Broadcast):
+        if self.streams.get(key) is broadcast:
+            del self.streams[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self.calls) + len(self.streams),
+            "flights": self.flights,
+            "coalesced_hits": self.coalesced
+        }
@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from numbers import Number
+from types import MappingProxyType
+from typing import Dict, Any, List, Callable, Optional, Mapping, Tuple
+
+import yaml
+
+from errors import ConfigError
+from token_counting import TOKEN_COUNTERS
+from bandit import ALGORITHMS
+
+MODEL_TIERS = ("llm", "slm", "gemini")
+REQUIRED_ROUTING = ("complexity_threshold", "max_slm_tokens", "fallback_enabled",
+                    "cost_weight", "latency_weight", "quality_weight")
+# Read once when providers and caches are built; changing them needs a restart.
+RESTART_SECTIONS = ("models", "cache", "semantic_cache", "coalescing", "latency_model", "warmup", "server")
+
+
+def freeze(value: Any) -> Any:
+    """Read-only copy: dicts become mapping proxies and lists become tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """One validated, immutable version of config.yaml."""
+    config: Mapping[str, Any]
+    version: str
+    path: str
+    loaded_at: float
+
+
+def validate_config(config: Any) -> List[str]:
+    """Returns a list of problems; an empty list means the config is usable."""
+    if not isinstance(config, dict):
+        return ["config must be a mapping"]
+    problems = []
+
+    def number(section: Dict[str, Any], key: str, label: str, low: float = 0.0, high: Optional[float] = None):
+        value = section.get(key)
+        if value is None:
+            return
+        if isinstance(value, bool) or not isinstance(value, Number):
+            problems.append(f"{label}.{key} must be a number")
+        elif value < low or (high is not None and value > high):
+            problems.append(f"{label}.{key} must be between {low} and {high}" if high is not None
+                            else f"{label}.{key} must be at least {low}")
+
+    models = config.get('models')
+    if not isinstance(models, dict):
+        problems.append("models section is required")
+        models = {}
+    for tier in ("llm", "slm"):
+        if tier not in models:
+            problems.append(f"models.{tier} is required")
+    for name, model in models.items():
+        if name not in MODEL_TIERS:
+            problems.append(f"models.{name} is not a known tier ({', '.join(MODEL_TIERS)})")
+        elif not isinstance(model, dict):
+            problems.append(f"models.{name} must be a mapping")
+        elif 'cost_per_token' not in model:
+            problems.append(f"models.{name}.cost_per_token is required")
+        else:
+            number(model, 'cost_per_token', f"models.{name}")
+            tokenizer = model.get('tokenizer') or {}
+            if tokenizer.get('type', 'heuristic') not in TOKEN_COUNTERS:
+                problems.append(f"models.{name}.tokenizer.type must be one of {', '.join(TOKEN_COUNTERS)}")
+
+    routing = config.get('routing')
+    if not isinstance(routing, dict):
+        return problems + ["routing section is required"]
+    for key in REQUIRED_ROUTING:
+        if key not in routing:
+            problems.append(f"routing.{key} is required")
+    number(routing, 'complexity_threshold', "routing", 0.0, 1.0)
+    for key in ('max_slm_tokens', 'large_input_threshold', 'gemini_preferred_threshold',
+                'cost_weight', 'latency_weight', 'quality_weight'):
+        number(routing, key, "routing")
+    tokenizer = routing.get('tokenizer') or {}
+    if tokenizer.get('type', 'heuristic') not in TOKEN_COUNTERS:
+        problems.append(f"routing.tokenizer.type must be one of {', '.join(TOKEN_COUNTERS)}")
+    for i, rule in enumerate(routing.get('spillover') or []):
+        for end in ('from', 'to'):
+            if rule.get(end) not in models:
+                problems.append(f"routing.spillover[{i}].{end} must name a configured model")
+    learned = routing.get('learned_policy') or {}
+    number(learned, 'threshold', "routing.learned_policy", 0.0, 1.0)
+    bandit = routing.get('bandit') or {}
+    if bandit.get('algorithm', 'thompson') not in ALGORITHMS:
+        problems.append(f"routing.bandit.algorithm must be one of {', '.join(ALGORITHMS)}")
+    number(bandit, 'explore_rate', "routing.bandit", 0.0, 1.0)
+    number(bandit, 'decay', "routing.bandit", 0.0, 1.0)
+    for arm in bandit.get('arms') or []:
+        if arm not in models:
+            problems.append(f"routing.bandit.arms: {arm} is not a configured model")
+    return problems
+
+
+def load_config(path: str) -> ConfigSnapshot:
+    try:
+        with open(path, 'r') as f:
+            config = yaml.safe_load(f)
+    except (OSError, yaml.YAMLError) as e:
+        raise ConfigError(f"Cannot read {path}: {str(e)}")
+    problems = validate_config(config)
+    if problems:
+        raise ConfigError(f"Invalid {path}: " + "; ".join(problems))
+    version = hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:12]
+    return ConfigSnapshot(config=freeze(config), version=version, path=path, loaded_at=time.time())
+
+
+class ConfigService:
+    """Holds the current config snapshot and swaps in a new one when the file changes.
+
+    `check` compares the file's modification time and size with the last
+    load; when they differ it reloads, validates and, if the content really
+    changed, replaces the snapshot and calls every subscriber with it. An
+    invalid file is reported and the previous snapshot stays in force.
+    Subscribers run in the caller's thread (the event loop, for `awatch`),
+    while decisions may be running in worker threads, so each subscriber must
+    publish its new state with a single assignment; ModelRouter swaps in a
+    whole RoutingPolicy.
+    """
+
+    def __init__(self, path: str = "config.yaml"):
+        self.path = path
+        self.snapshot = load_config(path)
+        self.file_state = self._file_state()
+        self.subscribers: List[Callable[[ConfigSnapshot], None]] = []
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self.lock = threading.Lock()
+
+    @property
+    def config(self) -> Mapping[str, Any]:
+        return self.snapshot.config
+
+    def _file_state(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def subscribe(self, callback: Callable[[ConfigSnapshot], None]):
+        self.subscribers.append(callback)
+
+    def check(self) -> bool:
+        """Reloads if the file changed. Returns True when a new snapshot was applied."""
+        with self.lock:
+            state = self._file_state()
+            if state is None or state == self.file_state:
+                return False
+            self.file_state = state
+            try:
+                snapshot = load_config(self.path)
+            except ConfigError as e:
+                self.last_error = str(e)
+                print(f"Config reload rejected, keeping version {self.snapshot.version}: {self.last_error}")
+                return False
+            if snapshot.version == self.snapshot.version:
+                return False
+            previous = self.snapshot
+            try:
+                for callback in self.subscribers:
+                    callback(snapshot)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Config reload to version {snapshot.version} failed, restoring {previous.version}: {self.last_error}")
+                for callback in self.subscribers:
+                    callback(previous)
+                return False
+            self.snapshot = snapshot
+            self.reloads += 1
+            self.last_error = None
+            print(f"Config reloaded: version {previous.version} -> {snapshot.version}")
+            return True
+
+    async def awatch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Config watch failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "version": self.snapshot.version,
+            "loaded_at": self.snapshot.loaded_at,
+            "reloads": self.reloads,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,26 @@
+class ProviderError(Exception):
+    pass
+
+
+class ProviderConnectionError(ProviderError):
+    pass
+
+
+class ProviderTimeoutError(ProviderError):
+    pass
+
+
+class ProviderUnavailableError(ProviderError):
+    """Raised without calling the backend while the provider's circuit breaker is open."""
+
+
+class ProviderOverloadedError(ProviderUnavailableError):
+    """Raised when a provider's scheduler queue is full."""
+
+
+class DeadlineExceededError(ProviderTimeoutError):
+    """Raised when a request's deadline passes while it is still queued."""
+
+
+class ConfigError(Exception):
+    """Raised when config.yaml cannot be parsed or fails validation."""
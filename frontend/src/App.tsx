@@ -45,7 +45,7 @@ function App() {
     const messageId = Date.now().toString()
 
     try {
-      const response = await fetch(`${API_URL}/api/query`, {
+      const response = await fetch(`${API_URL}/api/query/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -57,34 +57,85 @@ function App() {
         })
       })
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error(`HTTP error! status: ${response.status}`)
       }
 
-      const data = await response.json()
+      const updateMessage = (patch: Partial<Message>) => {
+        setMessages(prev => prev.map(m => (m.id === messageId ? { ...m, ...patch } : m)))
+      }
 
-      const newMessage: Message = {
-        id: messageId,
-        prompt,
-        response: data.response,
-        modelUsed: data.model_used,
-        decision: data.decision,
-        fallbackUsed: data.fallback_used,
-        fallbackReason: data.fallback_reason,
-        timestamp: new Date()
+      let content = ''
+      const result: { decision?: Message['decision']; modelUsed?: string } = {}
+
+      const handleEvent = (event: string, data: any) => {
+        if (event === 'decision') {
+          result.decision = data.decision
+          setMessages(prev => [...prev, {
+            id: messageId,
+            prompt,
+            response: '',
+            modelUsed: data.decision.model_type,
+            decision: data.decision,
+            fallbackUsed: false,
+            timestamp: new Date()
+          }])
+        } else if (event === 'token') {
+          content += data.content
+          updateMessage({ response: content })
+        } else if (event === 'fallback') {
+          content = ''
+          updateMessage({ response: content, fallbackUsed: true, fallbackReason: data.reason })
+        } else if (event === 'done') {
+          result.modelUsed = data.model_used
+          updateMessage({
+            modelUsed: data.model_used,
+            fallbackUsed: data.fallback_used,
+            fallbackReason: data.fallback_reason
+          })
+        } else if (event === 'error') {
+          throw new Error(data.detail)
+        }
       }
 
-      setMessages(prev => [...prev, newMessage])
-      
-      const isLLM = data.model_used === 'llm' || data.model_used === 'gemini'
-      const isSLM = data.model_used === 'slm'
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+
+      while (true) {
+        const { value, done: streamDone } = await reader.read()
+        if (streamDone) break
+        buffer += decoder.decode(value, { stream: true })
+
+        let boundary = buffer.indexOf('\n\n')
+        while (boundary !== -1) {
+          const raw = buffer.slice(0, boundary)
+          buffer = buffer.slice(boundary + 2)
+          let event = 'message'
+          let data = ''
+          for (const line of raw.split('\n')) {
+            if (line.startsWith('event:')) event = line.slice(6).trim()
+            else if (line.startsWith('data:')) data += line.slice(5).trim()
+          }
+          if (data) handleEvent(event, JSON.parse(data))
+          boundary = buffer.indexOf('\n\n')
+        }
+      }
+
+      const { decision, modelUsed } = result
+      if (!decision || !modelUsed) {
+        throw new Error('Stream ended before completion')
+      }
+
+      const isLLM = modelUsed === 'llm' || modelUsed === 'gemini'
+      const isSLM = modelUsed === 'slm'
       
       setStats(prev => ({
         totalQueries: prev.totalQueries + 1,
         llmCount: prev.llmCount + (isLLM ? 1 : 0),
         slmCount: prev.slmCount + (isSLM ? 1 : 0),
-        totalCost: prev.totalCost + data.decision.estimated_cost,
-        avgLatency: (prev.avgLatency * prev.totalQueries + data.decision.estimated_latency) / (prev.totalQueries + 1)
+        totalCost: prev.totalCost + decision.estimated_cost,
+        avgLatency: (prev.avgLatency * prev.totalQueries + decision.estimated_latency) / (prev.totalQueries + 1)
       }))
     } catch (error) {
       console.error('Error:', error)
@@ -103,7 +154,7 @@ function App() {
         fallbackUsed: false,
         timestamp: new Date()
       }
-      setMessages(prev => [...prev, errorMessage])
+      setMessages(prev => [...prev.filter(m => m.id !== messageId), errorMessage])
     } finally {
       setIsLoading(false)
     }
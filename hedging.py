@@ -0,0 +1,181 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Callable, Awaitable, AsyncIterator, TypeVar
+
+T = TypeVar('T')
+
+_EXHAUSTED = object()
+
+
+class LatencyWindow:
+    def __init__(self, size: int = 500):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def percentile(self, p: float) -> float:
+        with self.lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, max(0, int(round(p * (len(ordered) - 1)))))
+        return ordered[index]
+
+
+class HedgeBudget:
+    """Token bucket that lets at most `ratio` extra requests through per primary request."""
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self.lock = threading.Lock()
+
+    def on_request(self):
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self.lock:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+
+class Hedger:
+    """Sends a backup request when the primary is slower than a latency percentile.
+
+    The first successful result wins and the other request is cancelled. The
+    hedge delay comes from recent observed latencies (time to first token for
+    streams), and the budget caps hedges at a fraction of total requests.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.percentile = config.get('percentile', 0.95)
+        self.min_samples = config.get('min_samples', 20)
+        self.initial_delay = config.get('initial_delay', 2.0)
+        self.min_delay = config.get('min_delay', 0.05)
+        self.budget = HedgeBudget(config.get('budget', 0.1), config.get('burst', 10))
+        window = config.get('window', 500)
+        self.latency = LatencyWindow(window)
+        self.first_token_latency = LatencyWindow(window)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def delay(self, window: LatencyWindow) -> float:
+        if len(window) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, window.percentile(self.percentile))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay": self.delay(self.latency),
+            "first_token_hedge_delay": self.delay(self.first_token_latency)
+        }
+
+    async def run(self, primary: Callable[[], Awaitable[T]], backup: Callable[[], Awaitable[T]]) -> T:
+        self.requests += 1
+        self.budget.on_request()
+        started = time.monotonic()
+        primary_task = asyncio.ensure_future(primary())
+        pending = {primary_task}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.delay(self.latency))
+            if not done and self.budget.try_spend():
+                self.hedges += 1
+                backup_task = asyncio.ensure_future(backup())
+                pending.add(backup_task)
+
+            error = None
+            while pending or done:
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary_task:
+                            self.hedge_wins += 1
+                        self.latency.add(time.monotonic() - started)
+                        return task.result()
+                    error = error or task.exception()
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def run_stream(self, primary: Callable[[], AsyncIterator[str]],
+                         backup: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        self.requests += 1
+        self.budget.on_request()
+        started = time.monotonic()
+
+        async def first(iterator):
+            try:
+                return await iterator.__anext__()
+            except StopAsyncIteration:
+                return _EXHAUSTED
+
+        primary_iter = primary()
+        primary_task = asyncio.ensure_future(first(primary_iter))
+        iterators = {primary_task: primary_iter}
+        pending = {primary_task}
+        winner = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.delay(self.first_token_latency))
+            if not done and self.budget.try_spend():
+                self.hedges += 1
+                backup_iter = backup()
+                backup_task = asyncio.ensure_future(first(backup_iter))
+                iterators[backup_task] = backup_iter
+                pending.add(backup_task)
+
+            error = None
+            while winner is None:
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        break
+                    error = error or task.exception()
+                if winner is not None or not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task, iterator in iterators.items():
+                if task is not winner:
+                    try:
+                        await iterator.aclose()
+                    except Exception:
+                        pass
+
+        if winner is None:
+            raise error
+
+        if winner is not primary_task:
+            self.hedge_wins += 1
+        self.first_token_latency.add(time.monotonic() - started)
+        iterator = iterators[winner]
+        token = winner.result()
+        if token is _EXHAUSTED:
+            return
+        try:
+            yield token
+            async for token in iterator:
+                yield token
+        finally:
+            await iterator.aclose()
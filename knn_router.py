@@ -0,0 +1,235 @@
+import json
+import os
+import threading
+from typing import Dict, Any, Optional, Tuple, List, Sequence
+
+import numpy as np
+
+from cache import normalize_prompt
+from semantic_cache import build_embedder
+from vector_index import ClusteredIndex, _Buffer
+
+# Cheapest first: a tied vote goes to the cheaper tier.
+LABELS = ("slm", "llm", "gemini")
+LABEL_CODES = {label: code for code, label in enumerate(LABELS)}
+
+
+def cheapest_acceptable(slm_ok: Optional[bool], model_used: str) -> Optional[str]:
+    """The cheapest tier known to have answered acceptably, or None when the SLM was never tried."""
+    if slm_ok is None:
+        return None
+    return "slm" if slm_ok else model_used
+
+
+class LabelledIndex(ClusteredIndex):
+    """A ClusteredIndex whose ids are label codes, saved as a directory of `.npy` arrays.
+
+    `save` merges pending inserts into the cluster-sorted arrays and writes
+    them out; they are then memory-mapped, so a query only reads the clusters
+    it probes. Neither `retrain` nor `save` runs on insert: both take time
+    proportional to the whole index, so `KnnRouter.maintain` runs them on a
+    `snapshot` outside the request path.
+    """
+
+    FILES = ("vectors", "labels", "offsets", "centroids")
+
+    def __init__(self, dimensions: int, nlist: int = 1024, nprobe: int = 8, approximate_above: int = 20000):
+        super().__init__(dimensions, nlist, nprobe, approximate_above, id_dtype=np.int8)
+
+    def save(self, path: str):
+        """Merges pending inserts into the cluster-sorted arrays and writes them under `path`."""
+        os.makedirs(path, exist_ok=True)
+        total = self.size
+        tmp = {name: os.path.join(path, f"{name}.tmp.npy") for name in self.FILES}
+        vectors = np.lib.format.open_memmap(tmp["vectors"], mode='w+', dtype=np.float32,
+                                            shape=(total, self.dimensions))
+        labels = np.lib.format.open_memmap(tmp["labels"], mode='w+', dtype=np.int8, shape=(total,))
+        offsets = np.zeros(self.clusters + 1, dtype=np.int64)
+        position = 0
+        for c in range(self.clusters):
+            cluster_vectors, cluster_labels = self._cluster(c)
+            vectors[position:position + len(cluster_vectors)] = cluster_vectors
+            labels[position:position + len(cluster_labels)] = cluster_labels
+            position += len(cluster_vectors)
+            offsets[c + 1] = position
+        vectors.flush()
+        labels.flush()
+        del vectors, labels
+        np.save(tmp["offsets"], offsets)
+        np.save(tmp["centroids"], self.centroids if self.centroids is not None
+                else np.empty((0, self.dimensions), dtype=np.float32))
+        # Replacing the files leaves any existing memory maps of the old ones valid.
+        for name in self.FILES:
+            os.replace(tmp[name], os.path.join(path, f"{name}.npy"))
+        with open(os.path.join(path, "index.json"), 'w') as f:
+            json.dump({"dimensions": self.dimensions, "size": total, "trained_size": self.trained_size,
+                       "labels": list(LABELS)}, f)
+        self._attach(path)
+
+    def _attach(self, path: str):
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode='r')
+        self.ids = np.load(os.path.join(path, "labels.npy"), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        centroids = np.load(os.path.join(path, "centroids.npy"))
+        self.centroids = centroids if len(centroids) else None
+        self.buffers = [_Buffer(self.dimensions, self.id_dtype) for _ in range(self.clusters)]
+
+    @classmethod
+    def load(cls, path: str, nlist: int = 1024, nprobe: int = 8, approximate_above: int = 20000) -> 'LabelledIndex':
+        with open(os.path.join(path, "index.json"), 'r') as f:
+            meta = json.load(f)
+        index = cls(meta['dimensions'], nlist, nprobe, approximate_above)
+        index._attach(path)
+        if index.centroids is not None:
+            index.trained_size = meta.get('trained_size', meta['size'])
+        return index
+
+
+class KnnRouter:
+    """Routes a prompt to the tier that was cheapest-acceptable for its nearest past prompts.
+
+    Each neighbour within `min_similarity` votes for its label with weight
+    equal to its similarity. With fewer than `min_neighbours` such neighbours,
+    or when the embedder fails, the router abstains and the rules decide.
+
+    The index is per process: inserts land in this process's memory and are
+    written to `path` by `maintain`, which also retrains the clusters once the
+    index has grown `retrain_growth` times since they were trained. Workers
+    sharing `path` each write their own copy over the others'; to merge what
+    they learned, rebuild the index from the outcome log with build_knn_index.py.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.path = config.get('path', 'routing_index')
+        self.k = config.get('k', 16)
+        self.min_similarity = config.get('min_similarity', 0.3)
+        self.min_neighbours = config.get('min_neighbours', 3)
+        self.max_chars = config.get('max_chars', 2000)
+        self.embedder = build_embedder(config.get('embedder') or {'provider': 'hashing', 'dimensions': 256})
+        self.index_options = {
+            "nlist": config.get('nlist', 1024),
+            "nprobe": config.get('nprobe', 8),
+            "approximate_above": config.get('approximate_above', 20000)
+        }
+        self.save_interval = config.get('save_interval', 300)
+        self.retrain_growth = config.get('retrain_growth', 2.0)
+        self.index: Optional[LabelledIndex] = None
+        if os.path.exists(os.path.join(self.path, "index.json")):
+            self.index = LabelledIndex.load(self.path, **self.index_options)
+        self.inserts = 0
+        self.votes = 0
+        self.abstentions = 0
+        self.embed_errors = 0
+        self.saves = 0
+        self.retrains = 0
+        self.lock = threading.Lock()
+        # Serializes maintain(); searches and inserts only wait on `lock` for the final swap.
+        self.maintenance_lock = threading.Lock()
+
+    def embed(self, text: str) -> Optional[np.ndarray]:
+        try:
+            return self.embedder.embed(normalize_prompt(text[:self.max_chars]))
+        except Exception:
+            self.embed_errors += 1
+            return None
+
+    async def aembed(self, text: str) -> Optional[np.ndarray]:
+        try:
+            return await self.embedder.aembed(normalize_prompt(text[:self.max_chars]))
+        except Exception:
+            self.embed_errors += 1
+            return None
+
+    def vote(self, embedding: Optional[np.ndarray], allowed: Sequence[str]) -> Optional[Tuple[str, float, int]]:
+        """Returns (label, its share of the vote, neighbours counted), or None to abstain.
+
+        `embedding` comes from `embed` or `aembed`; None (the embedder failed) abstains.
+        """
+        if self.index is None:
+            return None
+        if embedding is None:
+            self.abstentions += 1
+            return None
+        if embedding.shape[0] != self.index.dimensions:
+            raise Exception(f"Embedding has {embedding.shape[0]} dimensions but the kNN index at {self.path} "
+                            f"has {self.index.dimensions}; rebuild it with the configured embedder")
+        with self.lock:
+            scores, labels = self.index.search(embedding, self.k)
+        weights = {}
+        neighbours = 0
+        for score, code in zip(scores.tolist(), labels.tolist()):
+            label = LABELS[code]
+            if score < self.min_similarity or label not in allowed:
+                continue
+            weights[label] = weights.get(label, 0.0) + score
+            neighbours += 1
+        if neighbours < self.min_neighbours:
+            self.abstentions += 1
+            return None
+        self.votes += 1
+        winner = max(weights, key=lambda label: (weights[label], -LABEL_CODES[label]))
+        return winner, weights[winner] / sum(weights.values()), neighbours
+
+    def insert(self, embedding: Optional[np.ndarray], label: str):
+        # A failed embedding (None) is already counted in embed_errors; the outcome is not learned.
+        if embedding is not None:
+            self.insert_many([embedding], [label])
+
+    def insert_many(self, embeddings: List[np.ndarray], labels: List[str]):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self.lock:
+            if self.index is None:
+                self.index = LabelledIndex(vectors.shape[1], **self.index_options)
+            self.index.add(vectors, np.array([LABEL_CODES[label] for label in labels], dtype=np.int8))
+            self.inserts += len(labels)
+
+    def maintain(self, retrain: bool = True):
+        """Retrains the clusters if the index has outgrown them and writes pending inserts to `path`.
+
+        The work runs on a snapshot without holding `lock`, so call it from a
+        worker thread; inserts that arrive meanwhile are carried over when the
+        rebuilt index is swapped in.
+        """
+        with self.maintenance_lock:
+            with self.lock:
+                live = self.index
+                if live is None:
+                    return
+                retrain = retrain and live.needs_training(self.retrain_growth)
+                if not retrain and not live.pending:
+                    return
+                fresh = live.snapshot()
+            seen = [buffer.size for buffer in fresh.buffers]
+            if retrain:
+                fresh.retrain()
+            fresh.save(self.path)
+            with self.lock:
+                if self.index is not live:
+                    return
+                for buffer, start in zip(live.buffers, seen):
+                    if buffer.size > start:
+                        fresh.add(buffer.vectors[start:buffer.size], buffer.ids[start:buffer.size])
+                self.index = fresh
+                self.saves += 1
+                self.retrains += int(retrain)
+
+    def save(self):
+        self.maintain(retrain=False)
+
+    async def aclose(self):
+        self.save()
+        await self.embedder.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "size": self.index.size if self.index is not None else 0,
+                "pending": self.index.pending if self.index is not None else 0,
+                "clusters": self.index.clusters if self.index is not None else 0,
+                "inserts": self.inserts,
+                "votes": self.votes,
+                "abstentions": self.abstentions,
+                "embed_errors": self.embed_errors,
+                "saves": self.saves,
+                "retrains": self.retrains
+            }
@@ -0,0 +1,158 @@
+import json
+import math
+import random
+import re
+import zlib
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+
+import numpy as np
+
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+CODE_PATTERN = re.compile(r"```|[{};]|\bdef |\bclass |\breturn\b|\bimport\b")
+DENSE_FEATURES = ("log_words", "log_chars", "log_lines", "question_marks", "code_markers", "digit_ratio")
+
+
+def dense_features(text: str, words: List[str]) -> np.ndarray:
+    digits = sum(1 for ch in text if ch.isdigit())
+    return np.array([
+        math.log1p(len(words)),
+        math.log1p(len(text)),
+        math.log1p(text.count('\n')),
+        min(text.count('?'), 5),
+        min(len(CODE_PATTERN.findall(text)), 10) / 10,
+        digits / len(text) if text else 0.0
+    ], dtype=np.float64)
+
+
+class LearnedRouter:
+    """Logistic regression that predicts whether the SLM will answer a prompt acceptably.
+
+    Features are word unigrams and bigrams hashed into `dimensions` buckets
+    (CRC32, so they are stable across processes), plus a few dense length and
+    shape features. Only the first `max_words` words are hashed, which keeps
+    inference well under a millisecond for typical prompts.
+    """
+
+    def __init__(self, dimensions: int = 2 ** 18, max_words: int = 512, threshold: float = 0.5):
+        self.dimensions = dimensions
+        self.max_words = max_words
+        self.threshold = threshold
+        self.weights = np.zeros(dimensions, dtype=np.float64)
+        self.dense_weights = np.zeros(len(DENSE_FEATURES), dtype=np.float64)
+        self.bias = 0.0
+        self.metadata: Dict[str, Any] = {}
+
+    def featurize(self, text: str) -> Tuple[np.ndarray, float, np.ndarray]:
+        """Returns (hashed indices, value per hashed feature, dense features)."""
+        words = WORD_PATTERN.findall(text.lower())
+        head = words[:self.max_words]
+        grams = head + [f"{a} {b}" for a, b in zip(head, head[1:])]
+        indices = np.fromiter((zlib.crc32(g.encode('utf-8')) % self.dimensions for g in grams),
+                              dtype=np.int64, count=len(grams))
+        value = 1.0 / math.sqrt(len(grams)) if grams else 0.0
+        return indices, value, dense_features(text, words)
+
+    def predict(self, text: str) -> float:
+        """Probability that the SLM's answer to `text` passes the quality check."""
+        indices, value, dense = self.featurize(text)
+        z = self.bias + float(self.dense_weights @ dense) + float(self.weights[indices].sum()) * value
+        return 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, z))))
+
+    def fit(self, texts: List[str], labels: List[int], sample_weights: Optional[List[float]] = None,
+            epochs: int = 5, learning_rate: float = 0.5, l2: float = 1e-6, seed: int = 0):
+        """Adagrad SGD on log loss."""
+        samples = [self.featurize(text) for text in texts]
+        sample_weights = sample_weights or [1.0] * len(samples)
+        grad_sq = np.full(self.dimensions, 1e-8)
+        dense_grad_sq = np.full(len(DENSE_FEATURES), 1e-8)
+        bias_grad_sq = 1e-8
+        order = list(range(len(samples)))
+        rng = random.Random(seed)
+        for _ in range(epochs):
+            rng.shuffle(order)
+            for i in order:
+                indices, value, dense = samples[i]
+                z = self.bias + float(self.dense_weights @ dense) + float(self.weights[indices].sum()) * value
+                p = 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, z))))
+                g = (p - labels[i]) * sample_weights[i]
+
+                grad = g * value + l2 * self.weights[indices]
+                np.add.at(grad_sq, indices, grad * grad)
+                np.subtract.at(self.weights, indices, learning_rate * grad / np.sqrt(grad_sq[indices]))
+
+                dense_grad = g * dense + l2 * self.dense_weights
+                dense_grad_sq += dense_grad * dense_grad
+                self.dense_weights -= learning_rate * dense_grad / np.sqrt(dense_grad_sq)
+
+                bias_grad_sq += g * g
+                self.bias -= learning_rate * g / math.sqrt(bias_grad_sq)
+        return self
+
+    def save(self, path: str):
+        metadata = {
+            "dimensions": self.dimensions,
+            "max_words": self.max_words,
+            "threshold": self.threshold,
+            "dense_features": list(DENSE_FEATURES),
+            **self.metadata
+        }
+        # Hashed weights are sparse; store only the non-zero ones.
+        nonzero = np.flatnonzero(self.weights)
+        with open(path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                indices=nonzero,
+                values=self.weights[nonzero],
+                dense_weights=self.dense_weights,
+                bias=np.array(self.bias),
+                metadata=np.array(json.dumps(metadata))
+            )
+
+    @classmethod
+    def load(cls, path: str, threshold: Optional[float] = None) -> 'LearnedRouter':
+        with np.load(path, allow_pickle=False) as data:
+            metadata = json.loads(str(data['metadata']))
+            model = cls(metadata['dimensions'], metadata['max_words'],
+                        metadata['threshold'] if threshold is None else threshold)
+            model.weights[data['indices']] = data['values']
+            model.dense_weights = data['dense_weights'].astype(np.float64)
+            model.bias = float(data['bias'])
+        model.metadata = {k: v for k, v in metadata.items()
+                          if k not in ("dimensions", "max_words", "threshold", "dense_features")}
+        return model
+
+
+def outcome_label(record: Dict[str, Any], max_latency: Optional[float] = None) -> Optional[int]:
+    """1 if the SLM answered acceptably, 0 if it did not, None if the record says nothing about the SLM."""
+    slm_ok = record.get('slm_ok')
+    if slm_ok is None or not record.get('prompt'):
+        return None
+    if slm_ok and max_latency is not None and record.get('latency') is not None and record['latency'] > max_latency:
+        return 0
+    return int(bool(slm_ok))
+
+
+def train_from_log(records: Iterable[Dict[str, Any]], max_latency: Optional[float] = None,
+                   holdout: float = 0.1, **options) -> LearnedRouter:
+    labelled = [(r['prompt'], label) for r in records if (label := outcome_label(r, max_latency)) is not None]
+    if not labelled:
+        raise Exception("No labelled records: the log has no requests that the SLM answered")
+    random.Random(0).shuffle(labelled)
+    split = int(len(labelled) * (1 - holdout)) if len(labelled) >= 20 else len(labelled)
+    train, test = labelled[:split], labelled[split:]
+
+    positives = sum(label for _, label in train)
+    negatives = len(train) - positives
+    if positives == 0 or negatives == 0:
+        raise Exception(f"Training needs both outcomes; the log has {positives} SLM passes and {negatives} failures")
+    # Weight classes equally so a mostly-passing log does not teach "always SLM".
+    weights = [len(train) / (2 * (positives if label else negatives)) for _, label in train]
+    fit_options = {k: v for k, v in options.items() if k in ("epochs", "learning_rate", "l2")}
+    model_options = {k: v for k, v in options.items() if k in ("dimensions", "max_words", "threshold")}
+    model = LearnedRouter(**model_options).fit([t for t, _ in train], [l for _, l in train], weights, **fit_options)
+
+    model.metadata = {"trained_on": len(train), "positives": positives, "negatives": negatives}
+    if test:
+        correct = sum(1 for text, label in test if (model.predict(text) >= model.threshold) == bool(label))
+        model.metadata["holdout_accuracy"] = round(correct / len(test), 4)
+    return model
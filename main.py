@@ -1,20 +1,21 @@
 import uvicorn
-import yaml
 import sys
+from config_service import load_config
+from errors import ConfigError
 
 
 def main():
     try:
-        with open("config.yaml", 'r') as f:
-            config = yaml.safe_load(f)
+        config = load_config("config.yaml").config
         
         host = config['server']['host']
         port = config['server']['port']
         
         print(f"Starting LLM-SLM Router API on {host}:{port}")
-        uvicorn.run("api:app", host=host, port=port, reload=True)
-    except FileNotFoundError:
-        print("Error: config.yaml not found")
+        # config.yaml is hot-reloaded in-process; code reload restarts the server and is for development only.
+        uvicorn.run("api:app", host=host, port=port, reload=config['server'].get('reload', False))
+    except ConfigError as e:
+        print(f"Error: {str(e)}")
         sys.exit(1)
     except Exception as e:
         print(f"Error starting server: {str(e)}")
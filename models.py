@@ -1,6 +1,26 @@
 import requests
+import httpx
+import asyncio
+import contextlib
+import contextvars
 import os
-from typing import Optional, Dict, Any
+import socket
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+import json
+from typing import Optional, Dict, Any, Tuple, AsyncIterator, Type, Callable, Awaitable, List, Union
+from balancer import ReplicaPool
+from hedging import Hedger
+from circuit_breaker import CircuitBreaker
+from scheduler import RequestScheduler
+from batching import MicroBatcher
+from telemetry import CALL_METRICS, report_metrics, ProviderLoad
+from errors import ProviderError, ProviderConnectionError, ProviderTimeoutError, ProviderUnavailableError
+
+# The provider whose answer the latest call on this task returned. It differs from the
+# provider called when a hedge to another provider (`hedging.target`) won.
+ANSWERED_BY: contextvars.ContextVar[Optional['BaseProvider']] = contextvars.ContextVar('answered_by', default=None)
 
 try:
     from google import genai
@@ -9,142 +29,710 @@ except ImportError:
     GEMINI_AVAILABLE = False
 
 
-class LLMProvider:
-    def __init__(self, config: Dict[str, Any]):
-        self.config = config
-        self.provider = config.get('provider', 'ollama')
-        self.model = config.get('model', 'llama3')
-        self.endpoint = config.get('endpoint')
-        
-        if self.provider == 'gemini':
-            if not GEMINI_AVAILABLE:
-                raise Exception("google-genai package not installed. Install with: pip install google-genai")
-            api_key = config.get('api_key') or os.getenv('GEMINI_API_KEY', '')
-            if api_key:
-                os.environ['GEMINI_API_KEY'] = api_key
-            self.client = genai.Client()
-    
-    def generate(self, prompt: str, max_tokens: Optional[int] = None) -> str:
-        if self.provider == 'ollama':
+class KeepAliveAdapter(HTTPAdapter):
+    def __init__(self, tcp_keepalive: bool = True, **kwargs):
+        self.tcp_keepalive = tcp_keepalive
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.tcp_keepalive:
+            kwargs['socket_options'] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            ]
+        super().init_poolmanager(*args, **kwargs)
+
+
+def build_session(config: Dict[str, Any]) -> requests.Session:
+    connection = config.get('connection', {}) or {}
+    adapter = KeepAliveAdapter(
+        tcp_keepalive=connection.get('tcp_keepalive', True),
+        pool_connections=connection.get('pool_connections', 4),
+        pool_maxsize=connection.get('pool_maxsize', 16),
+        pool_block=connection.get('pool_block', True),
+        max_retries=0
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Connection': 'keep-alive'})
+    return session
+
+
+def request_timeout(config: Dict[str, Any], default_read: float) -> Tuple[float, float]:
+    connection = config.get('connection', {}) or {}
+    return (
+        connection.get('connect_timeout', 5.0),
+        connection.get('read_timeout', default_read)
+    )
+
+
+def build_async_client(config: Dict[str, Any], default_read: float) -> httpx.AsyncClient:
+    connection = config.get('connection', {}) or {}
+    connect_timeout, read_timeout = request_timeout(config, default_read)
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=connection.get('pool_maxsize', 16),
+            max_keepalive_connections=connection.get('pool_maxsize', 16),
+            keepalive_expiry=connection.get('keepalive_expiry', 60.0)
+        ),
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        headers={'Connection': 'keep-alive'}
+    )
+
+
+def parse_ollama_response(result: Dict[str, Any]) -> str:
+    if 'message' in result:
+        if isinstance(result['message'], dict) and 'content' in result['message']:
+            return result['message']['content']
+        elif isinstance(result['message'], str):
+            return result['message']
+
+    if 'content' in result:
+        return result['content']
+
+    if 'response' in result:
+        return result['response']
+
+    raise Exception(f"Unexpected Ollama response format: {result}")
+
+
+def parse_ollama_chunk(chunk: Dict[str, Any]) -> str:
+    message = chunk.get('message')
+    if isinstance(message, dict):
+        return message.get('content', '')
+    if isinstance(message, str):
+        return message
+    return chunk.get('response', '')
+
+
+BACKENDS: Dict[str, Type['Backend']] = {}
+
+
+def register_backend(*names: str) -> Callable[[Type['Backend']], Type['Backend']]:
+    def decorator(cls: Type['Backend']) -> Type['Backend']:
+        for name in names:
+            BACKENDS[name] = cls
+        return cls
+    return decorator
+
+
+class Backend:
+    """Adapter that speaks one model-serving API on behalf of a BaseProvider."""
+
+    label = "Backend"
+
+    def __init__(self, provider: 'BaseProvider'):
+        self.provider = provider
+        self.config = provider.config
+        self.model = provider.model
+        self.endpoint = provider.endpoint
+
+    def generate(self, prompt: str, max_tokens: int) -> str:
+        raise NotImplementedError
+
+    async def agenerate(self, prompt: str, max_tokens: int, avoid: Optional[list] = None) -> str:
+        raise NotImplementedError
+
+    async def astream(self, prompt: str, max_tokens: int, avoid: Optional[list] = None) -> AsyncIterator[str]:
+        yield await self.agenerate(prompt, max_tokens, avoid)
+
+    async def agenerate_batch(self, prompts: List[str], max_tokens: int) -> List[Union[str, Exception]]:
+        # Backends without a batch API run the prompts concurrently.
+        results = await asyncio.gather(*[self.agenerate(p, max_tokens) for p in prompts], return_exceptions=True)
+        if all(isinstance(r, Exception) for r in results):
+            raise results[0]
+        return results
+
+    def replica_count(self) -> int:
+        return 1
+
+    async def awarmup(self, timeout: float) -> Dict[str, Any]:
+        return {}
+
+    async def aclose(self):
+        pass
+
+
+class HTTPBackend(Backend):
+    """Backend for HTTP model servers, sharing one pooled sync session and one async client."""
+
+    hint = ""
+
+    def __init__(self, provider: 'BaseProvider'):
+        super().__init__(provider)
+        self.headers = self.build_headers()
+        self.session = build_session(self.config)
+        self.session.headers.update(self.headers)
+        self.timeout = request_timeout(self.config, provider.default_read_timeout)
+        self.async_client = None
+        self.replicas = ReplicaPool.from_config(self.config)
+
+    def build_headers(self) -> Dict[str, str]:
+        return {}
+
+    def get_async_client(self) -> httpx.AsyncClient:
+        if self.async_client is None:
+            self.async_client = build_async_client(self.config, self.provider.default_read_timeout)
+            self.async_client.headers.update(self.headers)
+        return self.async_client
+
+    def is_replica_failure(self, e: Exception) -> bool:
+        if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                          httpx.TransportError)):
+            return True
+        if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+            return e.response.status_code >= 500
+        if isinstance(e, httpx.HTTPStatusError):
+            return e.response.status_code >= 500
+        return False
+
+    def wrap_error(self, e: Exception, url: str) -> Exception:
+        if isinstance(e, (requests.exceptions.ConnectionError, httpx.ConnectError)):
+            return ProviderConnectionError(f"{self.label} connection error: Cannot connect to {url}. {self.hint}".rstrip())
+        if isinstance(e, (requests.exceptions.Timeout, httpx.TimeoutException)):
+            return ProviderTimeoutError(f"{self.label} timeout: Request took too long. The model might be loading or the request is too complex.")
+        return ProviderError(f"{self.label} API error: {str(e)}")
+
+    def build_payload(self, prompt: str, max_tokens: int, stream: bool) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def parse_response(self, result: Dict[str, Any]) -> str:
+        raise NotImplementedError
+
+    def parse_stream_line(self, line: str) -> Tuple[str, bool]:
+        raise NotImplementedError
+
+    def generate(self, prompt: str, max_tokens: int) -> str:
+        replica = self.replicas.select(key=prompt)
+        with self.replicas.track(replica):
             try:
-                response = requests.post(
-                    self.endpoint,
-                    json={
-                        "model": self.model,
-                        "messages": [
-                            {"role": "user", "content": prompt}
-                        ],
-                        "stream": False,
-                        "options": {
-                            "num_predict": max_tokens or self.config.get('max_tokens', 4096)
-                        }
-                    },
-                    timeout=120
+                response = self.session.post(
+                    replica.url,
+                    json=self.build_payload(prompt, max_tokens, stream=False),
+                    timeout=self.timeout
                 )
                 response.raise_for_status()
-                result = response.json()
-                
-                if 'message' in result:
-                    if isinstance(result['message'], dict) and 'content' in result['message']:
-                        return result['message']['content']
-                    elif isinstance(result['message'], str):
-                        return result['message']
-                
-                if 'content' in result:
-                    return result['content']
-                
-                if 'response' in result:
-                    return result['response']
-                
-                raise Exception(f"Unexpected Ollama response format: {result}")
-            except requests.exceptions.ConnectionError as e:
-                raise Exception(f"Ollama connection error: Cannot connect to {self.endpoint}. Make sure Ollama is running (ollama serve)")
-            except requests.exceptions.Timeout as e:
-                raise Exception(f"Ollama timeout: Request took too long. The model might be loading or the request is too complex.")
+                result = self.parse_response(response.json())
             except Exception as e:
-                raise Exception(f"Ollama API error: {str(e)}")
-        
-        elif self.provider == 'gemini':
+                if self.is_replica_failure(e):
+                    self.replicas.record_failure(replica)
+                raise self.wrap_error(e, replica.url)
+        self.replicas.record_success(replica)
+        return result
+
+    def select_replica(self, prompt: str, avoid: Optional[list]):
+        # Callers that hedge share one `avoid` list so the backup call picks
+        # a different replica from the primary.
+        replica = self.replicas.select(exclude=avoid, key=prompt)
+        if avoid is not None:
+            avoid.append(replica)
+        return replica
+
+    def replica_count(self) -> int:
+        return len(self.replicas.replicas)
+
+    async def agenerate(self, prompt: str, max_tokens: int, avoid: Optional[list] = None) -> str:
+        replica = self.select_replica(prompt, avoid)
+        with self.replicas.track(replica):
             try:
-                model_name = self.config.get('model', 'gemini-2.5-flash')
-                response = self.client.models.generate_content(
-                    model=model_name,
-                    contents=prompt
+                response = await self.get_async_client().post(
+                    replica.url,
+                    json=self.build_payload(prompt, max_tokens, stream=False)
                 )
-                return response.text
+                response.raise_for_status()
+                result = self.parse_response(response.json())
             except Exception as e:
-                raise Exception(f"Gemini API error: {str(e)}")
-        
-        else:
-            raise Exception(f"Unsupported provider: {self.provider}")
+                if self.is_replica_failure(e):
+                    self.replicas.record_failure(replica)
+                raise self.wrap_error(e, replica.url)
+        self.replicas.record_success(replica)
+        return result
 
+    async def astream(self, prompt: str, max_tokens: int, avoid: Optional[list] = None) -> AsyncIterator[str]:
+        replica = self.select_replica(prompt, avoid)
+        with self.replicas.track(replica):
+            try:
+                async with self.get_async_client().stream(
+                    "POST",
+                    replica.url,
+                    json=self.build_payload(prompt, max_tokens, stream=True)
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        token, done = self.parse_stream_line(line)
+                        if token:
+                            yield token
+                        if done:
+                            break
+            except Exception as e:
+                if self.is_replica_failure(e):
+                    self.replicas.record_failure(replica)
+                raise self.wrap_error(e, replica.url)
+        self.replicas.record_success(replica)
 
-class SLMProvider:
-    def __init__(self, config: Dict[str, Any]):
-        self.config = config
-        self.provider = config.get('provider', 'ollama')
-        self.model = config.get('model', 'llama3.2')
-        self.endpoint = config.get('endpoint')
-        
-        if self.provider == 'gemini':
-            if not GEMINI_AVAILABLE:
-                raise Exception("google-genai package not installed. Install with: pip install google-genai")
-            api_key = config.get('api_key') or os.getenv('GEMINI_API_KEY', '')
-            if api_key:
-                os.environ['GEMINI_API_KEY'] = api_key
-            self.client = genai.Client()
-    
-    def generate(self, prompt: str, max_tokens: Optional[int] = None) -> str:
-        if self.provider == 'ollama':
+    async def aclose(self):
+        if self.async_client is not None:
+            await self.async_client.aclose()
+            self.async_client = None
+
+
+@register_backend('ollama')
+class OllamaBackend(HTTPBackend):
+    label = "Ollama"
+    hint = "Make sure Ollama is running (ollama serve)"
+
+    def __init__(self, provider: 'BaseProvider'):
+        super().__init__(provider)
+        self.keep_alive = self.config.get('keep_alive')
+
+    def build_payload(self, prompt: str, max_tokens: int, stream: bool) -> Dict[str, Any]:
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "stream": stream,
+            "options": {
+                "num_predict": max_tokens
+            }
+        }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    async def awarmup(self, timeout: float) -> Dict[str, Any]:
+        # A chat request with no messages makes Ollama load the model
+        # (and refresh keep_alive) without generating anything.
+        payload = {"model": self.model, "messages": [], "stream": False}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+
+        async def load(replica):
+            started = time.monotonic()
             try:
-                response = requests.post(
-                    self.endpoint,
-                    json={
-                        "model": self.model,
-                        "messages": [
-                            {"role": "user", "content": prompt}
-                        ],
-                        "stream": False,
-                        "options": {
-                            "num_predict": max_tokens or self.config.get('max_tokens', 2048)
-                        }
-                    },
-                    timeout=60
-                )
+                response = await self.get_async_client().post(replica.url, json=payload, timeout=timeout)
                 response.raise_for_status()
-                result = response.json()
-                
-                if 'message' in result:
-                    if isinstance(result['message'], dict) and 'content' in result['message']:
-                        return result['message']['content']
-                    elif isinstance(result['message'], str):
-                        return result['message']
-                
-                if 'content' in result:
-                    return result['content']
-                
-                if 'response' in result:
-                    return result['response']
-                
-                raise Exception(f"Unexpected Ollama response format: {result}")
-            except requests.exceptions.ConnectionError as e:
-                raise Exception(f"Ollama connection error: Cannot connect to {self.endpoint}. Make sure Ollama is running (ollama serve)")
-            except requests.exceptions.Timeout as e:
-                raise Exception(f"Ollama timeout: Request took too long. The model might be loading or the request is too complex.")
+                self.replicas.record_success(replica)
+                return replica.url, {"status": "ready", "seconds": round(time.monotonic() - started, 3)}
             except Exception as e:
-                raise Exception(f"Ollama API error: {str(e)}")
-        
-        elif self.provider == 'gemini':
+                if self.is_replica_failure(e):
+                    self.replicas.record_failure(replica)
+                return replica.url, {"status": "failed", "error": str(self.wrap_error(e, replica.url))}
+
+        return dict(await asyncio.gather(*[load(replica) for replica in self.replicas.replicas]))
+
+    def report_timings(self, result: Dict[str, Any]):
+        # Ollama reports token counts and durations (in nanoseconds) with the final response.
+        timings = {}
+        if result.get('prompt_eval_count') and result.get('prompt_eval_duration'):
+            timings['prompt_tokens'] = result['prompt_eval_count']
+            timings['prompt_seconds'] = result['prompt_eval_duration'] / 1e9
+        if result.get('eval_count') and result.get('eval_duration'):
+            timings['output_tokens'] = result['eval_count']
+            timings['generation_seconds'] = result['eval_duration'] / 1e9
+        if result.get('load_duration'):
+            timings['load_seconds'] = result['load_duration'] / 1e9
+        report_metrics(**timings)
+
+    def parse_response(self, result: Dict[str, Any]) -> str:
+        self.report_timings(result)
+        return parse_ollama_response(result)
+
+    def parse_stream_line(self, line: str) -> Tuple[str, bool]:
+        chunk = json.loads(line)
+        if 'error' in chunk:
+            raise Exception(chunk['error'])
+        if chunk.get('done'):
+            self.report_timings(chunk)
+        return parse_ollama_chunk(chunk), bool(chunk.get('done'))
+
+
+@register_backend('openai', 'llamacpp', 'vllm')
+class OpenAICompatibleBackend(HTTPBackend):
+    """Local servers exposing /v1/chat/completions, such as llama.cpp's server or vLLM."""
+
+    label = "OpenAI-compatible"
+
+    def build_headers(self) -> Dict[str, str]:
+        api_key = self.config.get('api_key') or os.getenv('OPENAI_API_KEY', '')
+        return {'Authorization': f'Bearer {api_key}'} if api_key else {}
+
+    def build_payload(self, prompt: str, max_tokens: int, stream: bool) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": max_tokens,
+            "stream": stream
+        }
+
+    def parse_response(self, result: Dict[str, Any]) -> str:
+        try:
+            return result['choices'][0]['message']['content']
+        except (KeyError, IndexError, TypeError):
+            raise Exception(f"Unexpected OpenAI-compatible response format: {result}")
+
+    async def agenerate_batch(self, prompts: List[str], max_tokens: int) -> List[Union[str, Exception]]:
+        # /v1/completions takes a list of prompts and returns one choice per
+        # prompt; prompts are sent raw, without the chat template.
+        replica = self.select_replica(prompts[0], None)
+        url = replica.url.replace('/chat/completions', '/completions')
+        with self.replicas.track(replica):
             try:
-                model_name = self.config.get('model', 'gemini-2.5-flash')
-                response = self.client.models.generate_content(
-                    model=model_name,
-                    contents=prompt
+                response = await self.get_async_client().post(
+                    url,
+                    json={"model": self.model, "prompt": prompts, "max_tokens": max_tokens}
                 )
-                return response.text
+                response.raise_for_status()
+                result = response.json()
+                choices = sorted(result['choices'], key=lambda choice: choice.get('index', 0))
+                if len(choices) != len(prompts):
+                    raise Exception(f"Expected {len(prompts)} completions, got {len(choices)}")
+                texts = [choice['text'] for choice in choices]
             except Exception as e:
-                raise Exception(f"Gemini API error: {str(e)}")
-        
-        else:
+                if self.is_replica_failure(e):
+                    self.replicas.record_failure(replica)
+                raise self.wrap_error(e, url)
+        self.replicas.record_success(replica)
+        return texts
+
+    def parse_stream_line(self, line: str) -> Tuple[str, bool]:
+        if not line.startswith('data:'):
+            return '', False
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            return '', True
+        chunk = json.loads(data)
+        choices = chunk.get('choices') or [{}]
+        return (choices[0].get('delta') or {}).get('content') or '', False
+
+
+@register_backend('gemini')
+class GeminiBackend(Backend):
+    label = "Gemini"
+
+    def __init__(self, provider: 'BaseProvider'):
+        super().__init__(provider)
+        if not GEMINI_AVAILABLE:
+            raise Exception("google-genai package not installed. Install with: pip install google-genai")
+        api_key = self.config.get('api_key') or os.getenv('GEMINI_API_KEY', '')
+        if api_key:
+            os.environ['GEMINI_API_KEY'] = api_key
+        self.client = genai.Client()
+        self.model = self.config.get('model', 'gemini-2.5-flash')
+
+    def generate(self, prompt: str, max_tokens: int) -> str:
+        try:
+            response = self.client.models.generate_content(
+                model=self.model,
+                contents=prompt
+            )
+            return response.text
+        except Exception as e:
+            raise ProviderError(f"Gemini API error: {str(e)}")
+
+    async def agenerate(self, prompt: str, max_tokens: int, avoid: Optional[list] = None) -> str:
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=self.model,
+                contents=prompt
+            )
+            return response.text
+        except Exception as e:
+            raise ProviderError(f"Gemini API error: {str(e)}")
+
+    async def astream(self, prompt: str, max_tokens: int, avoid: Optional[list] = None) -> AsyncIterator[str]:
+        try:
+            stream = await self.client.aio.models.generate_content_stream(
+                model=self.model,
+                contents=prompt
+            )
+            async for chunk in stream:
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            raise ProviderError(f"Gemini API error: {str(e)}")
+
+
+@register_backend('fake')
+class FakeBackend(Backend):
+    """In-process backend for local development and load tests; never leaves the process."""
+
+    label = "Fake"
+
+    def __init__(self, provider: 'BaseProvider'):
+        super().__init__(provider)
+        self.response = self.config.get('response', "Fake {model} response to: {prompt}")
+        self.latency = self.config.get('latency', 0.0)
+        self.error = self.config.get('error')
+
+    def _render(self, prompt: str, max_tokens: int) -> str:
+        if self.error:
+            raise ProviderError(f"Fake API error: {self.error}")
+        words = self.response.format(model=self.model, prompt=prompt).split()
+        return " ".join(words[:max_tokens])
+
+    def generate(self, prompt: str, max_tokens: int) -> str:
+        time.sleep(self.latency)
+        return self._render(prompt, max_tokens)
+
+    async def agenerate(self, prompt: str, max_tokens: int, avoid: Optional[list] = None) -> str:
+        await asyncio.sleep(self.latency)
+        return self._render(prompt, max_tokens)
+
+    async def astream(self, prompt: str, max_tokens: int, avoid: Optional[list] = None) -> AsyncIterator[str]:
+        text = await self.agenerate(prompt, max_tokens)
+        for word in text.split(" "):
+            yield word + " "
+
+
+class BaseProvider:
+    default_model = 'llama3'
+    default_max_tokens = 4096
+    default_read_timeout = 120
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.provider = config.get('provider', 'ollama')
+        self.model = config.get('model', self.default_model)
+        self.endpoint = config.get('endpoint')
+        self.max_tokens = config.get('max_tokens', self.default_max_tokens)
+
+        if self.provider not in BACKENDS:
             raise Exception(f"Unsupported provider: {self.provider}")
+        self.backend = BACKENDS[self.provider](self)
+
+        hedging = config.get('hedging', {}) or {}
+        self.hedger = Hedger(hedging) if hedging.get('enabled') else None
+        self.hedge_provider: Optional['BaseProvider'] = None
+        self.breaker = CircuitBreaker(config.get('circuit_breaker'))
+        scheduling = config.get('scheduler', {}) or {}
+        self.scheduler = RequestScheduler(scheduling) if scheduling.get('enabled') else None
+        batching = config.get('batching', {}) or {}
+        self.batcher = MicroBatcher(batching, self._dispatch_batch) if batching.get('enabled') else None
+        # Called with (prompt, metrics) after each successful unbatched call.
+        self.observer: Optional[Callable[[str, Dict[str, float]], None]] = None
+        self.in_flight = 0
+        self.capacity = config.get('capacity', 4)
+
+    def check_circuit(self, probe: bool = True):
+        """Raises while the circuit is open. With `probe`, also takes the half-open probe slot if one is due;
+        the call must then report its outcome to the breaker."""
+        allowed = self.breaker.allow() if probe else not self.breaker.rejects()
+        if not allowed:
+            raise ProviderUnavailableError(
+                f"{self.backend.label} unavailable: circuit open for {self.model}, "
+                f"retrying in {self.breaker.retry_after():.0f}s"
+            )
+
+    def can_hedge(self) -> bool:
+        return self.hedger is not None and (self.hedge_provider is not None or self.backend.replica_count() > 1)
+
+    def generate(self, prompt: str, max_tokens: Optional[int] = None) -> str:
+        self.check_circuit()
+        metrics = {}
+        CALL_METRICS.set(metrics)
+        started = time.monotonic()
+        try:
+            result = self.backend.generate(prompt, max_tokens or self.max_tokens)
+        except ProviderError:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        latency = time.monotonic() - started
+        self.breaker.record_success(latency)
+        self.observe(prompt, metrics, latency=latency, queue_delay=0.0)
+        return result
+    
+    def observe(self, prompt: str, metrics: Dict[str, float], **values: float):
+        if self.observer is not None:
+            metrics.update(values)
+            self.observer(prompt, metrics)
+
+    def admit(self, priority: str, deadline: Optional[float]):
+        if self.scheduler is None:
+            return contextlib.nullcontext()
+        return self.scheduler.slot(priority, deadline)
+
+    async def _guarded(self, call: Callable[[], Awaitable[Tuple['BaseProvider', Any]]], priority: str,
+                       deadline: Optional[float], prompt: Optional[str] = None) -> Tuple['BaseProvider', Any]:
+        """Runs `call` in a scheduler slot behind the circuit breaker. `call` returns (answering provider, result)."""
+        queued = time.monotonic()
+        # Fail fast instead of queueing for a provider whose circuit is open.
+        self.check_circuit(probe=False)
+        async with self.admit(priority, deadline):
+            self.check_circuit()
+            metrics = {}
+            CALL_METRICS.set(metrics)
+            started = time.monotonic()
+            self.in_flight += 1
+            try:
+                answered_by, result = await call()
+            except ProviderError:
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                self.breaker.release()
+                raise
+            finally:
+                self.in_flight -= 1
+            if answered_by is not self:
+                # A hedge to another provider won; that provider recorded the call that answered.
+                self.breaker.release()
+                return answered_by, result
+            latency = time.monotonic() - started
+            self.breaker.record_success(latency)
+            if prompt is not None:
+                self.observe(prompt, metrics, latency=latency, queue_delay=started - queued)
+            return answered_by, result
+
+    async def agenerate(self, prompt: str, max_tokens: Optional[int] = None,
+                        priority: str = "balanced", deadline: Optional[float] = None) -> str:
+        max_tokens = max_tokens or self.max_tokens
+        if self.batcher is not None:
+            ANSWERED_BY.set(self)
+            return await self.batcher.submit(prompt, max_tokens, priority, deadline)
+        answered_by, response = await self._guarded(
+            lambda: self._agenerate(prompt, max_tokens, priority, deadline), priority, deadline, prompt
+        )
+        ANSWERED_BY.set(answered_by)
+        return response
+
+    async def _dispatch_batch(self, prompts: List[str], max_tokens: int, priority: str,
+                              deadline: Optional[float]) -> List[Union[str, Exception]]:
+        # A whole batch takes one scheduler slot and counts as one call for the circuit breaker.
+        async def call():
+            return self, await self.backend.agenerate_batch(prompts, max_tokens)
+        _, results = await self._guarded(call, priority, deadline)
+        return results
+
+    async def _agenerate(self, prompt: str, max_tokens: int, priority: str,
+                         deadline: Optional[float]) -> Tuple['BaseProvider', str]:
+        if not self.can_hedge():
+            return self, await self.backend.agenerate(prompt, max_tokens)
+
+        chosen = []
+
+        async def primary():
+            return self, await self.backend.agenerate(prompt, max_tokens, avoid=chosen)
+
+        async def backup():
+            if self.hedge_provider is None:
+                return self, await self.backend.agenerate(prompt, max_tokens, avoid=chosen)
+            # Through the target's own scheduler, circuit breaker and latency observer.
+            response = await self.hedge_provider.agenerate(prompt, priority=priority, deadline=deadline)
+            return ANSWERED_BY.get(), response
+
+        return await self.hedger.run(primary, backup)
+
+    async def astream(self, prompt: str, max_tokens: Optional[int] = None,
+                      priority: str = "balanced", deadline: Optional[float] = None) -> AsyncIterator[str]:
+        queued = time.monotonic()
+        ANSWERED_BY.set(self)
+        self.check_circuit(probe=False)
+        async with self.admit(priority, deadline):
+            self.check_circuit()
+            metrics = {}
+            CALL_METRICS.set(metrics)
+            started = time.monotonic()
+            first_token = None
+            chunks = 0
+            answered_by = self
+            self.in_flight += 1
+            try:
+                async for answered_by, token in self._astream(prompt, max_tokens or self.max_tokens, priority, deadline):
+                    if first_token is None:
+                        first_token = time.monotonic() - started
+                    chunks += 1
+                    # Set on every token: the consumer's context is only current while it pulls one.
+                    ANSWERED_BY.set(answered_by)
+                    yield token
+            except ProviderError:
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                self.breaker.release()
+                raise
+            finally:
+                self.in_flight -= 1
+            if answered_by is not self:
+                # A hedge to another provider won; that provider recorded the call that answered.
+                self.breaker.release()
+                return
+            latency = time.monotonic() - started
+            self.breaker.record_success(first_token if first_token is not None else latency)
+            if first_token is not None and 'output_tokens' not in metrics:
+                # Without server timings, count streamed chunks as generated tokens.
+                metrics.update(output_tokens=chunks, generation_seconds=latency - first_token)
+            self.observe(prompt, metrics, latency=latency, queue_delay=started - queued, ttft=first_token)
+
+    async def _astream(self, prompt: str, max_tokens: int, priority: str,
+                       deadline: Optional[float]) -> AsyncIterator[Tuple['BaseProvider', str]]:
+        """Yields (answering provider, token) pairs."""
+        if not self.can_hedge():
+            async for token in self.backend.astream(prompt, max_tokens):
+                yield self, token
+            return
+
+        chosen = []
+
+        async def primary():
+            async for token in self.backend.astream(prompt, max_tokens, avoid=chosen):
+                yield self, token
+
+        async def backup():
+            if self.hedge_provider is None:
+                async for token in self.backend.astream(prompt, max_tokens, avoid=chosen):
+                    yield self, token
+                return
+            # Through the target's own scheduler, circuit breaker and latency observer.
+            async for token in self.hedge_provider.astream(prompt, priority=priority, deadline=deadline):
+                yield ANSWERED_BY.get(), token
+
+        async for pair in self.hedger.run_stream(primary, backup):
+            yield pair
+
+    async def awarmup(self, timeout: float = 300) -> Dict[str, Any]:
+        return await self.backend.awarmup(timeout)
+
+    def load(self, service_time: float) -> ProviderLoad:
+        # Without a scheduler nothing queues here; requests past `capacity` wait on the model server instead.
+        if self.scheduler is not None:
+            return ProviderLoad(self.scheduler.in_flight, self.scheduler.queued(), self.scheduler.max_in_flight, service_time)
+        return ProviderLoad(self.in_flight, 0, self.capacity, service_time)
+
+    def health(self) -> Dict[str, Any]:
+        health = {
+            "provider": self.provider,
+            "model": self.model,
+            "circuit_breaker": self.breaker.stats()
+        }
+        if isinstance(self.backend, HTTPBackend):
+            health["replicas"] = self.backend.replicas.stats()
+        if self.hedger is not None:
+            health["hedging"] = self.hedger.stats()
+        if self.scheduler is not None:
+            health["scheduler"] = self.scheduler.stats()
+        if self.batcher is not None:
+            health["batching"] = self.batcher.stats()
+        return health
+
+    async def aclose(self):
+        await self.backend.aclose()
+
+
+class LLMProvider(BaseProvider):
+    default_model = 'llama3'
+    default_max_tokens = 4096
+    default_read_timeout = 120
+
 
+class SLMProvider(BaseProvider):
+    default_model = 'llama3.2'
+    default_max_tokens = 2048
+    default_read_timeout = 60
@@ -1,27 +1,282 @@
-import yaml
-from typing import Dict, Any, Optional
-from router import ModelRouter, RoutingDecision
-from models import LLMProvider, SLMProvider
+import asyncio
+import time
+from typing import Dict, Any, Optional, AsyncIterator, Tuple
+from router import ModelRouter, RoutingDecision, LATENCY_MODEL
+from models import LLMProvider, SLMProvider, ProviderConnectionError, ProviderUnavailableError, ANSWERED_BY
+from errors import ProviderOverloadedError, DeadlineExceededError
+from cache import build_cache, cache_key, can_read, can_write
+from semantic_cache import SemanticCache
+from coalescing import SingleFlight
+from telemetry import LatencyEstimator, ProviderLoad, OutcomeLog
+from knn_router import cheapest_acceptable
+from config_service import ConfigService, ConfigSnapshot, RESTART_SECTIONS
+
+# A full queue or a spent deadline is not cured by another tier: these skip the
+# fallbacks and reach the API with their type (HTTP 503 / 504).
+NO_FALLBACK_ERRORS = (ProviderOverloadedError, DeadlineExceededError)
+
+
+def chained_error(message: str, error: Exception) -> Exception:
+    """Error for a failed fallback chain that keeps the last error's type when the API has a status for it."""
+    if isinstance(error, (ProviderUnavailableError, DeadlineExceededError)):
+        return type(error)(message)
+    return Exception(message)
 
 
 class HybridOrchestrator:
     def __init__(self, config_path: str = "config.yaml"):
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
+        self.config_service = ConfigService(config_path)
+        self.config = self.config_service.config
         
-        self.router = ModelRouter(config_path)
+        self.router = ModelRouter(config_path, self.config_service.snapshot)
         self.llm = LLMProvider(self.config['models']['llm'])
         self.slm = SLMProvider(self.config['models']['slm'])
-        self.fallback_enabled = self.config['routing']['fallback_enabled']
         
         if 'gemini' in self.config['models']:
             self.gemini_fallback = LLMProvider(self.config['models']['gemini'])
         else:
             self.gemini_fallback = None
+        
+        providers = {"llm": self.llm, "slm": self.slm, "gemini": self.gemini_fallback}
+        for provider in providers.values():
+            if provider is None:
+                continue
+            target = (provider.config.get('hedging', {}) or {}).get('target', 'replica')
+            if target != 'replica':
+                if providers.get(target) is None:
+                    raise Exception(f"Hedging target '{target}' is not configured")
+                provider.hedge_provider = providers[target]
+        
+        self.response_cache = build_cache(self.config.get('cache', {}) or {})
+        semantic_config = self.config.get('semantic_cache', {}) or {}
+        self.semantic_cache = SemanticCache(semantic_config) if semantic_config.get('enabled') else None
+        self.flights = SingleFlight(self.config.get('coalescing', {}) or {})
+        
+        latency_config = self.config.get('latency_model', {}) or {}
+        self.latency_estimator = None
+        if latency_config.get('enabled', True):
+            self.latency_estimator = LatencyEstimator(latency_config)
+            self.router.latency_estimator = self.latency_estimator
+            for name, provider in providers.items():
+                if provider is not None:
+                    provider.observer = self._latency_observer(name)
+        
+        self.outcome_log = None
+        self._apply_orchestration_config(self.config)
+        self.config_service.subscribe(self.apply_config)
+    
+    def apply_config(self, snapshot: ConfigSnapshot):
+        """Switches routing and orchestration settings to a new snapshot; requests in flight keep their decisions."""
+        if set(snapshot.config['models']) != set(self.config['models']):
+            raise Exception("Adding or removing a model needs a restart")
+        stale = [section for section in RESTART_SECTIONS if snapshot.config.get(section) != self.config.get(section)]
+        self.router.apply_config(snapshot)
+        self._apply_orchestration_config(snapshot.config)
+        self.config = snapshot.config
+        if stale:
+            # The router already uses the new model costs; providers and caches were built at startup.
+            print(f"Config sections {', '.join(stale)} changed; provider, cache and server settings in them apply after a restart")
+    
+    def _apply_orchestration_config(self, config):
+        self.fallback_enabled = config['routing']['fallback_enabled']
+        self.router.load_source = self.load_snapshot if config['routing'].get('load_aware', True) else None
+        log_config = config.get('routing_log', {}) or {}
+        if not log_config.get('enabled', False):
+            self.outcome_log = None
+        elif self.outcome_log is None or self.outcome_log.path != log_config.get('path', 'routing_outcomes.jsonl'):
+            self.outcome_log = OutcomeLog(log_config)
+    
+    def load_snapshot(self) -> Dict[str, ProviderLoad]:
+        providers = {"llm": self.llm, "slm": self.slm, "gemini": self.gemini_fallback}
+        snapshot = {}
+        for name, provider in providers.items():
+            if provider is None:
+                continue
+            service_time = self.latency_estimator.service_time(name) if self.latency_estimator is not None else None
+            if service_time is None:
+                service_time = LATENCY_MODEL[name][0]
+            snapshot[name] = provider.load(service_time)
+        return snapshot
+    
+    def _answered(self, model_type: str) -> str:
+        """The tier whose answer the last async provider call returned: `model_type` unless a hedge to another tier won."""
+        answered_by = ANSWERED_BY.get()
+        for name, provider in (("llm", self.llm), ("slm", self.slm), ("gemini", self.gemini_fallback)):
+            if provider is not None and provider is answered_by:
+                return name
+        return model_type
+    
+    def _latency_observer(self, model_type: str):
+        def observe(prompt: str, metrics: Dict[str, float]):
+            self.latency_estimator.record(model_type, self.router.count_tokens(prompt, model_type), metrics)
+        return observe
+    
+    def _record_outcome(self, prompt: str, priority: str, decision: RoutingDecision, result: Dict[str, Any],
+                        started: float):
+        label = self._learn_outcome(prompt, priority, decision, result, started)
+        knn = self.router.knn
+        if knn is not None and label is not None:
+            knn.insert(knn.embed(prompt), label)
+    
+    async def _arecord_outcome(self, prompt: str, priority: str, decision: RoutingDecision, result: Dict[str, Any],
+                               started: float):
+        label = self._learn_outcome(prompt, priority, decision, result, started)
+        knn = self.router.knn
+        if knn is not None and label is not None:
+            knn.insert(await knn.aembed(prompt), label)
+    
+    def _learn_outcome(self, prompt: str, priority: str, decision: RoutingDecision, result: Dict[str, Any],
+                       started: float) -> Optional[str]:
+        """Updates the bandit and the outcome log; returns the label for the kNN index, if the outcome has one."""
+        latency = time.monotonic() - started
+        quality_rejected = decision.model_type == "slm" and (
+            (result.get("fallback_reason") or "").startswith("SLM response quality insufficient"))
+        if result["model_used"] != decision.model_type and not quality_rejected:
+            # The routed tier never answered (error, open circuit, unreachable backend), so the
+            # request says nothing about how well that tier handles the prompt.
+            return None
+        bandit = self.router.bandit
+        if bandit is not None:
+            # The routed tier is rewarded for its own answer: a rejected answer means it failed the
+            # request, and the fallback's latency and cost count against it.
+            arm = decision.model_type
+            quality_ok = not quality_rejected and self._check_response_quality(result["response"], prompt)
+            cost = decision.estimated_cost
+            if quality_rejected:
+                cost += self.router.estimate_cost(prompt, result["model_used"])
+            bandit.update(arm, self.router.bandit_context(prompt), bandit.reward(quality_ok, latency, cost))
+        # slm_ok is the training label: whether the SLM's own answer passed the quality check.
+        # Requests answered by the tier they were routed to other than the SLM carry no label.
+        if quality_rejected:
+            slm_ok = False
+        elif result["model_used"] == "slm":
+            slm_ok = self._check_response_quality(result["response"], prompt)
+        else:
+            slm_ok = None
+        if self.outcome_log is not None:
+            self.outcome_log.record(
+                prompt=prompt,
+                priority=priority,
+                routed_to=decision.model_type,
+                reason=decision.reason,
+                model_used=result["model_used"],
+                fallback_used=result["fallback_used"],
+                fallback_reason=result.get("fallback_reason"),
+                slm_ok=slm_ok,
+                latency=latency
+            )
+        return cheapest_acceptable(slm_ok, result["model_used"])
+    
+    def _cache_scope(self, decision: RoutingDecision, use_llm_fallback: bool) -> Optional[tuple]:
+        provider = {"llm": self.llm, "slm": self.slm, "gemini": self.gemini_fallback}.get(decision.model_type)
+        if provider is None:
+            return None
+        params = {"max_tokens": provider.max_tokens, "use_llm_fallback": use_llm_fallback}
+        return decision.model_type, provider.model, params
+    
+    def _cache_key(self, prompt: str, decision: RoutingDecision, use_llm_fallback: bool) -> Optional[str]:
+        if self.response_cache is None:
+            return None
+        scope = self._cache_scope(decision, use_llm_fallback)
+        return cache_key(prompt, *scope) if scope else None
+    
+    def _cache_value(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "response": result["response"],
+            "model_used": result["model_used"],
+            "fallback_used": result["fallback_used"],
+            "fallback_reason": result.get("fallback_reason")
+        }
+    
+    def _cache_lookup(self, key: Optional[str], decision: RoutingDecision, mode: Optional[str]) -> Optional[Dict[str, Any]]:
+        if key is None or not can_read(mode):
+            return None
+        cached = self.response_cache.get(key)
+        if cached is None:
+            return None
+        value, age = cached
+        return {**value, "decision": decision, "cache_hit": True, "cache_age": age}
+    
+    def _cache_store(self, key: Optional[str], result: Dict[str, Any], mode: Optional[str]):
+        if key is None or not can_write(mode):
+            return
+        self.response_cache.set(key, self._cache_value(result))
+    
+    async def _acache_lookup(self, key: Optional[str], decision: RoutingDecision,
+                             mode: Optional[str]) -> Optional[Dict[str, Any]]:
+        if key is None or not can_read(mode):
+            return None
+        cached = await self.response_cache.aget(key)
+        if cached is None:
+            return None
+        value, age = cached
+        return {**value, "decision": decision, "cache_hit": True, "cache_age": age}
+    
+    async def _acache_store(self, key: Optional[str], result: Dict[str, Any], mode: Optional[str]):
+        if key is None or not can_write(mode):
+            return
+        await self.response_cache.aset(key, self._cache_value(result))
     
-    def process(self, prompt: str, priority: str = "balanced", use_llm_fallback: bool = True) -> Dict[str, Any]:
+    def _flight_key(self, kind: str, prompt: str, priority: str, use_llm_fallback: bool,
+                    timeout: Optional[float], mode: Optional[str]) -> str:
+        # The leader's cache mode decides whether the shared result is stored, so only matching modes share.
+        return cache_key(prompt, kind, priority, {
+            "use_llm_fallback": use_llm_fallback,
+            "timeout": timeout,
+            "cache": mode or "read_write"
+        })
+    
+    def _semantic_scope(self, decision: RoutingDecision, use_llm_fallback: bool, mode: Optional[str]) -> Optional[str]:
+        if self.semantic_cache is None or not (can_read(mode) or can_write(mode)):
+            return None
+        scope = self._cache_scope(decision, use_llm_fallback)
+        return cache_key("", *scope) if scope else None
+    
+    def _semantic_lookup(self, scope: Optional[str], embedding, decision: RoutingDecision,
+                         mode: Optional[str]) -> Optional[Dict[str, Any]]:
+        if scope is None or embedding is None or not can_read(mode):
+            return None
+        cached = self.semantic_cache.get(scope, embedding)
+        if cached is None:
+            return None
+        value, age, similarity, matched_prompt = cached
+        return {
+            **value,
+            "decision": decision,
+            "cache_hit": True,
+            "cache_age": age,
+            "cache_similarity": similarity,
+            "cache_matched_prompt": matched_prompt
+        }
+    
+    def _semantic_store(self, scope: Optional[str], prompt: str, embedding, result: Dict[str, Any],
+                        mode: Optional[str]):
+        if scope is None or embedding is None or not can_write(mode):
+            return
+        self.semantic_cache.set(scope, prompt, embedding, self._cache_value(result))
+    
+    def process(self, prompt: str, priority: str = "balanced", use_llm_fallback: bool = True,
+                cache: Optional[str] = None) -> Dict[str, Any]:
         decision = self.router.route(prompt, priority)
+        key = self._cache_key(prompt, decision, use_llm_fallback)
+        cached = self._cache_lookup(key, decision, cache)
+        if cached is not None:
+            return cached
+        
+        scope = self._semantic_scope(decision, use_llm_fallback, cache)
+        embedding = self.semantic_cache.embed(prompt) if scope else None
+        cached = self._semantic_lookup(scope, embedding, decision, cache)
+        if cached is not None:
+            return cached
         
+        started = time.monotonic()
+        result = self._process(prompt, decision, use_llm_fallback)
+        self._record_outcome(prompt, priority, decision, result, started)
+        self._cache_store(key, result, cache)
+        self._semantic_store(scope, prompt, embedding, result, cache)
+        return result
+    
+    def _process(self, prompt: str, decision: RoutingDecision, use_llm_fallback: bool) -> Dict[str, Any]:
         try:
             if decision.model_type == "gemini":
                 if not self.gemini_fallback:
@@ -34,17 +289,18 @@ class HybridOrchestrator:
                     "fallback_used": False
                 }
             elif decision.model_type == "llm":
-                response = self._try_generate_with_fallback(self.llm, prompt, "LLM")
+                response, model_used, fallback_reason = self._try_generate_with_fallback(self.llm, prompt, "LLM")
                 return {
                     "response": response,
-                    "model_used": "llm",
+                    "model_used": model_used,
                     "decision": decision,
-                    "fallback_used": False
+                    "fallback_used": fallback_reason is not None,
+                    "fallback_reason": fallback_reason
                 }
             else:
-                response = self._try_generate_with_fallback(self.slm, prompt, "SLM")
+                response, model_used, fallback_reason = self._try_generate_with_fallback(self.slm, prompt, "SLM")
                 
-                if use_llm_fallback and self.fallback_enabled:
+                if fallback_reason is None and use_llm_fallback and self.fallback_enabled:
                     quality_check = self._check_response_quality(response, prompt)
                     if not quality_check:
                         if self.gemini_fallback:
@@ -56,10 +312,10 @@ class HybridOrchestrator:
                                 "fallback_used": True,
                                 "fallback_reason": "SLM response quality insufficient, using Gemini"
                             }
-                        response = self._try_generate_with_fallback(self.llm, prompt, "LLM")
+                        response, model_used, _ = self._try_generate_with_fallback(self.llm, prompt, "LLM")
                         return {
                             "response": response,
-                            "model_used": "llm",
+                            "model_used": model_used,
                             "decision": decision,
                             "fallback_used": True,
                             "fallback_reason": "SLM response quality insufficient"
@@ -67,9 +323,10 @@ class HybridOrchestrator:
                 
                 return {
                     "response": response,
-                    "model_used": "slm",
+                    "model_used": model_used,
                     "decision": decision,
-                    "fallback_used": False
+                    "fallback_used": fallback_reason is not None,
+                    "fallback_reason": fallback_reason
                 }
         
         except Exception as e:
@@ -84,10 +341,10 @@ class HybridOrchestrator:
                             "fallback_used": True,
                             "fallback_reason": f"SLM error: {str(e)}, using Gemini"
                         }
-                    response = self._try_generate_with_fallback(self.llm, prompt, "LLM")
+                    response, model_used, _ = self._try_generate_with_fallback(self.llm, prompt, "LLM")
                     return {
                         "response": response,
-                        "model_used": "llm",
+                        "model_used": model_used,
                         "decision": decision,
                         "fallback_used": True,
                         "fallback_reason": f"SLM error: {str(e)}"
@@ -109,33 +366,20 @@ class HybridOrchestrator:
             else:
                 raise e
     
-    def _try_generate_with_fallback(self, provider, prompt: str, model_name: str) -> str:
+    def _try_generate_with_fallback(self, provider, prompt: str, model_name: str) -> Tuple[str, str, Optional[str]]:
+        """Returns (response, model used, fallback reason); Gemini answers when the provider is unreachable or its circuit is open."""
         try:
-            return provider.generate(prompt)
-        except Exception as e:
-            error_str = str(e).lower()
-            if ("ollama" in error_str and "connection" in error_str) or ("connection error" in error_str):
-                if self.gemini_fallback:
-                    return self.gemini_fallback.generate(prompt)
-                else:
-                    raise Exception(f"{model_name} failed (Ollama not available) and Gemini fallback not configured")
-            raise e
+            return provider.generate(prompt), model_name.lower(), None
+        except (ProviderConnectionError, ProviderUnavailableError) as e:
+            if self.gemini_fallback:
+                return self.gemini_fallback.generate(prompt), "gemini", f"{model_name} error: {str(e)}, using Gemini"
+            raise type(e)(f"{model_name} failed ({provider.backend.label} not available: {str(e)}) and Gemini fallback not configured")
     
     def distill_and_process(self, prompt: str) -> Dict[str, Any]:
-        distillation_prompt = f"""You are a prompt optimizer. Your task is to refine and narrow down the following user prompt to make it more focused, clear, and effective for a large language model.
-
-Original prompt: {prompt}
-
-Provide a refined, concise version of this prompt that:
-1. Maintains the core intent
-2. Removes unnecessary details
-3. Clarifies any ambiguities
-4. Focuses on the key question or request
-
-Return only the refined prompt, nothing else."""
+        distillation_prompt = self._distillation_prompt(prompt)
         
         try:
-            refined_prompt = self._try_generate_with_fallback(self.slm, distillation_prompt, "SLM")
+            refined_prompt, _, _ = self._try_generate_with_fallback(self.slm, distillation_prompt, "SLM")
             
             if not refined_prompt or len(refined_prompt.strip()) < 10:
                 refined_prompt = prompt
@@ -146,8 +390,7 @@ Return only the refined prompt, nothing else."""
                 final_response = self.gemini_fallback.generate(refined_prompt)
                 model_used = "gemini"
             else:
-                final_response = self._try_generate_with_fallback(self.llm, refined_prompt, "LLM")
-                model_used = "llm"
+                final_response, model_used, _ = self._try_generate_with_fallback(self.llm, refined_prompt, "LLM")
             
             return {
                 "response": final_response,
@@ -172,6 +415,308 @@ Return only the refined prompt, nothing else."""
                     raise Exception(f"Distillation and fallback failed. Distillation: {str(e)}, Gemini: {str(gemini_error)}")
             raise Exception(f"Distillation failed: {str(e)}")
     
+    async def aprocess(self, prompt: str, priority: str = "balanced", use_llm_fallback: bool = True,
+                       timeout: Optional[float] = None, cache: Optional[str] = None) -> Dict[str, Any]:
+        decision = await self.router.aroute(prompt, priority)
+        key = self._cache_key(prompt, decision, use_llm_fallback)
+        cached = await self._acache_lookup(key, decision, cache)
+        if cached is not None:
+            return cached
+        
+        scope = self._semantic_scope(decision, use_llm_fallback, cache)
+        embedding = await self.semantic_cache.aembed(prompt) if scope else None
+        cached = self._semantic_lookup(scope, embedding, decision, cache)
+        if cached is not None:
+            return cached
+        
+        async def generate():
+            started = time.monotonic()
+            deadline = started + timeout if timeout else None
+            result = await self._aprocess(prompt, decision, use_llm_fallback, priority, deadline)
+            await self._arecord_outcome(prompt, priority, decision, result, started)
+            await self._acache_store(key, result, cache)
+            self._semantic_store(scope, prompt, embedding, result, cache)
+            return result
+        
+        flight_key = self._flight_key("process", prompt, priority, use_llm_fallback, timeout, cache)
+        result, shared = await self.flights.do(flight_key, generate)
+        return {**result, "coalesced": True} if shared else result
+    
+    async def _aprocess(self, prompt: str, decision: RoutingDecision, use_llm_fallback: bool,
+                        priority: str, deadline: Optional[float]) -> Dict[str, Any]:
+        try:
+            if decision.model_type == "gemini":
+                if not self.gemini_fallback:
+                    raise Exception("Gemini routing requested but Gemini not configured")
+                response = await self.gemini_fallback.agenerate(prompt, priority=priority, deadline=deadline)
+                return {
+                    "response": response,
+                    "model_used": self._answered("gemini"),
+                    "decision": decision,
+                    "fallback_used": False
+                }
+            elif decision.model_type == "llm":
+                response, model_used, fallback_reason = await self._atry_generate_with_fallback(
+                    self.llm, prompt, "LLM", priority, deadline
+                )
+                return {
+                    "response": response,
+                    "model_used": model_used,
+                    "decision": decision,
+                    "fallback_used": fallback_reason is not None,
+                    "fallback_reason": fallback_reason
+                }
+            else:
+                response, model_used, fallback_reason = await self._atry_generate_with_fallback(
+                    self.slm, prompt, "SLM", priority, deadline
+                )
+                
+                if fallback_reason is None and use_llm_fallback and self.fallback_enabled:
+                    quality_check = self._check_response_quality(response, prompt)
+                    if not quality_check:
+                        if self.gemini_fallback:
+                            response = await self.gemini_fallback.agenerate(prompt, priority=priority, deadline=deadline)
+                            return {
+                                "response": response,
+                                "model_used": self._answered("gemini"),
+                                "decision": decision,
+                                "fallback_used": True,
+                                "fallback_reason": "SLM response quality insufficient, using Gemini"
+                            }
+                        response, model_used, _ = await self._atry_generate_with_fallback(self.llm, prompt, "LLM", priority, deadline)
+                        return {
+                            "response": response,
+                            "model_used": model_used,
+                            "decision": decision,
+                            "fallback_used": True,
+                            "fallback_reason": "SLM response quality insufficient"
+                        }
+                
+                return {
+                    "response": response,
+                    "model_used": model_used,
+                    "decision": decision,
+                    "fallback_used": fallback_reason is not None,
+                    "fallback_reason": fallback_reason
+                }
+        
+        except NO_FALLBACK_ERRORS:
+            raise
+        except Exception as e:
+            if decision.model_type == "slm" and use_llm_fallback and self.fallback_enabled:
+                try:
+                    if self.gemini_fallback:
+                        response = await self.gemini_fallback.agenerate(prompt, priority=priority, deadline=deadline)
+                        return {
+                            "response": response,
+                            "model_used": self._answered("gemini"),
+                            "decision": decision,
+                            "fallback_used": True,
+                            "fallback_reason": f"SLM error: {str(e)}, using Gemini"
+                        }
+                    response, model_used, _ = await self._atry_generate_with_fallback(self.llm, prompt, "LLM", priority, deadline)
+                    return {
+                        "response": response,
+                        "model_used": model_used,
+                        "decision": decision,
+                        "fallback_used": True,
+                        "fallback_reason": f"SLM error: {str(e)}"
+                    }
+                except Exception as llm_error:
+                    raise chained_error(f"All models failed. SLM: {str(e)}, LLM/Gemini: {str(llm_error)}", llm_error)
+            elif decision.model_type == "llm" and self.gemini_fallback:
+                try:
+                    response = await self.gemini_fallback.agenerate(prompt, priority=priority, deadline=deadline)
+                    return {
+                        "response": response,
+                        "model_used": self._answered("gemini"),
+                        "decision": decision,
+                        "fallback_used": True,
+                        "fallback_reason": f"LLM error: {str(e)}, using Gemini"
+                    }
+                except Exception as gemini_error:
+                    raise chained_error(f"Both LLM and Gemini failed. LLM: {str(e)}, Gemini: {str(gemini_error)}", gemini_error)
+            else:
+                raise e
+    
+    async def astream_process(self, prompt: str, priority: str = "balanced", use_llm_fallback: bool = True,
+                              timeout: Optional[float] = None, cache: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        decision = await self.router.aroute(prompt, priority)
+        deadline = time.monotonic() + timeout if timeout else None
+        yield {"type": "decision", "decision": decision}
+        
+        key = self._cache_key(prompt, decision, use_llm_fallback)
+        cached = await self._acache_lookup(key, decision, cache)
+        scope = embedding = None
+        if cached is None:
+            scope = self._semantic_scope(decision, use_llm_fallback, cache)
+            embedding = await self.semantic_cache.aembed(prompt) if scope else None
+            cached = self._semantic_lookup(scope, embedding, decision, cache)
+        if cached is not None:
+            yield {"type": "token", "content": cached["response"]}
+            yield {
+                "type": "done",
+                "model_used": cached["model_used"],
+                "fallback_used": cached["fallback_used"],
+                "fallback_reason": cached["fallback_reason"],
+                "cache_hit": True,
+                "cache_age": cached["cache_age"],
+                "cache_similarity": cached.get("cache_similarity"),
+                "cache_matched_prompt": cached.get("cache_matched_prompt"),
+                "coalesced": False
+            }
+            return
+        
+        flight_key = self._flight_key("stream", prompt, priority, use_llm_fallback, timeout, cache)
+        flight = self.flights.stream(flight_key, lambda: self._astream(
+            prompt, decision, use_llm_fallback, priority, deadline, key, scope, embedding, cache
+        ))
+        async for event in flight:
+            if flight.shared and event["type"] == "done":
+                event = {**event, "coalesced": True}
+            yield event
+    
+    async def _astream(self, prompt: str, decision: RoutingDecision, use_llm_fallback: bool, priority: str,
+                       deadline: Optional[float], key: Optional[str], scope: Optional[str], embedding,
+                       cache: Optional[str]) -> AsyncIterator[Dict[str, Any]]:
+        started = time.monotonic()
+        if decision.model_type == "gemini":
+            if not self.gemini_fallback:
+                raise Exception("Gemini routing requested but Gemini not configured")
+            candidates = [("gemini", self.gemini_fallback)]
+        elif decision.model_type == "llm":
+            candidates = [("llm", self.llm)]
+            if self.gemini_fallback:
+                candidates.append(("gemini", self.gemini_fallback))
+        else:
+            candidates = [("slm", self.slm)]
+            if use_llm_fallback and self.fallback_enabled:
+                candidates.append(("gemini", self.gemini_fallback) if self.gemini_fallback else ("llm", self.llm))
+        
+        fallback_reason = None
+        errors = []
+        last_error = None
+        for index, (model_used, provider) in enumerate(candidates):
+            has_next = index + 1 < len(candidates)
+            suffix = ", using Gemini" if has_next and candidates[index + 1][0] == "gemini" else ""
+            chunks = []
+            try:
+                async for token in provider.astream(prompt, priority=priority, deadline=deadline):
+                    chunks.append(token)
+                    yield {"type": "token", "content": token}
+            except NO_FALLBACK_ERRORS:
+                raise
+            except Exception as e:
+                last_error = e
+                errors.append(f"{model_used.upper()}: {str(e)}")
+                if not has_next:
+                    break
+                fallback_reason = f"{model_used.upper()} error: {str(e)}{suffix}"
+                yield {"type": "fallback", "reason": fallback_reason}
+                continue
+            
+            if model_used == "slm" and has_next and not self._check_response_quality("".join(chunks), prompt):
+                fallback_reason = f"SLM response quality insufficient{suffix}"
+                yield {"type": "fallback", "reason": fallback_reason}
+                continue
+            
+            model_used = self._answered(model_used)
+            result = {
+                "response": "".join(chunks),
+                "model_used": model_used,
+                "fallback_used": index > 0,
+                "fallback_reason": fallback_reason
+            }
+            await self._arecord_outcome(prompt, priority, decision, result, started)
+            await self._acache_store(key, result, cache)
+            self._semantic_store(scope, prompt, embedding, result, cache)
+            yield {
+                "type": "done",
+                "model_used": model_used,
+                "fallback_used": index > 0,
+                "fallback_reason": fallback_reason,
+                "cache_hit": False,
+                "cache_age": None,
+                "cache_similarity": None,
+                "cache_matched_prompt": None,
+                "coalesced": False
+            }
+            return
+        
+        raise chained_error(f"All models failed. {', '.join(errors)}", last_error)
+    
+    async def _atry_generate_with_fallback(self, provider, prompt: str, model_name: str, priority: str = "balanced",
+                                           deadline: Optional[float] = None) -> Tuple[str, str, Optional[str]]:
+        try:
+            response = await provider.agenerate(prompt, priority=priority, deadline=deadline)
+            return response, self._answered(model_name.lower()), None
+        except ProviderOverloadedError:
+            raise
+        except (ProviderConnectionError, ProviderUnavailableError) as e:
+            if self.gemini_fallback:
+                response = await self.gemini_fallback.agenerate(prompt, priority=priority, deadline=deadline)
+                return response, self._answered("gemini"), f"{model_name} error: {str(e)}, using Gemini"
+            raise type(e)(f"{model_name} failed ({provider.backend.label} not available: {str(e)}) and Gemini fallback not configured")
+    
+    async def adistill_and_process(self, prompt: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        priority = "balanced"
+        deadline = time.monotonic() + timeout if timeout else None
+        distillation_prompt = self._distillation_prompt(prompt)
+        
+        try:
+            refined_prompt, _, _ = await self._atry_generate_with_fallback(self.slm, distillation_prompt, "SLM", priority, deadline)
+            
+            if not refined_prompt or len(refined_prompt.strip()) < 10:
+                refined_prompt = prompt
+            
+            refined_prompt = refined_prompt.strip()
+            
+            if self.gemini_fallback:
+                final_response = await self.gemini_fallback.agenerate(refined_prompt, priority=priority, deadline=deadline)
+                model_used = self._answered("gemini")
+            else:
+                final_response, model_used, _ = await self._atry_generate_with_fallback(
+                    self.llm, refined_prompt, "LLM", priority, deadline
+                )
+            
+            return {
+                "response": final_response,
+                "model_used": model_used,
+                "refined_prompt": refined_prompt,
+                "original_prompt": prompt,
+                "distillation_used": True
+            }
+        except NO_FALLBACK_ERRORS:
+            raise
+        except Exception as e:
+            if self.gemini_fallback:
+                try:
+                    final_response = await self.gemini_fallback.agenerate(prompt, priority=priority, deadline=deadline)
+                    return {
+                        "response": final_response,
+                        "model_used": self._answered("gemini"),
+                        "refined_prompt": prompt,
+                        "original_prompt": prompt,
+                        "distillation_used": False,
+                        "distillation_error": str(e)
+                    }
+                except Exception as gemini_error:
+                    raise Exception(f"Distillation and fallback failed. Distillation: {str(e)}, Gemini: {str(gemini_error)}")
+            raise Exception(f"Distillation failed: {str(e)}")
+    
+    def _distillation_prompt(self, prompt: str) -> str:
+        return f"""You are a prompt optimizer. Your task is to refine and narrow down the following user prompt to make it more focused, clear, and effective for a large language model.
+
+Original prompt: {prompt}
+
+Provide a refined, concise version of this prompt that:
+1. Maintains the core intent
+2. Removes unnecessary details
+3. Clarifies any ambiguities
+4. Focuses on the key question or request
+
+Return only the refined prompt, nothing else."""
+    
     def _check_response_quality(self, response: str, prompt: str) -> bool:
         if not response or len(response) < 10:
             return False
@@ -184,4 +729,77 @@ Return only the refined prompt, nothing else."""
         error_count = sum(1 for indicator in error_indicators if indicator in response_lower)
         
         return error_count < 2
-
+    
+    async def awarmup(self) -> Dict[str, Any]:
+        warmup = self.config.get('warmup', {}) or {}
+        timeout = warmup.get('timeout', 300)
+        providers = {"llm": self.llm, "slm": self.slm}
+        results = await asyncio.gather(*[provider.awarmup(timeout) for provider in providers.values()])
+        return dict(zip(providers.keys(), results))
+    
+    async def akeep_warm(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.awarmup()
+            except Exception as e:
+                print(f"Keep-warm ping failed: {str(e)}")
+    
+    async def amaintain_knn(self):
+        """Saves and retrains the kNN index in a worker thread every `routing.knn.save_interval` seconds."""
+        while True:
+            knn = self.router.knn
+            await asyncio.sleep(knn.save_interval if knn is not None else 60)
+            # The router may have switched to a new index while we slept.
+            knn = self.router.knn
+            if knn is None:
+                continue
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, knn.maintain)
+            except Exception as e:
+                print(f"kNN index maintenance failed: {str(e)}")
+    
+    async def amaintain_semantic_cache(self):
+        """Prunes and retrains the semantic cache indexes in a worker thread every `maintenance_interval` seconds."""
+        while True:
+            await asyncio.sleep(self.semantic_cache.maintenance_interval)
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.semantic_cache.maintain)
+            except Exception as e:
+                print(f"Semantic cache maintenance failed: {str(e)}")
+    
+    def health(self) -> Dict[str, Any]:
+        providers = {"llm": self.llm, "slm": self.slm, "gemini": self.gemini_fallback}
+        health = {name: provider.health() for name, provider in providers.items() if provider is not None}
+        if self.response_cache is not None:
+            health["response_cache"] = self.response_cache.stats()
+        if self.semantic_cache is not None:
+            health["semantic_cache"] = self.semantic_cache.stats()
+        health["coalescing"] = self.flights.stats()
+        health["config"] = self.config_service.stats()
+        if self.latency_estimator is not None:
+            health["latency_model"] = self.latency_estimator.stats()
+        if self.outcome_log is not None:
+            health["routing_log"] = self.outcome_log.stats()
+        if self.router.knn is not None:
+            health["knn_router"] = self.router.knn.stats()
+        if self.router.bandit is not None:
+            health["bandit"] = self.router.bandit.stats()
+        if self.router.classifier is not None:
+            health["learned_policy"] = {"threshold": self.router.classifier.threshold, **self.router.classifier.metadata}
+        if self.router.decision_cache is not None:
+            health["decision_cache"] = self.router.decision_cache.stats()
+        if self.router.routing_counter is not None or self.router.model_counters:
+            health["token_counts"] = self.router.token_cache.stats()
+        return health
+    
+    async def aclose(self):
+        for provider in (self.llm, self.slm, self.gemini_fallback):
+            if provider is not None:
+                await provider.aclose()
+        if self.response_cache is not None:
+            self.response_cache.close()
+        if self.semantic_cache is not None:
+            await self.semantic_cache.aclose()
+        if self.router.knn is not None:
+            await self.router.knn.aclose()
@@ -1,7 +1,30 @@
+import hashlib
+import math
 import re
-import yaml
-from typing import Dict, List, Optional
-from dataclasses import dataclass
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional, Union, Sequence, Callable, Tuple
+from dataclasses import dataclass, field
+from config_service import ConfigSnapshot, load_config
+from token_counting import TOKENS_PER_WORD, TokenCountCache, build_token_counter, heuristic_tokens
+from telemetry import LatencyEstimator, ProviderLoad
+from learned_router import LearnedRouter
+from bandit import ContextualBandit
+from knn_router import KnnRouter, LABELS
+
+COMPLEX_PATTERNS = ('analyze', 'explain', 'compare', 'evaluate', 'synthesize', 'create', 'design', 'develop')
+TECHNICAL_TERMS = ('algorithm', 'architecture', 'optimization', 'implementation', 'framework', 'protocol')
+# One scan finds both groups; group 1 is a complexity keyword, group 2 a technical term.
+# The lookahead on first letters lets the scan skip most word starts cheaply.
+FEATURE_PATTERN = re.compile(
+    rf"\b(?=[{''.join(sorted({w[0] for w in COMPLEX_PATTERNS + TECHNICAL_TERMS}))}])"
+    rf"(?:({'|'.join(COMPLEX_PATTERNS)})|({'|'.join(TECHNICAL_TERMS)}))\b",
+    re.IGNORECASE
+)
+LATENCY_MODEL = {"gemini": (1.0, 200), "llm": (2.0, 100), "slm": (0.5, 500)}
+BANDIT_CONTEXT_SIZE = 8
 
 
 @dataclass
@@ -11,66 +34,334 @@ class RoutingDecision:
     reason: str
     estimated_cost: float
     estimated_latency: float
+    config_version: str = ""
 
 
-class ModelRouter:
-    def __init__(self, config_path: str = "config.yaml"):
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
-        
-        self.complexity_threshold = self.config['routing']['complexity_threshold']
-        self.max_slm_tokens = self.config['routing']['max_slm_tokens']
-        self.large_input_threshold = self.config['routing'].get('large_input_threshold', 2000)
-        self.gemini_preferred_threshold = self.config['routing'].get('gemini_preferred_threshold', 1000)
-        self.fallback_enabled = self.config['routing']['fallback_enabled']
-        
-    def analyze_complexity(self, text: str) -> float:
+@dataclass(frozen=True)
+class PromptFeatures:
+    """Everything the router reads from a prompt, computed once per request."""
+    word_count: int
+    char_count: int
+    question_marks: int
+    complex_patterns: int
+    technical_terms: int
+    estimated_tokens: float
+    model_tokens: Dict[str, float] = field(default_factory=dict, compare=False)
+    text: str = field(default="", repr=False, compare=False)
+
+    @classmethod
+    def from_text(cls, text: str, estimated_tokens: Optional[float] = None,
+                  model_tokens: Optional[Dict[str, float]] = None) -> 'PromptFeatures':
         word_count = len(text.split())
-        char_count = len(text)
+        complex_patterns = 0
+        technical_terms = 0
+        for match in FEATURE_PATTERN.finditer(text):
+            if match.lastindex == 1:
+                complex_patterns += 1
+            else:
+                technical_terms += 1
+        return cls(
+            word_count=word_count,
+            char_count=len(text),
+            question_marks=text.count('?'),
+            complex_patterns=complex_patterns,
+            technical_terms=technical_terms,
+            estimated_tokens=word_count * TOKENS_PER_WORD if estimated_tokens is None else estimated_tokens,
+            model_tokens=model_tokens or {},
+            text=text
+        )
+
+
+Prompt = Union[str, PromptFeatures]
+LoadSnapshot = Dict[str, ProviderLoad]
+
+
+class DecisionCache:
+    """LRU of routing decisions keyed by a hash of the exact prompt, priority and config version.
+
+    The prompt is hashed as given, not normalized: complexity counts raw
+    characters, so prompts that differ only in whitespace can route differently.
+
+    Entries expire after `ttl_seconds` because decisions include queue waits
+    and learned latencies from the moment they were made. Spillover is applied
+    to cached decisions afresh on every request.
+    """
+
+    def __init__(self, config: Dict):
+        self.max_entries = config.get('max_entries', 10000)
+        self.ttl = config.get('ttl_seconds', 10)
+        self.entries: 'OrderedDict[tuple, Tuple[RoutingDecision, float]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str, priority: str, config_version: str) -> tuple:
+        digest = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        return digest, priority, config_version
+
+    def get(self, key: tuple) -> Optional[RoutingDecision]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or (self.ttl and time.monotonic() - entry[1] > self.ttl):
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: tuple, decision: RoutingDecision):
+        with self.lock:
+            self.entries[key] = (decision, time.monotonic())
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+
+class RoutingPolicy:
+    """The routing settings derived from one config snapshot, and the decisions made with them.
+
+    A policy is not changed after it is built: `ModelRouter.apply_config`
+    builds a new one and swaps it in with a single assignment, and every
+    decision runs start to finish on the policy it began with, whichever
+    thread it runs on. The learned components (token counts, decision cache,
+    classifier, kNN router, bandit) are handed from one policy to the next
+    when their config did not change.
+    """
+    
+    def __init__(self, router: 'ModelRouter', snapshot: ConfigSnapshot, token_cache: TokenCountCache,
+                 routing_counter, model_counters: Dict, decision_cache: Optional[DecisionCache],
+                 classifier: Optional[LearnedRouter], knn: Optional[KnnRouter], bandit: Optional[ContextualBandit]):
+        config = snapshot.config
+        routing = config['routing']
+        self.router = router
+        self.config_snapshot = snapshot
+        self.config = config
+        self.config_version = snapshot.version
+        self.complexity_threshold = routing['complexity_threshold']
+        self.max_slm_tokens = routing['max_slm_tokens']
+        self.large_input_threshold = routing.get('large_input_threshold', 2000)
+        self.gemini_preferred_threshold = routing.get('gemini_preferred_threshold', 1000)
+        self.fallback_enabled = routing['fallback_enabled']
+        self.token_cache = token_cache
+        self.routing_counter = routing_counter
+        self.model_counters = model_counters
+        self.spillover = routing.get('spillover') or []
+        self.decision_cache = decision_cache
+        self.classifier = classifier
+        self.knn = knn
+        self.bandit = bandit
+    
+    @property
+    def latency_estimator(self) -> Optional[LatencyEstimator]:
+        return self.router.latency_estimator
+    
+    @property
+    def load_source(self) -> Optional[Callable[[], LoadSnapshot]]:
+        return self.router.load_source
+    
+    def features(self, text: Prompt) -> PromptFeatures:
+        if isinstance(text, PromptFeatures):
+            return text
+        if self.routing_counter is None and not self.model_counters:
+            return PromptFeatures.from_text(text)
+        estimated_tokens = None
+        if self.routing_counter is not None:
+            estimated_tokens = self.token_cache.count("routing", self.routing_counter, text)
+        model_tokens = {name: self.token_cache.count(name, counter, text) for name, counter in self.model_counters.items()}
+        return PromptFeatures.from_text(text, estimated_tokens, model_tokens)
         
-        question_marks = text.count('?')
-        complex_patterns = len(re.findall(r'\b(analyze|explain|compare|evaluate|synthesize|create|design|develop)\b', text, re.IGNORECASE))
-        technical_terms = len(re.findall(r'\b(algorithm|architecture|optimization|implementation|framework|protocol)\b', text, re.IGNORECASE))
+    def analyze_complexity(self, text: Prompt) -> float:
+        features = self.features(text)
         
         complexity_score = 0.0
-        complexity_score += min(word_count / 100, 0.3)
-        complexity_score += min(char_count / 500, 0.2)
-        complexity_score += min(question_marks * 0.1, 0.2)
-        complexity_score += min(complex_patterns * 0.15, 0.2)
-        complexity_score += min(technical_terms * 0.1, 0.1)
+        complexity_score += min(features.word_count / 100, 0.3)
+        complexity_score += min(features.char_count / 500, 0.2)
+        complexity_score += min(features.question_marks * 0.1, 0.2)
+        complexity_score += min(features.complex_patterns * 0.15, 0.2)
+        complexity_score += min(features.technical_terms * 0.1, 0.1)
         
         return min(complexity_score, 1.0)
     
-    def estimate_tokens(self, text: str) -> float:
-        return len(text.split()) * 1.3
+    def count_tokens(self, text: str, model_type: Optional[str] = None) -> float:
+        """Token count of raw text as the router would estimate it for `model_type`, without other features."""
+        if model_type in self.model_counters:
+            return self.token_cache.count(model_type, self.model_counters[model_type], text)
+        if self.routing_counter is not None:
+            return self.token_cache.count("routing", self.routing_counter, text)
+        return heuristic_tokens(text)
+    
+    def estimate_tokens(self, text: Prompt, model_type: Optional[str] = None) -> float:
+        features = self.features(text)
+        if model_type is None:
+            return features.estimated_tokens
+        return features.model_tokens.get(model_type, features.estimated_tokens)
     
-    def estimate_cost(self, text: str, model_type: str) -> float:
-        tokens = self.estimate_tokens(text)
+    def estimate_cost(self, text: Prompt, model_type: str) -> float:
+        tokens = self.estimate_tokens(text, model_type)
         if model_type == 'gemini' and 'gemini' in self.config['models']:
             cost_per_token = self.config['models']['gemini']['cost_per_token']
         else:
             cost_per_token = self.config['models'][model_type]['cost_per_token']
         return tokens * cost_per_token
     
-    def estimate_latency(self, text: str, model_type: str) -> float:
-        tokens = self.estimate_tokens(text)
-        
-        if model_type == 'gemini':
-            base_latency = 1.0
-            token_latency = tokens / 200
-        elif model_type == 'llm':
-            base_latency = 2.0
-            token_latency = tokens / 100
+    def estimate_latency(self, text: Prompt, model_type: str, load: Optional[LoadSnapshot] = None) -> float:
+        tokens = self.estimate_tokens(text, model_type)
+        latency = None
+        if self.latency_estimator is not None:
+            latency = self.latency_estimator.estimate(model_type, tokens)
+        if latency is None:
+            base_latency, tokens_per_second = LATENCY_MODEL.get(model_type, LATENCY_MODEL["slm"])
+            latency = base_latency + tokens / tokens_per_second
+        if load is not None and model_type in load:
+            latency = latency + load[model_type].expected_wait()
+        return latency
+    
+    def load_snapshot(self) -> Optional[LoadSnapshot]:
+        return self.load_source() if self.load_source is not None else None
+    
+    def apply_spillover(self, decision: RoutingDecision, text: Prompt, load: Optional[LoadSnapshot]) -> RoutingDecision:
+        """Moves the decision to another tier while its expected queue wait exceeds a spillover rule's limit."""
+        if not load or not self.spillover:
+            return decision
+        visited = {decision.model_type}
+        while True:
+            for rule in self.spillover:
+                source, target = rule['from'], rule['to']
+                if decision.model_type != source or target in visited or source not in load or target not in load:
+                    continue
+                wait = load[source].expected_wait()
+                limit = rule.get('max_queue_wait_ms', 0) / 1000
+                if wait <= limit or load[target].expected_wait() >= wait:
+                    continue
+                decision = RoutingDecision(
+                    model_type=target,
+                    confidence=decision.confidence,
+                    reason=f"{decision.reason}; spilled over to {target.upper()} ({source.upper()} queue wait {wait:.1f}s > {limit:.1f}s)",
+                    estimated_cost=self.estimate_cost(text, target),
+                    estimated_latency=self.estimate_latency(text, target, load),
+                    config_version=decision.config_version
+                )
+                visited.add(target)
+                break
+            else:
+                return decision
+    
+    def bandit_context(self, text: Prompt) -> np.ndarray:
+        features = self.features(text)
+        slm_probability = 0.0
+        if self.classifier is not None and features.text:
+            slm_probability = self.classifier.predict(features.text)
+        return np.array([
+            1.0,
+            math.log1p(features.word_count) / 5,
+            self.analyze_complexity(features),
+            min(features.question_marks, 5) / 5,
+            min(features.complex_patterns, 5) / 5,
+            min(features.technical_terms, 5) / 5,
+            min(features.estimated_tokens / self.large_input_threshold, 1.0),
+            slm_probability
+        ])
+    
+    def bandit_arms(self, text: PromptFeatures) -> List[str]:
+        return [arm for arm in self.bandit.arms
+                if arm in self.config['models'] and not (arm == "slm" and text.word_count > self.max_slm_tokens)]
+    
+    def bandit_decision(self, text: PromptFeatures, load: Optional[LoadSnapshot]) -> RoutingDecision:
+        model_type, score, explored = self.bandit.choose(self.bandit_context(text), self.bandit_arms(text))
+        if explored:
+            reason = f"Bandit exploration: trying {model_type.upper()}"
         else:
-            base_latency = 0.5
-            token_latency = tokens / 500
-        
-        return base_latency + token_latency
+            reason = f"Bandit ({self.bandit.algorithm}): {model_type.upper()} has the best expected reward ({score:.2f})"
+        return RoutingDecision(
+            model_type=model_type,
+            confidence=0.5 if explored else 0.8,
+            reason=reason,
+            estimated_cost=self.estimate_cost(text, model_type),
+            estimated_latency=self.estimate_latency(text, model_type, load),
+            config_version=self.config_version
+        )
+    
+    def knn_decision(self, text: PromptFeatures, load: Optional[LoadSnapshot],
+                     embed: Optional[Callable[[str], Optional[np.ndarray]]] = None) -> Optional[RoutingDecision]:
+        allowed = [label for label in LABELS
+                   if label in self.config['models'] and not (label == "slm" and text.word_count > self.max_slm_tokens)]
+        vote = self.knn.vote((embed or self.knn.embed)(text.text), allowed)
+        if vote is None:
+            return None
+        model_type, share, neighbours = vote
+        return RoutingDecision(
+            model_type=model_type,
+            confidence=share,
+            reason=f"kNN router: {share:.0%} of the vote from {neighbours} similar prompts went to {model_type.upper()}",
+            estimated_cost=self.estimate_cost(text, model_type),
+            estimated_latency=self.estimate_latency(text, model_type, load),
+            config_version=self.config_version
+        )
+    
+    def route(self, text: Prompt, priority: str = "balanced") -> RoutingDecision:
+        load = self.load_snapshot()
+        key, decision = self._cached_decision(text, priority)
+        if decision is not None:
+            return self.apply_spillover(decision, text, load)
+        return self._decide(self.features(text), priority, load, key)
     
-    def route(self, text: str, priority: str = "balanced") -> RoutingDecision:
+    async def aroute(self, text: Prompt, priority: str = "balanced") -> RoutingDecision:
+        """`route` for the event loop: the kNN router's embedding is fetched with the embedder's async client."""
+        load = self.load_snapshot()
+        key, decision = self._cached_decision(text, priority)
+        if decision is not None:
+            return self.apply_spillover(decision, text, load)
+        features = self.features(text)
+        embed = None
+        knn = self.knn
+        if knn is not None and features.text:
+            embedding = await knn.aembed(features.text)
+            embed = lambda _: embedding
+        return self._decide(features, priority, load, key, embed)
+    
+    def _cached_decision(self, text: Prompt, priority: str) -> Tuple[Optional[tuple], Optional[RoutingDecision]]:
+        # Prompts passed as PromptFeatures have already paid for extraction, which is most of the
+        # cost a cache hit saves. Bandit decisions are sampled per request, so they are never reused.
+        if (self.decision_cache is None or not isinstance(text, str)
+                or (self.bandit is not None and self.bandit.enabled)):
+            return None, None
+        key = DecisionCache.key(text, priority, self.config_version)
+        return key, self.decision_cache.get(key)
+    
+    def _decide(self, features: PromptFeatures, priority: str, load: Optional[LoadSnapshot], key: Optional[tuple],
+                embed: Optional[Callable[[str], Optional[np.ndarray]]] = None) -> RoutingDecision:
+        decision = self._route(features, priority, load, embed)
+        decision.config_version = self.config_version
+        if key is not None:
+            self.decision_cache.set(key, decision)
+        return self.apply_spillover(decision, features, load)
+    
+    def _route(self, text: PromptFeatures, priority: str, load: Optional[LoadSnapshot],
+               embed: Optional[Callable[[str], Optional[np.ndarray]]] = None) -> RoutingDecision:
         complexity = self.analyze_complexity(text)
-        word_count = len(text.split())
-        estimated_tokens = self.estimate_tokens(text)
+        word_count = text.word_count
+        estimated_tokens = text.estimated_tokens
         gemini_available = 'gemini' in self.config['models']
         
         if estimated_tokens >= self.large_input_threshold and gemini_available:
@@ -79,7 +370,7 @@ class ModelRouter:
                 confidence=0.95,
                 reason=f"Very large input ({estimated_tokens:.0f} tokens) - routing to Gemini for speed and reliability",
                 estimated_cost=self.estimate_cost(text, "gemini"),
-                estimated_latency=self.estimate_latency(text, "gemini")
+                estimated_latency=self.estimate_latency(text, "gemini", load)
             )
         
         if priority == "cost":
@@ -89,7 +380,7 @@ class ModelRouter:
                     confidence=0.8,
                     reason="Low complexity task, cost-optimized",
                     estimated_cost=self.estimate_cost(text, "slm"),
-                    estimated_latency=self.estimate_latency(text, "slm")
+                    estimated_latency=self.estimate_latency(text, "slm", load)
                 )
         
         if priority == "speed":
@@ -99,7 +390,7 @@ class ModelRouter:
                     confidence=0.9,
                     reason=f"Large input ({estimated_tokens:.0f} tokens) - Gemini preferred for speed",
                     estimated_cost=self.estimate_cost(text, "gemini"),
-                    estimated_latency=self.estimate_latency(text, "gemini")
+                    estimated_latency=self.estimate_latency(text, "gemini", load)
                 )
             if complexity < 0.7:
                 return RoutingDecision(
@@ -107,9 +398,43 @@ class ModelRouter:
                     confidence=0.75,
                     reason="Simple task, speed-optimized",
                     estimated_cost=self.estimate_cost(text, "slm"),
-                    estimated_latency=self.estimate_latency(text, "slm")
+                    estimated_latency=self.estimate_latency(text, "slm", load)
                 )
         
+        if self.bandit is not None and self.bandit.enabled:
+            return self.bandit_decision(text, load)
+        
+        if self.knn is not None and text.text:
+            decision = self.knn_decision(text, load, embed)
+            if decision is not None:
+                return decision
+        
+        if self.classifier is not None and text.text and word_count <= self.max_slm_tokens:
+            slm_probability = self.classifier.predict(text.text)
+            if slm_probability >= self.classifier.threshold:
+                return RoutingDecision(
+                    model_type="slm",
+                    confidence=slm_probability,
+                    reason=f"Learned router: SLM expected to suffice (p={slm_probability:.2f})",
+                    estimated_cost=self.estimate_cost(text, "slm"),
+                    estimated_latency=self.estimate_latency(text, "slm", load)
+                )
+            if estimated_tokens >= self.gemini_preferred_threshold and gemini_available:
+                return RoutingDecision(
+                    model_type="gemini",
+                    confidence=1 - slm_probability,
+                    reason=f"Learned router: SLM unlikely to suffice (p={slm_probability:.2f}), large input ({estimated_tokens:.0f} tokens) - Gemini preferred",
+                    estimated_cost=self.estimate_cost(text, "gemini"),
+                    estimated_latency=self.estimate_latency(text, "gemini", load)
+                )
+            return RoutingDecision(
+                model_type="llm",
+                confidence=1 - slm_probability,
+                reason=f"Learned router: SLM unlikely to suffice (p={slm_probability:.2f})",
+                estimated_cost=self.estimate_cost(text, "llm"),
+                estimated_latency=self.estimate_latency(text, "llm", load)
+            )
+        
         if complexity > self.complexity_threshold or word_count > self.max_slm_tokens:
             if estimated_tokens >= self.gemini_preferred_threshold and gemini_available:
                 return RoutingDecision(
@@ -117,14 +442,14 @@ class ModelRouter:
                     confidence=0.9,
                     reason=f"High complexity ({complexity:.2f}) and large input ({estimated_tokens:.0f} tokens) - Gemini preferred",
                     estimated_cost=self.estimate_cost(text, "gemini"),
-                    estimated_latency=self.estimate_latency(text, "gemini")
+                    estimated_latency=self.estimate_latency(text, "gemini", load)
                 )
             return RoutingDecision(
                 model_type="llm",
                 confidence=0.9,
                 reason=f"High complexity ({complexity:.2f}) or long input",
                 estimated_cost=self.estimate_cost(text, "llm"),
-                estimated_latency=self.estimate_latency(text, "llm")
+                estimated_latency=self.estimate_latency(text, "llm", load)
             )
         
         cost_weight = self.config['routing']['cost_weight']
@@ -133,15 +458,15 @@ class ModelRouter:
         
         llm_cost = self.estimate_cost(text, "llm")
         slm_cost = self.estimate_cost(text, "slm")
-        llm_latency = self.estimate_latency(text, "llm")
-        slm_latency = self.estimate_latency(text, "slm")
+        llm_latency = self.estimate_latency(text, "llm", load)
+        slm_latency = self.estimate_latency(text, "slm", load)
         
         gemini_score = 0.0
         gemini_cost = 0.0
         gemini_latency = 0.0
         if gemini_available and estimated_tokens >= self.gemini_preferred_threshold:
             gemini_cost = self.estimate_cost(text, "gemini")
-            gemini_latency = self.estimate_latency(text, "gemini")
+            gemini_latency = self.estimate_latency(text, "gemini", load)
             gemini_quality_score = min(complexity * 1.3, 1.0)
             gemini_score = (cost_weight * (1 - gemini_cost * 100)) + (latency_weight * (1 - gemini_latency / 10)) + (quality_weight * gemini_quality_score)
         
@@ -177,3 +502,306 @@ class ModelRouter:
             estimated_latency=llm_latency
         )
 
+
+    def route_many(self, prompts: Sequence[Prompt], priorities: Union[str, Sequence[str]] = "balanced") -> List[RoutingDecision]:
+        """Routes a batch of prompts; returns exactly what `route` would for each one.
+
+        Features are extracted per prompt, then complexity, estimates, scores and
+        the decision tree are evaluated as array operations over the batch.
+        Bandit decisions are sampled, so they match `route` only in distribution.
+        """
+        features = [self.features(prompt) for prompt in prompts]
+        load = self.load_snapshot()
+        n = len(features)
+        if n == 0:
+            return []
+        if isinstance(priorities, str):
+            priorities = [priorities] * n
+        elif len(priorities) != n:
+            raise ValueError("prompts and priorities must have the same length")
+        priority = np.array(priorities, dtype=object)
+        
+        columns = np.array(
+            [(f.word_count, f.char_count, f.question_marks, f.complex_patterns, f.technical_terms, f.estimated_tokens)
+             for f in features],
+            dtype=np.float64
+        ).T
+        word_count, char_count, question_marks, complex_patterns, technical_terms, tokens = columns
+        
+        complexity = np.minimum(word_count / 100, 0.3)
+        complexity = complexity + np.minimum(char_count / 500, 0.2)
+        complexity = complexity + np.minimum(question_marks * 0.1, 0.2)
+        complexity = complexity + np.minimum(complex_patterns * 0.15, 0.2)
+        complexity = complexity + np.minimum(technical_terms * 0.1, 0.1)
+        complexity = np.minimum(complexity, 1.0)
+        
+        gemini_available = 'gemini' in self.config['models']
+        models = ("gemini", "llm", "slm") if gemini_available else ("llm", "slm")
+        model_tokens = {
+            m: np.array([f.model_tokens.get(m, f.estimated_tokens) for f in features], dtype=np.float64)
+            if m in self.model_counters else tokens
+            for m in models
+        }
+        cost = {m: model_tokens[m] * self.config['models'][m]['cost_per_token'] for m in models}
+        latency = {}
+        for m in models:
+            learned = None
+            if self.latency_estimator is not None:
+                learned = self.latency_estimator.estimate_many(m, model_tokens[m])
+            latency[m] = learned if learned is not None else LATENCY_MODEL[m][0] + model_tokens[m] / LATENCY_MODEL[m][1]
+            if load is not None and m in load:
+                latency[m] = latency[m] + load[m].expected_wait()
+        
+        # Branch codes mirror the return statements of `route`, in order.
+        (LARGE, COST_SLM, SPEED_GEMINI, SPEED_SLM, BANDIT, KNN, LEARNED_SLM, LEARNED_GEMINI, LEARNED_LLM,
+         COMPLEX_GEMINI, COMPLEX_LLM, BAL_GEMINI, BAL_SLM, BAL_LLM) = range(14)
+        branch = np.full(n, -1)
+        decisions: List[Optional[RoutingDecision]] = [None] * n
+        
+        def assign(code, mask):
+            mask = mask & (branch < 0)
+            branch[mask] = code
+        
+        large = tokens >= self.gemini_preferred_threshold
+        if gemini_available:
+            assign(LARGE, tokens >= self.large_input_threshold)
+        assign(COST_SLM, (priority == "cost") & (complexity < 0.8) & (word_count < self.max_slm_tokens))
+        speed = priority == "speed"
+        if gemini_available:
+            assign(SPEED_GEMINI, speed & large)
+        assign(SPEED_SLM, speed & (complexity < 0.7))
+        if self.bandit is not None and self.bandit.enabled:
+            for i in np.flatnonzero(branch < 0).tolist():
+                decisions[i] = self.bandit_decision(features[i], load)
+            branch[branch < 0] = BANDIT
+        if self.knn is not None:
+            for i in np.flatnonzero(branch < 0).tolist():
+                if features[i].text:
+                    decisions[i] = self.knn_decision(features[i], load)
+                    if decisions[i] is not None:
+                        branch[i] = KNN
+        slm_probability = np.zeros(n)
+        if self.classifier is not None:
+            learned = (branch < 0) & (word_count <= self.max_slm_tokens) & np.array([bool(f.text) for f in features])
+            for i in np.flatnonzero(learned).tolist():
+                slm_probability[i] = self.classifier.predict(features[i].text)
+            slm_sufficient = slm_probability >= self.classifier.threshold
+            assign(LEARNED_SLM, learned & slm_sufficient)
+            if gemini_available:
+                assign(LEARNED_GEMINI, learned & large)
+            assign(LEARNED_LLM, learned)
+        complex_or_long = (complexity > self.complexity_threshold) | (word_count > self.max_slm_tokens)
+        if gemini_available:
+            assign(COMPLEX_GEMINI, complex_or_long & large)
+        assign(COMPLEX_LLM, complex_or_long)
+        
+        scores = {}
+        if (branch < 0).any():
+            cost_weight = self.config['routing']['cost_weight']
+            latency_weight = self.config['routing']['latency_weight']
+            quality_weight = self.config['routing']['quality_weight']
+            quality = {
+                "gemini": np.minimum(complexity * 1.3, 1.0),
+                "llm": np.minimum(complexity * 1.2, 1.0),
+                "slm": np.maximum(0.5, 1.0 - complexity * 0.5)
+            }
+            for m in models:
+                scores[m] = (cost_weight * (1 - cost[m] * 100)) + (latency_weight * (1 - latency[m] / 10)) + (quality_weight * quality[m])
+            if gemini_available:
+                gemini_score = np.where(large, scores["gemini"], 0.0)
+                scores["gemini"] = gemini_score
+                assign(BAL_GEMINI, (gemini_score > 0) & (gemini_score >= np.maximum(scores["llm"], scores["slm"])))
+            assign(BAL_SLM, (scores["slm"] > scores["llm"]) & (complexity < 0.7))
+            assign(BAL_LLM, np.ones(n, dtype=bool))
+        
+        # Decisions are built per branch with plain Python lists, which is much
+        # cheaper than indexing arrays element by element.
+        reasons = {
+            LARGE: ("gemini", 0.95, lambda i: f"Very large input ({tokens[i]:.0f} tokens) - routing to Gemini for speed and reliability"),
+            COST_SLM: ("slm", 0.8, lambda i: "Low complexity task, cost-optimized"),
+            SPEED_GEMINI: ("gemini", 0.9, lambda i: f"Large input ({tokens[i]:.0f} tokens) - Gemini preferred for speed"),
+            SPEED_SLM: ("slm", 0.75, lambda i: "Simple task, speed-optimized"),
+            LEARNED_SLM: ("slm", slm_probability, lambda i: f"Learned router: SLM expected to suffice (p={probability[i]:.2f})"),
+            LEARNED_GEMINI: ("gemini", 1 - slm_probability, lambda i: f"Learned router: SLM unlikely to suffice (p={probability[i]:.2f}), large input ({tokens[i]:.0f} tokens) - Gemini preferred"),
+            LEARNED_LLM: ("llm", 1 - slm_probability, lambda i: f"Learned router: SLM unlikely to suffice (p={probability[i]:.2f})"),
+            COMPLEX_GEMINI: ("gemini", 0.9, lambda i: f"High complexity ({complexity[i]:.2f}) and large input ({tokens[i]:.0f} tokens) - Gemini preferred"),
+            COMPLEX_LLM: ("llm", 0.9, lambda i: f"High complexity ({complexity[i]:.2f}) or long input"),
+            BAL_GEMINI: ("gemini", 0.85, lambda i: f"Gemini preferred for reliability and speed (score: {scores['gemini'][i]:.2f}, {tokens[i]:.0f} tokens)"),
+            BAL_SLM: ("slm", 0.7, lambda i: f"Balanced decision: SLM preferred (score: {scores['slm'][i]:.2f})"),
+            BAL_LLM: ("llm", 0.85, lambda i: f"Balanced decision: LLM preferred (score: {scores['llm'][i]:.2f})")
+        }
+        codes = branch
+        tokens = tokens.tolist()
+        complexity = complexity.tolist()
+        scores = {m: values.tolist() for m, values in scores.items()}
+        probability = slm_probability.tolist()
+        for code, (model_type, confidence, reason) in reasons.items():
+            indices = np.flatnonzero(codes == code)
+            if len(indices) == 0:
+                continue
+            model_cost = cost[model_type][indices].tolist()
+            model_latency = latency[model_type][indices].tolist()
+            if isinstance(confidence, np.ndarray):
+                confidences = confidence[indices].tolist()
+            else:
+                confidences = [confidence] * len(indices)
+            for i, conf, estimated_cost, estimated_latency in zip(indices.tolist(), confidences, model_cost, model_latency):
+                decisions[i] = RoutingDecision(model_type, conf, reason(i), estimated_cost, estimated_latency,
+                                               self.config_version)
+        if load and self.spillover:
+            decisions = [self.apply_spillover(decision, f, load) for decision, f in zip(decisions, features)]
+        return decisions
+
+
+class ModelRouter:
+    """Routes prompts with the current RoutingPolicy and switches policies when the config changes."""
+    
+    def __init__(self, config_path: str = "config.yaml", config: Optional[ConfigSnapshot] = None):
+        self.policy: Optional[RoutingPolicy] = None
+        # Set by the orchestrator when observed latencies should replace the constants in LATENCY_MODEL
+        # and when live provider load should be taken into account.
+        self.latency_estimator: Optional[LatencyEstimator] = None
+        self.load_source: Optional[Callable[[], LoadSnapshot]] = None
+        self.apply_config(config or load_config(config_path))
+    
+    def apply_config(self, snapshot: ConfigSnapshot):
+        """Switches to a config snapshot.
+
+        Everything is built before anything is replaced, so a failure leaves the
+        router on its previous config. Components whose config block did not
+        change are kept, with what they have learned. The new policy replaces
+        the old one in a single assignment, so a decision in progress on
+        another thread finishes on the settings it started with.
+        """
+        config = snapshot.config
+        routing = config['routing']
+        current = self.policy
+        previous = current.config if current is not None else None
+        
+        def unchanged(*keys):
+            if previous is None:
+                return False
+            old, new = previous, config
+            for key in keys:
+                old, new = (old or {}).get(key), (new or {}).get(key)
+            return old == new
+        
+        # Tokenizers are loaded on first use; the word heuristic needs none.
+        tokenizers_unchanged = unchanged('routing', 'tokenizer') and all(
+            unchanged('models', name, 'tokenizer') for name in set(config['models']) | set(previous['models'])
+        ) if previous is not None else False
+        if tokenizers_unchanged:
+            token_cache, routing_counter, model_counters = current.token_cache, current.routing_counter, current.model_counters
+        else:
+            token_cache = TokenCountCache(routing.get('token_cache_size', 4096))
+            routing_counter = build_token_counter(routing.get('tokenizer'))
+            model_counters = {}
+            for name, model_config in config['models'].items():
+                counter = build_token_counter(model_config.get('tokenizer'))
+                if counter is not None:
+                    model_counters[name] = counter
+        
+        decision_cache_config = routing.get('decision_cache') or {}
+        if unchanged('routing', 'decision_cache') and current.decision_cache is not None:
+            decision_cache = current.decision_cache
+            decision_cache.invalidate()
+        else:
+            decision_cache = DecisionCache(decision_cache_config) if decision_cache_config.get('enabled', True) else None
+        
+        learned_config = routing.get('learned_policy') or {}
+        classifier = current.classifier if current is not None else None
+        if not unchanged('routing', 'learned_policy'):
+            classifier = None
+            if learned_config.get('enabled', False):
+                try:
+                    classifier = LearnedRouter.load(learned_config.get('model_path', 'routing_model.npz'),
+                                                    learned_config.get('threshold'))
+                except Exception as e:
+                    print(f"Learned routing model unavailable, using rule-based routing: {str(e)}")
+        
+        knn_config = routing.get('knn') or {}
+        knn = current.knn if current is not None else None
+        if not unchanged('routing', 'knn'):
+            # Write out pending inserts first so a replacement index at the same path includes them.
+            if current is not None and current.knn is not None:
+                current.knn.save()
+            knn = KnnRouter(knn_config) if knn_config.get('enabled', False) else None
+        
+        bandit_config = routing.get('bandit')
+        bandit = current.bandit if current is not None else None
+        if not unchanged('routing', 'bandit') or not unchanged('models'):
+            bandit = None
+            if bandit_config is not None:
+                default_arms = [m for m in ("slm", "llm", "gemini") if m in config['models']]
+                bandit = ContextualBandit(bandit_config, bandit_config.get('arms', default_arms), BANDIT_CONTEXT_SIZE)
+                if current is not None and current.bandit is not None:
+                    bandit.adopt(current.bandit)
+        
+        self.policy = RoutingPolicy(self, snapshot, token_cache, routing_counter, model_counters,
+                                    decision_cache, classifier, knn, bandit)
+    
+    # Each call reads `policy` once, so it runs on a single snapshot throughout.
+    
+    def route(self, text: Prompt, priority: str = "balanced") -> RoutingDecision:
+        return self.policy.route(text, priority)
+    
+    async def aroute(self, text: Prompt, priority: str = "balanced") -> RoutingDecision:
+        return await self.policy.aroute(text, priority)
+    
+    def route_many(self, prompts: Sequence[Prompt], priorities: Union[str, Sequence[str]] = "balanced") -> List[RoutingDecision]:
+        return self.policy.route_many(prompts, priorities)
+    
+    def features(self, text: Prompt) -> PromptFeatures:
+        return self.policy.features(text)
+    
+    def analyze_complexity(self, text: Prompt) -> float:
+        return self.policy.analyze_complexity(text)
+    
+    def count_tokens(self, text: str, model_type: Optional[str] = None) -> float:
+        return self.policy.count_tokens(text, model_type)
+    
+    def estimate_cost(self, text: Prompt, model_type: str) -> float:
+        return self.policy.estimate_cost(text, model_type)
+    
+    def bandit_context(self, text: Prompt) -> np.ndarray:
+        return self.policy.bandit_context(text)
+    
+    @property
+    def config_snapshot(self) -> ConfigSnapshot:
+        return self.policy.config_snapshot
+    
+    @property
+    def config(self):
+        return self.policy.config
+    
+    @property
+    def config_version(self) -> str:
+        return self.policy.config_version
+    
+    @property
+    def token_cache(self) -> TokenCountCache:
+        return self.policy.token_cache
+    
+    @property
+    def routing_counter(self):
+        return self.policy.routing_counter
+    
+    @property
+    def model_counters(self) -> Dict:
+        return self.policy.model_counters
+    
+    @property
+    def decision_cache(self) -> Optional[DecisionCache]:
+        return self.policy.decision_cache
+    
+    @property
+    def classifier(self) -> Optional[LearnedRouter]:
+        return self.policy.classifier
+    
+    @property
+    def knn(self) -> Optional[KnnRouter]:
+        return self.policy.knn
+    
+    @property
+    def bandit(self) -> Optional[ContextualBandit]:
+        return self.policy.bandit
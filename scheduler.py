@@ -0,0 +1,126 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+
+from errors import ProviderOverloadedError, DeadlineExceededError
+
+PRIORITY_LANES = ("speed", "balanced", "cost")
+DEFAULT_LANE_WEIGHTS = {"speed": 4, "balanced": 2, "cost": 1}
+
+
+class RequestScheduler:
+    """Caps in-flight generations for one provider and queues the rest.
+
+    Waiting requests sit in one lane per priority. Lanes are served by smooth
+    weighted round robin, so speed requests go first without starving cost
+    requests. Requests whose deadline has already passed are dropped when they
+    reach the head of the queue instead of being sent to the model.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.max_in_flight = config.get('max_in_flight', 4)
+        self.max_queue = config.get('max_queue', 64)
+        self.queue_timeout = config.get('queue_timeout', 30.0)
+        weights = {**DEFAULT_LANE_WEIGHTS, **(config.get('lane_weights') or {})}
+        self.lane_weights = {lane: weights[lane] for lane in PRIORITY_LANES}
+        self.lanes = {lane: deque() for lane in PRIORITY_LANES}
+        self.lane_credit = {lane: 0 for lane in PRIORITY_LANES}
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+
+    def queued(self) -> int:
+        return sum(len(lane) for lane in self.lanes.values())
+
+    def deadline_for(self, timeout: Optional[float]) -> float:
+        return time.monotonic() + (timeout if timeout is not None else self.queue_timeout)
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "balanced", deadline: Optional[float] = None):
+        await self.acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: str = "balanced", deadline: Optional[float] = None):
+        lane = priority if priority in self.lanes else "balanced"
+        if deadline is None:
+            deadline = self.deadline_for(None)
+        if time.monotonic() >= deadline:
+            self.expired += 1
+            raise DeadlineExceededError("Request deadline passed before it was scheduled")
+
+        if self.in_flight < self.max_in_flight and self.queued() == 0:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+
+        if self.queued() >= self.max_queue:
+            self.rejected += 1
+            raise ProviderOverloadedError(f"Provider queue is full ({self.max_queue} waiting)")
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (deadline, waiter)
+        self.lanes[lane].append(entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=max(0.0, deadline - time.monotonic()))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                # The slot was granted just as we gave up on it; hand it on.
+                self.release()
+            else:
+                waiter.cancel()
+                try:
+                    self.lanes[lane].remove(entry)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                self.expired += 1
+                raise DeadlineExceededError("Request deadline passed while waiting in the provider queue")
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _next_lane(self) -> Optional[str]:
+        active = [lane for lane in PRIORITY_LANES if self.lanes[lane]]
+        if not active:
+            return None
+        total = sum(self.lane_weights[lane] for lane in active)
+        for lane in active:
+            self.lane_credit[lane] += self.lane_weights[lane]
+        chosen = max(active, key=lambda lane: self.lane_credit[lane])
+        self.lane_credit[chosen] -= total
+        return chosen
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self.in_flight < self.max_in_flight:
+            lane = self._next_lane()
+            if lane is None:
+                return
+            deadline, waiter = self.lanes[lane].popleft()
+            if waiter.done():
+                continue
+            if deadline <= now:
+                self.expired += 1
+                waiter.set_exception(DeadlineExceededError("Request deadline passed while waiting in the provider queue"))
+                continue
+            self.in_flight += 1
+            self.admitted += 1
+            waiter.set_result(True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": {lane: len(self.lanes[lane]) for lane in PRIORITY_LANES},
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "expired": self.expired
+        }
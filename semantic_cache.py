@@ -0,0 +1,253 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple, Type, Callable
+
+import httpx
+import numpy as np
+import requests
+
+from cache import normalize_prompt
+from vector_index import ClusteredIndex
+
+EMBEDDERS: Dict[str, Type['Embedder']] = {}
+
+
+def register_embedder(*names: str) -> Callable[[Type['Embedder']], Type['Embedder']]:
+    def decorator(cls: Type['Embedder']) -> Type['Embedder']:
+        for name in names:
+            EMBEDDERS[name] = cls
+        return cls
+    return decorator
+
+
+class Embedder:
+    """Turns a prompt into a vector. Subclasses implement `embed`; `aembed` defaults to it."""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+
+    def embed(self, text: str) -> np.ndarray:
+        raise NotImplementedError
+
+    async def aembed(self, text: str) -> np.ndarray:
+        return self.embed(text)
+
+    async def aclose(self):
+        pass
+
+
+@register_embedder('ollama')
+class OllamaEmbedder(Embedder):
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.model = config.get('model', 'nomic-embed-text')
+        self.endpoint = config.get('endpoint', 'http://localhost:11434/api/embeddings')
+        self.timeout = config.get('timeout', 10.0)
+        self.session = requests.Session()
+        self._async_client = None
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(timeout=self.timeout)
+        return self._async_client
+
+    def payload(self, text: str) -> Dict[str, Any]:
+        return {"model": self.model, "prompt": text}
+
+    def embed(self, text: str) -> np.ndarray:
+        response = self.session.post(self.endpoint, json=self.payload(text), timeout=self.timeout)
+        response.raise_for_status()
+        return np.asarray(response.json()['embedding'], dtype=np.float32)
+
+    async def aembed(self, text: str) -> np.ndarray:
+        response = await self.async_client.post(self.endpoint, json=self.payload(text))
+        response.raise_for_status()
+        return np.asarray(response.json()['embedding'], dtype=np.float32)
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self.session.close()
+
+
+@register_embedder('hashing')
+class HashingEmbedder(Embedder):
+    """Character n-gram feature hashing. Needs no model; catches reworded punctuation and casing, not paraphrases."""
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.dimensions = config.get('dimensions', 512)
+        self.ngram = config.get('ngram', 3)
+
+    def embed(self, text: str) -> np.ndarray:
+        text = f" {text.lower()} "
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for i in range(max(1, len(text) - self.ngram + 1)):
+            digest = hashlib.blake2b(text[i:i + self.ngram].encode('utf-8'), digest_size=8).digest()
+            bucket = int.from_bytes(digest, 'little')
+            vector[bucket % self.dimensions] += 1.0 if bucket >> 63 else -1.0
+        return vector
+
+
+def build_embedder(config: Dict[str, Any]) -> Embedder:
+    provider = config.get('provider', 'ollama')
+    if provider not in EMBEDDERS:
+        raise Exception(f"Unsupported embedder: {provider}")
+    return EMBEDDERS[provider](config)
+
+
+class SemanticCache:
+    """Returns a cached answer for prompts whose embedding is close to one seen before.
+
+    Entries are grouped by scope (routed model and generation parameters), so a
+    match is only served for the same model and settings. A match needs cosine
+    similarity of at least `threshold`.
+
+    Each scope has a ClusteredIndex of entry ids; the entries live in one dict
+    in insertion order, so expiry and the `max_entries` cap drop the oldest
+    from the front without touching any index. Lookups skip ids whose entry is
+    gone. `maintain` removes them from the indexes and retrains a scope's
+    clusters once it has grown `retrain_growth` times since they were trained.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.threshold = config.get('threshold', 0.92)
+        self.ttl = config.get('ttl_seconds', 3600)
+        self.max_entries = config.get('max_entries', 50000)
+        self.candidates = config.get('candidates', 8)
+        self.embedder = build_embedder(config.get('embedder', {}) or {})
+        self.index_options = {
+            "nlist": config.get('nlist', 256),
+            "nprobe": config.get('nprobe', 8),
+            "approximate_above": config.get('approximate_above', 20000)
+        }
+        self.maintenance_interval = config.get('maintenance_interval', 60)
+        self.retrain_growth = config.get('retrain_growth', 2.0)
+        self.scopes: Dict[str, ClusteredIndex] = {}
+        self.live: Dict[str, int] = {}
+        # Entry id -> (scope, prompt, value, created_at), oldest first.
+        self.entries: 'OrderedDict[int, Tuple[str, str, Dict[str, Any], float]]' = OrderedDict()
+        self.next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.embed_errors = 0
+        self.rebuilds = 0
+        self.lock = threading.Lock()
+        # Serializes maintain(); lookups and inserts only wait on `lock` for the final swap.
+        self.maintenance_lock = threading.Lock()
+
+    def embed(self, prompt: str) -> Optional[np.ndarray]:
+        try:
+            return self.embedder.embed(normalize_prompt(prompt))
+        except Exception:
+            self.embed_errors += 1
+            return None
+
+    async def aembed(self, prompt: str) -> Optional[np.ndarray]:
+        try:
+            return await self.embedder.aembed(normalize_prompt(prompt))
+        except Exception:
+            self.embed_errors += 1
+            return None
+
+    def _drop_oldest(self):
+        _, (scope, _, _, _) = self.entries.popitem(last=False)
+        self.live[scope] -= 1
+        if not self.live[scope]:
+            del self.scopes[scope]
+            del self.live[scope]
+
+    def _expire(self):
+        if not self.ttl:
+            return
+        cutoff = time.time() - self.ttl
+        while self.entries and next(iter(self.entries.values()))[3] < cutoff:
+            self._drop_oldest()
+
+    def get(self, scope: str, embedding: np.ndarray) -> Optional[Tuple[Dict[str, Any], float, float, str]]:
+        """Returns (value, age, similarity, matched prompt) for the closest live match above the threshold."""
+        with self.lock:
+            self._expire()
+            index = self.scopes.get(scope)
+            if index is not None:
+                scores, ids = index.search(embedding, self.candidates)
+                for similarity, entry_id in zip(scores.tolist(), ids.tolist()):
+                    if similarity < self.threshold:
+                        break
+                    entry = self.entries.get(entry_id)
+                    if entry is None:
+                        continue
+                    _, prompt, value, created_at = entry
+                    self.hits += 1
+                    return value, time.time() - created_at, similarity, prompt
+            self.misses += 1
+            return None
+
+    def set(self, scope: str, prompt: str, embedding: np.ndarray, value: Dict[str, Any]):
+        with self.lock:
+            if scope not in self.scopes:
+                self.scopes[scope] = ClusteredIndex(embedding.shape[0], **self.index_options)
+                self.live[scope] = 0
+            entry_id = self.next_id
+            self.next_id += 1
+            self.scopes[scope].add(embedding, [entry_id])
+            self.entries[entry_id] = (scope, prompt, value, time.time())
+            self.live[scope] += 1
+            self._expire()
+            while len(self.entries) > self.max_entries:
+                self._drop_oldest()
+
+    def maintain(self):
+        """Rebuilds each scope index that has outgrown its clusters or holds more dropped ids than a quarter.
+
+        The work runs on snapshots without holding `lock`, so call it from a
+        worker thread; inserts that arrive meanwhile are carried over when a
+        rebuilt index is swapped in.
+        """
+        with self.maintenance_lock:
+            with self.lock:
+                self._expire()
+                due = [(scope, index, index.snapshot()) for scope, index in self.scopes.items()
+                       if index.needs_training(self.retrain_growth) or 4 * (index.size - self.live[scope]) > index.size]
+                if not due:
+                    return
+                live_ids = np.fromiter(self.entries.keys(), dtype=np.int64, count=len(self.entries))
+            for scope, index, fresh in due:
+                seen = [buffer.size for buffer in fresh.buffers]
+                fresh.retrain(keep=lambda ids: np.isin(ids, live_ids), train=fresh.needs_training(self.retrain_growth))
+                with self.lock:
+                    if self.scopes.get(scope) is not index:
+                        continue
+                    for buffer, start in zip(index.buffers, seen):
+                        if buffer.size > start:
+                            fresh.add(buffer.vectors[start:buffer.size], buffer.ids[start:buffer.size])
+                    self.scopes[scope] = fresh
+                    self.rebuilds += 1
+
+    def clear(self):
+        with self.lock:
+            self.scopes.clear()
+            self.live.clear()
+            self.entries.clear()
+
+    async def aclose(self):
+        await self.embedder.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "scopes": len(self.scopes),
+                "indexed": sum(index.size for index in self.scopes.values()),
+                "approximate_scopes": sum(1 for index in self.scopes.values() if index.centroids is not None),
+                "hits": self.hits,
+                "misses": self.misses,
+                "embed_errors": self.embed_errors,
+                "rebuilds": self.rebuilds,
+                "threshold": self.threshold
+            }
@@ -0,0 +1,197 @@
+import bisect
+import contextvars
+import json
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List, Tuple
+
+import numpy as np
+
+DEFAULT_BUCKET_EDGES = (128, 512, 2048, 8192)
+
+# Metrics of the provider call in progress. BaseProvider sets a fresh dict per
+# call; backends add server-side timings to it with `report_metrics`.
+CALL_METRICS: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar('call_metrics', default=None)
+
+
+def report_metrics(**values: float):
+    metrics = CALL_METRICS.get()
+    if metrics is not None:
+        metrics.update(values)
+
+
+@dataclass
+class ProviderLoad:
+    """Live load of one provider, as seen by the router."""
+    in_flight: int
+    queued: int
+    capacity: int
+    service_time: float
+
+    def expected_wait(self) -> float:
+        """Seconds a new request would wait for a free slot, assuming slots free up every service_time / capacity."""
+        waiting = self.queued + max(0, self.in_flight - self.capacity)
+        if waiting == 0 and self.in_flight < self.capacity:
+            return 0.0
+        return (waiting + 1) / self.capacity * self.service_time
+
+
+class EWMA:
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.value = 0.0
+        self.count = 0
+
+    def update(self, sample: float):
+        self.value = sample if self.count == 0 else self.alpha * sample + (1 - self.alpha) * self.value
+        self.count += 1
+
+
+class ModelTelemetry:
+    """EWMAs of one model's observed timings for one input-size bucket."""
+
+    SERIES = ("latency", "queue_delay", "ttft", "input_tokens", "output_tokens", "prompt_tps", "generation_tps")
+
+    def __init__(self, alpha: float):
+        self.series = {name: EWMA(alpha) for name in self.SERIES}
+
+    def update(self, name: str, sample: Optional[float]):
+        if sample is not None:
+            self.series[name].update(sample)
+
+    def get(self, name: str) -> Optional[float]:
+        series = self.series[name]
+        return series.value if series.count else None
+
+    @property
+    def samples(self) -> int:
+        return self.series["latency"].count
+
+    def stats(self) -> Dict[str, Any]:
+        summary = {"samples": self.samples}
+        for name in self.SERIES:
+            value = self.get(name)
+            summary[name] = round(value, 4) if value is not None else None
+        return summary
+
+
+class LatencyEstimator:
+    """Learns per-model latency from completed calls, bucketed by input size.
+
+    Each call reports its end-to-end latency, queueing delay and, where the
+    backend provides them, time to first token and prompt/generation
+    throughput. `estimate` returns the bucket's smoothed latency (queueing
+    excluded; the router adds live queue delay separately), shifted by the
+    prompt-processing time for the difference between the request's input
+    size and the bucket's mean. A bucket with fewer than
+    `min_samples` calls borrows from the nearest bucket that has enough; with
+    no such bucket the estimate is None and the router keeps its built-in
+    constants.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.alpha = config.get('alpha', 0.2)
+        self.min_samples = config.get('min_samples', 5)
+        self.bucket_edges = list(config.get('bucket_edges', DEFAULT_BUCKET_EDGES))
+        self.models: Dict[str, List[ModelTelemetry]] = {}
+        self.service: Dict[str, EWMA] = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, input_tokens: float) -> int:
+        return bisect.bisect_right(self.bucket_edges, input_tokens)
+
+    def record(self, model_type: str, input_tokens: float, metrics: Dict[str, float]):
+        latency = metrics.get('latency')
+        if latency is None:
+            return
+        prompt_tps = None
+        if metrics.get('prompt_tokens') and metrics.get('prompt_seconds'):
+            prompt_tps = metrics['prompt_tokens'] / metrics['prompt_seconds']
+        generation_tps = None
+        if metrics.get('output_tokens') and metrics.get('generation_seconds'):
+            generation_tps = metrics['output_tokens'] / metrics['generation_seconds']
+        with self.lock:
+            buckets = self.models.setdefault(
+                model_type, [ModelTelemetry(self.alpha) for _ in range(len(self.bucket_edges) + 1)]
+            )
+            self.service.setdefault(model_type, EWMA(self.alpha)).update(latency)
+            telemetry = buckets[self.bucket(input_tokens)]
+            telemetry.update("latency", latency)
+            telemetry.update("queue_delay", metrics.get('queue_delay', 0.0))
+            telemetry.update("ttft", metrics.get('ttft'))
+            telemetry.update("input_tokens", input_tokens)
+            telemetry.update("output_tokens", metrics.get('output_tokens'))
+            telemetry.update("prompt_tps", prompt_tps)
+            telemetry.update("generation_tps", generation_tps)
+
+    def _table(self, model_type: str) -> Optional[np.ndarray]:
+        """Per bucket: [base seconds, mean input tokens, prompt tokens/s (0 if unknown)], after borrowing."""
+        with self.lock:
+            buckets = self.models.get(model_type)
+            if buckets is None:
+                return None
+            rows = [
+                (t.get("latency"), t.get("input_tokens"), t.get("prompt_tps") or 0.0)
+                if t.samples >= self.min_samples else None
+                for t in buckets
+            ]
+        ready = [i for i, row in enumerate(rows) if row is not None]
+        if not ready:
+            return None
+        return np.array([rows[min(ready, key=lambda j: (abs(j - i), j))] for i in range(len(rows))], dtype=np.float64)
+
+    def service_time(self, model_type: str) -> Optional[float]:
+        """Smoothed latency of the model's recent calls, regardless of input size."""
+        with self.lock:
+            service = self.service.get(model_type)
+            return service.value if service is not None and service.count >= self.min_samples else None
+
+    def estimate(self, model_type: str, input_tokens: float) -> Optional[float]:
+        table = self._table(model_type)
+        if table is None:
+            return None
+        return float(self._evaluate(table, np.array([input_tokens], dtype=np.float64))[0])
+
+    def estimate_many(self, model_type: str, input_tokens: np.ndarray) -> Optional[np.ndarray]:
+        table = self._table(model_type)
+        if table is None:
+            return None
+        return self._evaluate(table, input_tokens)
+
+    def _evaluate(self, table: np.ndarray, input_tokens: np.ndarray) -> np.ndarray:
+        base, mean_tokens, prompt_tps = table[np.searchsorted(self.bucket_edges, input_tokens, side='right')].T
+        shift = np.divide(input_tokens - mean_tokens, prompt_tps, out=np.zeros_like(base), where=prompt_tps > 0)
+        return np.maximum(base + shift, 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            labels = self.bucket_labels()
+            return {
+                model: {label: t.stats() for label, t in zip(labels, buckets) if t.samples}
+                for model, buckets in self.models.items()
+            }
+
+    def bucket_labels(self) -> List[str]:
+        edges: List[Tuple[int, Optional[int]]] = list(zip([0] + self.bucket_edges, self.bucket_edges + [None]))
+        return [f"{low}+" if high is None else f"{low}-{high}" for low, high in edges]
+
+
+class OutcomeLog:
+    """Appends one JSON line per completed request; `train_router.py` learns the routing classifier from it."""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.path = config.get('path', 'routing_outcomes.jsonl')
+        self.records = 0
+        self.lock = threading.Lock()
+
+    def record(self, **fields: Any):
+        line = json.dumps({"ts": time.time(), **fields}, ensure_ascii=False)
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+            self.records += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": self.path, "records": self.records}
@@ -0,0 +1,67 @@
+import asyncio
+
+import httpx
+import yaml
+
+import api
+from orchestrator import HybridOrchestrator
+
+
+def fake_model(name: str) -> dict:
+    return {
+        "provider": "fake",
+        "model": name,
+        "latency": 1.0,
+        "cost_per_token": 0.0,
+        "scheduler": {"enabled": True, "max_in_flight": 1, "max_queue": 1}
+    }
+
+
+def build_orchestrator(tmp_path) -> HybridOrchestrator:
+    config = {
+        "models": {"llm": fake_model("fake-llm"), "slm": fake_model("fake-slm")},
+        "routing": {
+            "complexity_threshold": 0.6,
+            "max_slm_tokens": 500,
+            "fallback_enabled": True,
+            "cost_weight": 0.3,
+            "latency_weight": 0.3,
+            "quality_weight": 0.4,
+            "load_aware": False,
+            "decision_cache": {"enabled": False}
+        },
+        "cache": {"enabled": False},
+        "coalescing": {"enabled": False},
+        "latency_model": {"enabled": False}
+    }
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.safe_dump(config))
+    return HybridOrchestrator(str(path))
+
+
+def test_full_queue_and_expired_deadline_map_to_503_and_504(tmp_path, monkeypatch):
+    orchestrator = build_orchestrator(tmp_path)
+    monkeypatch.setattr(api, "orchestrator", orchestrator)
+    body = {"prompt": "Say hello to the team", "priority": "cost", "timeout": 0.3}
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # One request holds the only SLM slot, one waits in the queue past
+            # its deadline and one finds the queue full.
+            responses = await asyncio.gather(*[client.post("/query", json=body) for _ in range(3)])
+        await orchestrator.aclose()
+        return responses
+
+    responses = asyncio.run(run())
+
+    assert sorted(r.status_code for r in responses) == [200, 503, 504]
+    for response in responses:
+        if response.status_code == 200:
+            assert response.json()["model_used"] == "slm"
+        elif response.status_code == 503:
+            assert "queue is full" in response.json()["detail"]
+        else:
+            assert "deadline" in response.json()["detail"]
+    # Neither rejection spilled onto the LLM queue.
+    assert orchestrator.llm.scheduler.admitted == 0
@@ -0,0 +1,40 @@
+import random
+
+from balancer import Replica, ReplicaPool
+
+
+def build_pool(strategy: str, count: int = 4, **kwargs) -> ReplicaPool:
+    return ReplicaPool([Replica(f"http://replica-{i}") for i in range(count)], strategy=strategy, **kwargs)
+
+
+def test_p2c_compares_two_distinct_replicas():
+    random.seed(0)
+    pool = build_pool('p2c', count=2)
+    busy, idle = pool.replicas
+    busy.outstanding = 5
+    # With two replicas both are always drawn, so the idle one always wins.
+    assert all(pool.select() is idle for _ in range(200))
+
+
+def test_prefix_affinity_sticks_until_the_replica_is_over_its_bound():
+    pool = build_pool('prefix_affinity', load_factor=1.25)
+    prompt = "You are a helpful assistant. Answer the question below."
+    home = pool.select(key=prompt)
+    assert all(pool.select(key=prompt) is home for _ in range(10))
+
+    # Bound is ceil(1.25 * (in-flight + 1) / replicas), so a pile-up on one replica moves the prefix on.
+    home.outstanding = 3
+    pool.replicas[(pool.replicas.index(home) + 1) % 4].outstanding = 1
+    assert pool.select(key=prompt) is not home
+
+
+def test_failing_replica_is_ejected_and_skipped():
+    pool = build_pool('least_outstanding', count=2, eject_after=2, eject_seconds=30)
+    bad, good = pool.replicas
+    pool.record_failure(bad)
+    pool.record_failure(bad)
+    assert all(pool.select() is good for _ in range(20))
+    # Excluding the only healthy replica probes the ejected one rather than failing.
+    assert pool.select(exclude=[good]) is bad
+    pool.record_success(bad)
+    assert not bad.stats()["ejected"]
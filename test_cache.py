@@ -0,0 +1,55 @@
+from cache import DiskCache, MemoryCache, TieredCache, cache_key
+
+
+def disk_cache(tmp_path, **config) -> DiskCache:
+    return DiskCache({"path": str(tmp_path / "cache.db"), **config})
+
+
+def test_cache_key_ignores_whitespace_but_not_parameters():
+    params = {"max_tokens": 100}
+    assert cache_key("hello  world\n", "slm", "m", params) == cache_key("hello world", "slm", "m", params)
+    assert cache_key("hello world", "slm", "m", params) != cache_key("hello world", "slm", "m", {"max_tokens": 50})
+
+
+def test_disk_cache_round_trips_compressed_entries_and_tracks_totals(tmp_path):
+    cache = disk_cache(tmp_path, compress_min_bytes=64)
+    small = {"response": "hi"}
+    large = {"response": "x" * 1000}
+    cache.set("small", small)
+    cache.set("large", large)
+    cache.set("large", large)
+
+    assert cache.get("small")[0] == small
+    assert cache.get("large")[0] == large
+    assert cache.get("missing") is None
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    # The large entry is stored compressed, well under its JSON size.
+    assert stats["bytes"] < 1000
+    cache.close()
+
+
+def test_disk_cache_evicts_least_recently_read(tmp_path):
+    cache = disk_cache(tmp_path, max_entries=3, evict_every=1)
+    for key in ("a", "b", "c"):
+        cache.set(key, {"response": key})
+    cache.get("a")
+    cache.set("d", {"response": "d"})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["entries"] <= 3
+    cache.close()
+
+
+def test_tiered_cache_promotes_disk_hits_and_warms_memory(tmp_path):
+    disk = disk_cache(tmp_path)
+    disk.set("key", {"response": "cached"})
+    tiered = TieredCache(MemoryCache({}), disk)
+    assert tiered.memory.get("key") is None
+    assert tiered.get("key")[0] == {"response": "cached"}
+    assert tiered.memory.get("key")[0] == {"response": "cached"}
+
+    warmed = TieredCache(MemoryCache({}), disk, warm_entries=10)
+    assert warmed.warmed == 1
+    assert warmed.memory.get("key") is not None
+    disk.close()
@@ -0,0 +1,52 @@
+import time
+
+from circuit_breaker import CircuitBreaker
+
+
+def test_opens_on_failure_rate_and_recovers_through_a_probe():
+    breaker = CircuitBreaker({"window": 4, "min_requests": 4, "failure_rate": 0.5, "open_seconds": 0.05})
+    for failed in (False, True, False, True):
+        assert breaker.allow()
+        if failed:
+            breaker.record_failure()
+        else:
+            breaker.record_success(0.01)
+    assert breaker.stats()["state"] == "open"
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    # One probe at a time while half-open.
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success(0.01)
+    assert breaker.stats()["state"] == "closed"
+    assert breaker.stats()["rejected"] == 2
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker({"window": 2, "min_requests": 2, "open_seconds": 0.05})
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.stats()["state"] == "open"
+    assert breaker.stats()["times_opened"] == 2
+
+
+def test_slow_calls_open_the_breaker():
+    breaker = CircuitBreaker({"window": 3, "min_requests": 3, "slow_call_seconds": 1.0, "slow_call_rate": 0.6})
+    breaker.record_success(0.1)
+    breaker.record_success(2.0)
+    assert breaker.stats()["state"] == "closed"
+    breaker.record_success(2.0)
+    assert breaker.stats()["state"] == "open"
+
+
+def test_rejects_does_not_take_the_probe_slot():
+    breaker = CircuitBreaker({"window": 1, "min_requests": 1, "open_seconds": 0.05})
+    breaker.record_failure()
+    assert breaker.rejects()
+    time.sleep(0.06)
+    assert not breaker.rejects()
+    assert breaker.allow()
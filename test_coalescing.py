@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from coalescing import SingleFlight
+
+
+def test_concurrent_calls_share_one_flight():
+    flight = SingleFlight()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "answer"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", call) for _ in range(3)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert [shared for _, shared in results] == [False, True, True]
+    assert all(result == "answer" for result, _ in results)
+    assert flight.stats() == {"in_flight": 0, "flights": 1, "coalesced_hits": 2}
+
+
+def test_flight_is_cancelled_only_when_every_waiter_leaves():
+    flight = SingleFlight()
+    finished = []
+
+    async def call():
+        await asyncio.sleep(0.05)
+        finished.append(1)
+        return "answer"
+
+    async def run():
+        first = asyncio.ensure_future(flight.do("key", call))
+        second = asyncio.ensure_future(flight.do("key", call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        result = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return result
+
+    assert asyncio.run(run()) == ("answer", True)
+    assert finished == [1]
+
+
+def test_late_stream_subscriber_replays_earlier_events():
+    flight = SingleFlight()
+
+    async def tokens():
+        for token in ("a", "b", "c"):
+            yield token
+            await asyncio.sleep(0.01)
+
+    async def collect(stream):
+        return [event async for event in stream]
+
+    async def run():
+        first = flight.stream("key", tokens)
+        first_events = asyncio.ensure_future(collect(first))
+        await asyncio.sleep(0.015)
+        second = flight.stream("key", tokens)
+        return await first_events, await collect(second), second.shared
+
+    first_events, second_events, shared = asyncio.run(run())
+    assert first_events == second_events == ["a", "b", "c"]
+    assert shared
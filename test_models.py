@@ -0,0 +1,33 @@
+import asyncio
+import time
+
+import pytest
+
+from errors import ProviderUnavailableError
+from models import SLMProvider
+
+
+def test_open_circuit_fails_before_queueing():
+    provider = SLMProvider({
+        "provider": "fake",
+        "model": "fake-slm",
+        "latency": 0.5,
+        "scheduler": {"enabled": True, "max_in_flight": 1, "max_queue": 4},
+        "circuit_breaker": {"open_seconds": 30}
+    })
+
+    async def run():
+        busy = asyncio.ensure_future(provider.agenerate("hold the only slot"))
+        await asyncio.sleep(0.05)
+        provider.breaker._open()
+        started = time.monotonic()
+        with pytest.raises(ProviderUnavailableError, match="circuit open"):
+            await provider.agenerate("rejected", deadline=time.monotonic() + 5)
+        waited = time.monotonic() - started
+        busy.cancel()
+        await asyncio.gather(busy, return_exceptions=True)
+        return waited
+
+    assert asyncio.run(run()) < 0.1
+    assert provider.scheduler.admitted == 1
+    assert provider.breaker.stats()["rejected"] == 1
@@ -0,0 +1,85 @@
+import asyncio
+
+import yaml
+
+from orchestrator import HybridOrchestrator
+
+
+def build_orchestrator(tmp_path, models: dict) -> HybridOrchestrator:
+    config = {
+        "models": models,
+        "routing": {
+            "complexity_threshold": 0.6,
+            "max_slm_tokens": 500,
+            "fallback_enabled": True,
+            "cost_weight": 0.3,
+            "latency_weight": 0.3,
+            "quality_weight": 0.4,
+            "load_aware": False,
+            "decision_cache": {"enabled": False}
+        },
+        "cache": {"enabled": False},
+        "coalescing": {"enabled": False},
+        "latency_model": {"enabled": False},
+        "routing_log": {"enabled": True, "path": str(tmp_path / "outcomes.jsonl")}
+    }
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.safe_dump(config))
+    return HybridOrchestrator(str(path))
+
+
+def hedged_to_llm(tmp_path) -> HybridOrchestrator:
+    return build_orchestrator(tmp_path, {
+        "llm": {
+            "provider": "fake",
+            "model": "fake-llm",
+            "latency": 0.0,
+            "cost_per_token": 0.0,
+            "scheduler": {"enabled": True, "max_in_flight": 1}
+        },
+        "slm": {
+            "provider": "fake",
+            "model": "fake-slm",
+            "latency": 0.5,
+            "cost_per_token": 0.0,
+            "hedging": {"enabled": True, "target": "llm", "initial_delay": 0.05}
+        }
+    })
+
+
+def test_cross_provider_hedge_reports_the_tier_that_answered(tmp_path):
+    orchestrator = hedged_to_llm(tmp_path)
+    prompt = "Say hello to the whole team today please"
+
+    async def run():
+        result = await orchestrator.aprocess(prompt, priority="cost")
+        await orchestrator.aclose()
+        return result
+
+    result = asyncio.run(run())
+
+    assert result["decision"].model_type == "slm"
+    assert result["model_used"] == "llm"
+    assert "fake-llm" in result["response"]
+    # The backup went through the LLM's own scheduler and breaker.
+    assert orchestrator.llm.scheduler.admitted == 1
+    assert orchestrator.llm.breaker.stats()["state"] == "closed"
+    # The SLM never answered, so nothing was learned about it.
+    assert orchestrator.outcome_log.stats()["records"] == 0
+
+
+def test_cross_provider_hedge_labels_streams_too(tmp_path):
+    orchestrator = hedged_to_llm(tmp_path)
+
+    async def run():
+        events = [event async for event in orchestrator.astream_process("Say hello to the whole team", priority="cost")]
+        await orchestrator.aclose()
+        return events
+
+    events = asyncio.run(run())
+
+    done = events[-1]
+    assert done["type"] == "done"
+    assert done["model_used"] == "llm"
+    assert "fake-llm" in "".join(e["content"] for e in events if e["type"] == "token")
+    assert orchestrator.llm.scheduler.admitted == 1
@@ -0,0 +1,116 @@
+import time
+
+import pytest
+import yaml
+
+from config_service import load_config
+from router import ModelRouter
+
+
+def write_config(tmp_path, complexity_threshold: float = 0.6, models: dict = None, **routing) -> str:
+    config = {
+        "models": models or {
+            "llm": {"provider": "fake", "model": "fake-llm", "cost_per_token": 0.0},
+            "slm": {"provider": "fake", "model": "fake-slm", "cost_per_token": 0.0}
+        },
+        "routing": {
+            "complexity_threshold": complexity_threshold,
+            "max_slm_tokens": 500,
+            "fallback_enabled": True,
+            "cost_weight": 0.3,
+            "latency_weight": 0.3,
+            "quality_weight": 0.4,
+            **routing
+        }
+    }
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.safe_dump(config))
+    return str(path)
+
+
+def build_router(tmp_path, **kwargs) -> ModelRouter:
+    return ModelRouter(write_config(tmp_path, **kwargs))
+
+
+def test_decision_cache_keeps_whitespace_variants_apart(tmp_path):
+    router = build_router(tmp_path)
+    compact = "Explain how to design a cache? Compare two options?"
+    padded = compact.replace(" ", " " * 10)
+    # Extra characters push the padded prompt over the complexity threshold.
+    assert router.analyze_complexity(compact) < 0.6 < router.analyze_complexity(padded)
+
+    assert router.route(padded).model_type == "llm"
+    assert router.route(compact).model_type == "slm"
+    assert router.route(padded).model_type == "llm"
+    assert router.decision_cache.stats()["hits"] == 1
+
+
+def test_config_swap_replaces_the_whole_policy(tmp_path):
+    router = build_router(tmp_path)
+    prompt = "Explain how to design a cache? Compare two options?"
+    before = router.policy
+    assert router.route(prompt).model_type == "slm"
+
+    router.apply_config(load_config(write_config(tmp_path, complexity_threshold=0.3)))
+
+    # A decision still running on the old policy keeps every old setting.
+    assert before.complexity_threshold == 0.6
+    assert before.route(prompt).model_type == "slm"
+    assert router.policy.complexity_threshold == 0.3
+    assert router.route(prompt).model_type == "llm"
+    assert router.route(prompt).config_version == router.config_version != before.config_version
+
+
+def test_route_many_matches_route(tmp_path):
+    router = build_router(tmp_path, models={
+        "llm": {"provider": "fake", "model": "fake-llm", "cost_per_token": 0.00003},
+        "slm": {"provider": "fake", "model": "fake-slm", "cost_per_token": 0.000001},
+        "gemini": {"provider": "fake", "model": "fake-gemini", "cost_per_token": 0.000002}
+    }, large_input_threshold=400, gemini_preferred_threshold=200, decision_cache={"enabled": False})
+    prompts = [
+        "Hi there",
+        "What is 2+2?",
+        "Explain how to design a cache? Compare two options?",
+        "Analyze and compare the algorithm and architecture of these two database systems step by step?",
+        "Summarize this report. " * 60,
+        "Explain the trade-offs in detail. " * 200,
+        ""
+    ]
+    priorities = ["balanced", "speed", "cost"]
+
+    for priority in priorities:
+        batch = router.route_many(prompts, priority)
+        single = [router.route(prompt, priority) for prompt in prompts]
+        assert [d.model_type for d in batch] == [d.model_type for d in single]
+        for b, s in zip(batch, single):
+            assert (b.confidence, b.reason) == (s.confidence, s.reason)
+            assert b.estimated_cost == pytest.approx(s.estimated_cost)
+            assert b.estimated_latency == pytest.approx(s.estimated_latency)
+            assert b.config_version == s.config_version
+
+    mixed = [priorities[i % len(priorities)] for i in range(len(prompts))]
+    assert ([d.model_type for d in router.route_many(prompts, mixed)]
+            == [router.route(p, q).model_type for p, q in zip(prompts, mixed)])
+    # The batch covers every tier, so each branch of the vectorized tree was compared.
+    assert {d.model_type for d in router.route_many(prompts, mixed)} == {"llm", "slm", "gemini"}
+
+
+def test_decision_cache_expires_and_is_cleared_on_reload(tmp_path):
+    router = build_router(tmp_path, decision_cache={"ttl_seconds": 0.05})
+    prompt = "What is the capital of France?"
+    first = router.route(prompt)
+    assert router.route(prompt) is first
+    # A different priority is a different decision.
+    router.route(prompt, "speed")
+    assert router.decision_cache.stats()["hits"] == 1
+
+    time.sleep(0.1)
+    assert router.route(prompt) is not first
+
+    cache = router.decision_cache
+    router.apply_config(load_config(write_config(tmp_path, complexity_threshold=0.5,
+                                                 decision_cache={"ttl_seconds": 0.05})))
+    # Same cache settings: the cache is kept but emptied, since the old decisions used the old thresholds.
+    assert router.decision_cache is cache
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["invalidations"] == 1
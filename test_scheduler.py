@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+import pytest
+
+from errors import DeadlineExceededError, ProviderOverloadedError
+from scheduler import RequestScheduler
+
+
+def test_expired_deadline_is_dropped_before_the_model_is_called():
+    scheduler = RequestScheduler({"max_in_flight": 1})
+
+    async def run():
+        await scheduler.acquire()
+        with pytest.raises(DeadlineExceededError):
+            await scheduler.acquire(deadline=time.monotonic() - 1)
+        with pytest.raises(DeadlineExceededError):
+            await scheduler.acquire(deadline=time.monotonic() + 0.05)
+        scheduler.release()
+
+    asyncio.run(run())
+    stats = scheduler.stats()
+    assert stats["expired"] == 2
+    assert stats["queued"] == {"speed": 0, "balanced": 0, "cost": 0}
+    assert stats["in_flight"] == 0
+
+
+def test_full_queue_rejects():
+    scheduler = RequestScheduler({"max_in_flight": 1, "max_queue": 1})
+
+    async def run():
+        await scheduler.acquire()
+        waiting = asyncio.ensure_future(scheduler.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(ProviderOverloadedError):
+            await scheduler.acquire()
+        scheduler.release()
+        await waiting
+        scheduler.release()
+
+    asyncio.run(run())
+    assert scheduler.stats()["rejected"] == 1
+    assert scheduler.stats()["admitted"] == 2
+
+
+def test_lanes_are_served_by_weight_without_starving_cost():
+    scheduler = RequestScheduler({"max_in_flight": 1, "lane_weights": {"speed": 2, "balanced": 1, "cost": 1}})
+    order = []
+
+    async def request(lane: str):
+        async with scheduler.slot(lane):
+            order.append(lane)
+            await asyncio.sleep(0)
+
+    async def run():
+        await scheduler.acquire()
+        tasks = [asyncio.ensure_future(request(lane)) for lane in ["cost"] * 2 + ["speed"] * 4]
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order[0] == "speed"
+    assert order.index("cost") < 4
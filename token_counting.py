@@ -0,0 +1,158 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Type, Callable
+
+try:
+    from tokenizers import Tokenizer
+    TOKENIZERS_AVAILABLE = True
+except ImportError:
+    TOKENIZERS_AVAILABLE = False
+
+try:
+    import sentencepiece
+    SENTENCEPIECE_AVAILABLE = True
+except ImportError:
+    SENTENCEPIECE_AVAILABLE = False
+
+TOKENS_PER_WORD = 1.3
+
+TOKEN_COUNTERS: Dict[str, Type['TokenCounter']] = {}
+
+
+def register_token_counter(*names: str) -> Callable[[Type['TokenCounter']], Type['TokenCounter']]:
+    def decorator(cls: Type['TokenCounter']) -> Type['TokenCounter']:
+        for name in names:
+            TOKEN_COUNTERS[name] = cls
+        return cls
+    return decorator
+
+
+def heuristic_tokens(text: str) -> float:
+    return len(text.split()) * TOKENS_PER_WORD
+
+
+class TokenCounter:
+    """Counts tokens for one model. Tokenizer files are loaded on first use.
+
+    Texts longer than `approximate_above` characters are not tokenized in
+    full: `samples` evenly spaced slices of `sample_chars` characters are, and
+    their tokens-per-character rate is scaled to the whole text. If the
+    tokenizer cannot be loaded, counts fall back to the word heuristic.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.approximate_above = config.get('approximate_above', 100_000)
+        self.sample_chars = config.get('sample_chars', 4096)
+        self.samples = config.get('samples', 16)
+        self.load_error: Optional[str] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        pass
+
+    def encode_length(self, text: str) -> int:
+        raise NotImplementedError
+
+    def _ensure_loaded(self) -> bool:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        self.load()
+                    except Exception as e:
+                        self.load_error = str(e)
+                        print(f"Tokenizer {type(self).__name__} unavailable, using heuristic: {self.load_error}")
+                    self._loaded = True
+        return self.load_error is None
+
+    def count(self, text: str) -> float:
+        if not self._ensure_loaded():
+            return heuristic_tokens(text)
+        if len(text) <= self.approximate_above:
+            return float(self.encode_length(text))
+        stride = (len(text) - self.sample_chars) / max(1, self.samples - 1)
+        sampled_tokens = 0
+        sampled_chars = 0
+        for i in range(self.samples):
+            start = int(i * stride)
+            chunk = text[start:start + self.sample_chars]
+            sampled_tokens += self.encode_length(chunk)
+            sampled_chars += len(chunk)
+        return sampled_tokens / sampled_chars * len(text)
+
+
+@register_token_counter('heuristic')
+class HeuristicCounter(TokenCounter):
+    def count(self, text: str) -> float:
+        return heuristic_tokens(text)
+
+
+@register_token_counter('huggingface', 'bpe')
+class HuggingFaceCounter(TokenCounter):
+    """A `tokenizer.json` file (BPE, WordPiece or Unigram) read with the `tokenizers` package."""
+
+    def load(self):
+        if not TOKENIZERS_AVAILABLE:
+            raise Exception("tokenizers package not installed. Install with: pip install tokenizers")
+        self.tokenizer = Tokenizer.from_file(self.config['path'])
+
+    def encode_length(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+@register_token_counter('sentencepiece')
+class SentencePieceCounter(TokenCounter):
+    """A SentencePiece `.model` file."""
+
+    def load(self):
+        if not SENTENCEPIECE_AVAILABLE:
+            raise Exception("sentencepiece package not installed. Install with: pip install sentencepiece")
+        self.processor = sentencepiece.SentencePieceProcessor(model_file=self.config['path'])
+
+    def encode_length(self, text: str) -> int:
+        return len(self.processor.encode(text))
+
+
+class TokenCountCache:
+    """LRU of token counts keyed by tokenizer name and a hash of the text."""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[tuple, float]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def count(self, name: str, counter: TokenCounter, text: str) -> float:
+        key = (name, hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest())
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        tokens = counter.count(text)
+        with self.lock:
+            self.entries[key] = tokens
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return tokens
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+def build_token_counter(config: Optional[Dict[str, Any]]) -> Optional[TokenCounter]:
+    """Returns None for the word heuristic, which the router already computes from its word count."""
+    config = config or {}
+    kind = config.get('type', 'heuristic')
+    if kind not in TOKEN_COUNTERS:
+        raise Exception(f"Unsupported tokenizer: {kind}")
+    if kind == 'heuristic':
+        return None
+    return TOKEN_COUNTERS[kind](config)
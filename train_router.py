@@ -0,0 +1,33 @@
+import argparse
+import json
+import sys
+
+from learned_router import train_from_log
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the learned routing policy from a routing outcome log")
+    parser.add_argument("log", nargs="?", default="routing_outcomes.jsonl")
+    parser.add_argument("--output", default="routing_model.npz")
+    parser.add_argument("--max-latency", type=float, default=None,
+                        help="treat SLM answers slower than this many seconds as failures")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--epochs", type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        with open(args.log, 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        model = train_from_log(records, max_latency=args.max_latency, threshold=args.threshold, epochs=args.epochs)
+        model.save(args.output)
+    except Exception as e:
+        print(f"Error training routing model: {str(e)}")
+        sys.exit(1)
+
+    print(f"Read {len(records)} records, wrote {args.output}")
+    for name, value in model.metadata.items():
+        print(f"  {name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import copy
+from typing import Optional, Tuple, Callable
+
+import numpy as np
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def train_centroids(data: np.ndarray, k: int, iterations: int = 10) -> np.ndarray:
+    """Spherical k-means over a sample of at most 64 vectors per centroid."""
+    rng = np.random.default_rng(0)
+    sample = np.asarray(data[np.sort(rng.choice(len(data), size=min(len(data), k * 64), replace=False))])
+    centroids = sample[rng.choice(len(sample), size=k, replace=False)]
+    for _ in range(iterations):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(k):
+            members = sample[labels == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+
+class _Buffer:
+    """Vectors and their ids appended in memory, grown by doubling."""
+
+    def __init__(self, dimensions: int, id_dtype=np.int64):
+        self.vectors = np.empty((0, dimensions), dtype=np.float32)
+        self.ids = np.empty(0, dtype=id_dtype)
+        self.size = 0
+
+    def extend(self, vectors: np.ndarray, ids: np.ndarray):
+        needed = self.size + len(vectors)
+        if needed > len(self.vectors):
+            capacity = max(needed, 2 * len(self.vectors), 16)
+            grown = np.empty((capacity, self.vectors.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+            self.ids = np.resize(self.ids, capacity)
+        self.vectors[self.size:needed] = vectors
+        self.ids[self.size:needed] = ids
+        self.size = needed
+
+    def view(self) -> '_Buffer':
+        """The rows appended so far, sharing memory with this buffer. Rows below `size` never change, so a view
+        stays valid while the buffer keeps growing; it must not be extended itself."""
+        view = _Buffer.__new__(_Buffer)
+        view.vectors, view.ids, view.size = self.vectors, self.ids, self.size
+        return view
+
+
+class ClusteredIndex:
+    """Cosine kNN over unit vectors, each carrying an integer id, stored cluster by cluster.
+
+    The sorted arrays keep each cluster's vectors contiguous (`offsets[c]` to
+    `offsets[c + 1]`), so a query only reads the `nprobe` clusters whose
+    centroids are closest. Inserts go to per-cluster buffers in memory that are
+    searched alongside and merged by `retrain`. Up to `approximate_above`
+    vectors there are no centroids, the index is a single cluster and search is
+    exact. `retrain` takes time proportional to the whole index and never runs
+    on insert; callers run it on a `snapshot` outside the request path.
+    """
+
+    def __init__(self, dimensions: int, nlist: int = 1024, nprobe: int = 8, approximate_above: int = 20000,
+                 id_dtype=np.int64):
+        self.dimensions = dimensions
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.approximate_above = approximate_above
+        self.id_dtype = id_dtype
+        self.centroids: Optional[np.ndarray] = None
+        self.vectors = np.empty((0, dimensions), dtype=np.float32)
+        self.ids = np.empty(0, dtype=id_dtype)
+        self.offsets = np.zeros(2, dtype=np.int64)
+        self.buffers = [_Buffer(dimensions, id_dtype)]
+        self.trained_size = 0
+
+    @property
+    def clusters(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def pending(self) -> int:
+        return sum(buffer.size for buffer in self.buffers)
+
+    @property
+    def size(self) -> int:
+        return len(self.vectors) + self.pending
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        if self.centroids is None:
+            return np.zeros(len(vectors), dtype=np.int64)
+        return np.argmax(vectors @ self.centroids.T, axis=1)
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray):
+        vectors = _normalize(np.atleast_2d(vectors).astype(np.float32))
+        ids = np.asarray(ids, dtype=self.id_dtype).reshape(-1)
+        clusters = self._assign(vectors)
+        for c in np.unique(clusters).tolist():
+            mask = clusters == c
+            self.buffers[c].extend(vectors[mask], ids[mask])
+
+    def needs_training(self, growth: float) -> bool:
+        """True past `approximate_above` when the clusters are missing or the index has grown `growth` times since."""
+        if self.size <= self.approximate_above:
+            return False
+        return self.centroids is None or self.size >= growth * self.trained_size
+
+    def snapshot(self) -> 'ClusteredIndex':
+        """A copy-free view of the index as it is now; later inserts into this index do not show up in it."""
+        view = copy.copy(self)
+        view.buffers = [buffer.view() for buffer in self.buffers]
+        return view
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (cosine similarities, ids) of up to `k` nearest vectors, best first."""
+        query = _normalize(query.astype(np.float32))
+        if self.centroids is None:
+            probes = [0]
+        else:
+            nprobe = min(self.nprobe, self.clusters)
+            probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe].tolist()
+        scores, ids = [], []
+        for c in probes:
+            start, end = int(self.offsets[c]), int(self.offsets[c + 1])
+            if end > start:
+                scores.append(self.vectors[start:end] @ query)
+                ids.append(self.ids[start:end])
+            buffer = self.buffers[c]
+            if buffer.size:
+                scores.append(buffer.vectors[:buffer.size] @ query)
+                ids.append(buffer.ids[:buffer.size])
+        if not scores:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=self.id_dtype)
+        scores = np.concatenate(scores)
+        ids = np.concatenate(ids)
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            scores, ids = scores[top], ids[top]
+        order = np.argsort(-scores)
+        return scores[order], ids[order]
+
+    def _cluster(self, c: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = int(self.offsets[c]), int(self.offsets[c + 1])
+        buffer = self.buffers[c]
+        return (np.concatenate([self.vectors[start:end], buffer.vectors[:buffer.size]]),
+                np.concatenate([self.ids[start:end], buffer.ids[:buffer.size]]))
+
+    def retrain(self, keep: Optional[Callable[[np.ndarray], np.ndarray]] = None, train: bool = True,
+                chunk: int = 65536):
+        """Merges pending inserts into the cluster-sorted arrays. Holds the whole index in memory while it runs.
+
+        `keep` maps an array of ids to a mask of the rows to keep. Past
+        `approximate_above` the clusters are trained from scratch, or with
+        `train=False` the current ones are reused if there are any; at or
+        below it the index goes back to a single exact cluster.
+        """
+        parts = [self._cluster(c) for c in range(self.clusters)]
+        vectors = np.concatenate([v for v, _ in parts])
+        ids = np.concatenate([i for _, i in parts])
+        if keep is not None:
+            mask = keep(ids)
+            vectors, ids = vectors[mask], ids[mask]
+        if len(vectors) <= self.approximate_above:
+            self.centroids = None
+            self.trained_size = 0
+        elif train or self.centroids is None:
+            self.centroids = train_centroids(vectors, min(self.nlist, len(vectors)))
+            self.trained_size = len(vectors)
+        clusters = np.concatenate([self._assign(vectors[i:i + chunk]) for i in range(0, len(vectors), chunk)]
+                                  + [np.empty(0, dtype=np.int64)])
+        order = np.argsort(clusters, kind='stable')
+        self.vectors = vectors[order]
+        self.ids = ids[order]
+        count = len(self.centroids) if self.centroids is not None else 1
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(clusters, minlength=count))]).astype(np.int64)
+        self.buffers = [_Buffer(self.dimensions, self.id_dtype) for _ in range(self.clusters)]